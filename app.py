@@ -1,31 +1,72 @@
 import os
 import sys
 
+from functools import wraps
+
 from flask import (
     Flask,
-    jsonify,
     abort,
-    request
+    make_response,
+    request,
+    stream_with_context
 )
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import select
 from flask_cors import CORS
 
 from models import (
     setup_db,
+    start_generation_listener,
+    table_generations,
     db,
     Actor,
     Movie,
-    Role
+    Role,
+    row_mapper,
+    version_columns
 )
 from filters import (
     Actorfilter,
     Moviefilter,
-    Rolefilter
+    Rolefilter,
+    statement_cache
 )
 from auth import (
     requires_auth,
+    start_jwks_refresher,
+    jwks_store,
+    token_cache,
     AuthError
 )
+from conditional import (
+    conditional,
+    conditional_request,
+    not_modified_response,
+    read_validators,
+    set_validators
+)
+from compression import (
+    DEFAULT_BROTLI_QUALITY,
+    DEFAULT_GZIP_LEVEL,
+    DEFAULT_MIN_SIZE,
+    Compressor
+)
+from export import (
+    EXPORT_FORMATS,
+    prime,
+    stream_export
+)
+from json_provider import (
+    json_provider,
+    jsonify,
+    setup_json
+)
+from result_cache import (
+    DEFAULT_MAX_BYTES,
+    DEFAULT_MAX_SIZE,
+    ResultCache,
+    normalize_args
+)
 
 
 ACTOR_COLUMNS = [
@@ -42,9 +83,37 @@ ROLE_COLUMNS = [
     'gender', 'min_age', 'max_age', 'description'
 ]
 
+MAX_BATCH_SEARCHES = int(os.environ.get('MAX_BATCH_SEARCHES', '200'))
+
+RESULT_CACHE_ENABLED = (
+    os.environ.get('RESULT_CACHE_ENABLED', 'true') == 'true'
+)
+RESULT_CACHE_SIZE = int(os.environ.get('RESULT_CACHE_SIZE', DEFAULT_MAX_SIZE))
+RESULT_CACHE_MAX_BYTES = int(
+    os.environ.get('RESULT_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
+
+result_cache = ResultCache(max_size=RESULT_CACHE_SIZE,
+                           max_bytes=RESULT_CACHE_MAX_BYTES,
+                           enabled=RESULT_CACHE_ENABLED)
+
+compressor = Compressor(
+    min_size=int(os.environ.get('COMPRESSION_MIN_SIZE', DEFAULT_MIN_SIZE)),
+    gzip_level=int(os.environ.get('COMPRESSION_GZIP_LEVEL',
+                                  DEFAULT_GZIP_LEVEL)),
+    brotli_quality=int(os.environ.get('COMPRESSION_BROTLI_QUALITY',
+                                      DEFAULT_BROTLI_QUALITY)),
+    enabled=os.environ.get('COMPRESSION_ENABLED', 'true') == 'true')
+
 app = Flask(__name__)
 app.config.from_object(os.environ['APP_SETTINGS'])
 setup_db(app)
+setup_json(app)
+start_jwks_refresher()
+# Writes of other processes reach every consumer of table_generations
+# only through the listener.
+if (result_cache.enabled or Actorfilter.columnar_index is not None
+        or Actorfilter.bitmap_index is not None):
+    start_generation_listener(app)
 
 
 cors = CORS(app, origins=['http://localhost:5000',
@@ -57,6 +126,9 @@ def after_request(response):
     allow_methods = 'GET,POST,PATCH,DELETE,OPTIONS'
     response.headers.add('Access-Control-Allow-Headers', allow_headers)
     response.headers.add('Access-Control-Allow-Methods', allow_methods)
+    if compressor.compressible(response):
+        encoding = compressor.negotiate(request.accept_encodings)
+        compressor.encode_response(response, encoding)
     return response
 
 
@@ -65,23 +137,307 @@ def index():
     return "Healthy"
 
 
+@app.route('/ready')
+def ready():
+    jwks = jwks_store.status()
+    status_code = 200 if jwks['usable'] else 503
+    return jsonify({
+        'success': jwks['usable'],
+        'jwks': jwks,
+    }), status_code
+
+
+@app.route('/stats')
+def stats():
+    return jsonify({
+        'success': True,
+        'query_cache': statement_cache.stats(),
+        'token_cache': token_cache.stats(),
+        'result_cache': result_cache.stats(),
+        'actor_index': (
+            Actorfilter.columnar_index.stats()
+            if Actorfilter.columnar_index is not None else None
+        ),
+        'actor_bitmaps': (
+            Actorfilter.bitmap_index.stats()
+            if Actorfilter.bitmap_index is not None else None
+        ),
+    })
+
+
+def select_roles(criterion, keys):
+    '''
+    Returns dictionaries of keys of the roles matching criterion,
+    ex) format_without_actor_id(), read as plain rows by id.
+    '''
+    columns = [getattr(Role, key) for key in keys]
+    rows = db.session.execute(
+        select(columns).where(criterion).order_by(Role.id))
+    map_row = row_mapper(Role, keys)
+    return [map_row(row) for row in rows]
+
+
+def export_results(model_filter, name):
+    '''
+    Returns a response streaming every result of model_filter
+    as ndjson (default) or csv by the format query parameter.
+    '''
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        abort(422)
+    try:
+        chunks = prime(stream_export(model_filter, export_format,
+                                     db.engine))
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': 422,
+            'message': str(e),
+        }), 422
+    except Exception:
+        abort(422)
+    response = app.response_class(stream_with_context(chunks),
+                                  mimetype=EXPORT_FORMATS[export_format])
+    response.headers['Content-Disposition'] = (
+        f'attachment; filename={name}.{export_format}')
+    return response
+
+
+def filter_version(filter_class):
+    '''
+    Returns the version function of cached_list() of a list endpoint
+    of filter_class, the version of every result of the request.
+    '''
+    return lambda: filter_class(
+        request.args.to_dict(flat=False)).get_version()
+
+
+def roles_version(criterion):
+    return db.session.query(*version_columns(Role)).filter(criterion).one()
+
+
+def cached_list(*tables, version=None):
+    '''
+    Caches successful responses of a list endpoint by request.args
+    until one of tables is written. The body compressed for
+    the request is cached with it, so a hit is not compressed again.
+    Args:
+        tables: names of the tables the endpoint reads
+        version: function returning the row of version_columns() of
+                 the results of the request, see conditional()
+    With version, requests with If-None-Match or If-Modified-Since
+    read a weak ETag and Last-Modified once per entry, which are cached
+    with it, so later hits and the 304s answered from them run no
+    query. Other requests never run the aggregate, and their responses
+    only have the validators an earlier conditional request cached.
+    '''
+    def cached_list_decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if not result_cache.enabled:
+                if version is None or not conditional_request():
+                    return f(*args, **kwargs)
+                return conditional(version)(f)(*args, **kwargs)
+            key = (request.path, normalize_args(request.args))
+            # Read before the query, so a concurrent write
+            # makes the stored entry stale.
+            generation = table_generations.get(tables)
+            body = result_cache.get(key, generation)
+            validators = (None if body is None
+                          else result_cache.get_validators(key, generation))
+            if (validators is None and version is not None
+                    and conditional_request()):
+                validators = read_validators(version, *args, **kwargs)
+                if body is not None and validators is not None:
+                    if table_generations.get(tables) == generation:
+                        result_cache.put_validators(key, generation,
+                                                    validators)
+                    else:
+                        # The aggregate saw a write the body did not.
+                        validators = None
+            response = not_modified_response(validators)
+            if response is not None:
+                return response
+            if body is not None:
+                response = app.response_class(body,
+                                              mimetype='application/json')
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                body = response.get_data()
+                result_cache.put(key, generation, body, validators)
+            if validators is not None:
+                set_validators(response, validators)
+            encoding = compressor.negotiate(request.accept_encodings)
+            if (not compressor.compressible(response) or encoding is None
+                    or len(body) < compressor.min_size):
+                return response
+            encoded = result_cache.get_encoded(key, generation, encoding)
+            if encoded is None:
+                encoded = compressor.compress(body, encoding)
+                result_cache.put_encoded(key, generation, encoding, encoded)
+            return compressor.encode_response(response, encoding, encoded)
+        return wrapper
+    return cached_list_decorator
+
+
+ITEMS_PLACEHOLDER = '\0items'
+
+
+def list_page(model_filter, name):
+    '''
+    Returns the values of a list response of model_filter
+    but its results, and the results.
+    Args:
+        model_filter: Basefilter of the request
+        name: key of the results, ex) actors
+    '''
+    total_count, page, results = model_filter.get_results()
+    return {
+        'success': True,
+        'page': page,
+        f'total_{name}': total_count,
+        'next_cursor': model_filter.next_cursor,
+        'count_strategy': model_filter.count_strategy,
+    }, results
+
+
+def json_document(values, name, items_json):
+    '''
+    Returns the body of jsonify() of values and name: items,
+    given the JSON text of items.
+    '''
+    provider = json_provider()
+    # The other values never contain ITEMS_PLACEHOLDER.
+    body = provider.dumps(dict(values, **{name: ITEMS_PLACEHOLDER}))
+    return body.replace(provider.dumps(ITEMS_PLACEHOLDER),
+                        items_json.encode(), 1) + b'\n'
+
+
+def list_response(model_filter, name):
+    '''
+    Returns the response of a list endpoint of model_filter.
+    With JSON_IN_POSTGRES, postgres writes the JSON of the results,
+    which is copied into the response without Python objects.
+    '''
+    model_filter.as_json = app.config.get('JSON_IN_POSTGRES', False)
+    values, results = list_page(model_filter, name)
+    if model_filter.as_json:
+        body = json_document(values, name,
+                             model_filter.results_json(results))
+        return app.response_class(body, mimetype='application/json')
+    values[name] = model_filter.format_results(results)
+    return jsonify(values)
+
+
+def search_actors(data):
+    '''
+    Returns a page of actors filtered by data, the query parameters
+    of GET /actors as dictionary({key: [values]}).
+    '''
+    actor_filter = Actorfilter(data)
+    values, actors = list_page(actor_filter, 'actors')
+    values['actors'] = actor_filter.format_results(actors)
+    return values
+
+
+def query_parameters(search):
+    '''
+    Returns dictionary({key: [values]}) like request.args of
+    a JSON object of query parameters.
+    A value may be a list, and booleans are 'true' or 'false'.
+    ex) {'gender': 'male', 'passport': true, 'ethnicity': ['asian']}
+        -> {'gender': ['male'], 'passport': ['true'],
+            'ethnicity': ['asian']}
+    '''
+    if not isinstance(search, dict):
+        raise ValueError('A search must be an object')
+    data = {}
+    for key, values in search.items():
+        if not isinstance(values, list):
+            values = [values]
+        data[key] = [
+            str(value).lower() if isinstance(value, bool) else str(value)
+            for value in values if value is not None
+        ]
+    return data
+
+
 @app.route('/actors', methods=['GET'])
+@cached_list('actors', version=filter_version(Actorfilter))
 def get_actors():
     try:
         actor_filter = Actorfilter(request.args.to_dict(flat=False))
-        total_actors_count, page, actors = actor_filter.get_results()
-        actors = [actor.format() for actor in actors]
+        return list_response(actor_filter, 'actors')
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': 422,
+            'message': str(e),
+        }), 422
+    except Exception:
+        abort(422)
+
+
+@app.route('/actors/search/batch', methods=['POST'])
+@requires_auth('get:actors')
+def search_actors_in_batch(payload):
+    body = request.get_json(silent=True)
+    searches = body.get('searches') if isinstance(body, dict) else None
+    if not isinstance(searches, list) or not searches:
+        abort(400)
+    if len(searches) > MAX_BATCH_SEARCHES:
+        abort(422)
+    # Every search runs on the connection of this request.
+    results = []
+    for search in searches:
+        try:
+            results.append(search_actors(query_parameters(search)))
+        except ValueError as e:
+            results.append({'success': False, 'error': 422,
+                            'message': str(e)})
+        except Exception:
+            # A failed query aborts the transaction of the next ones.
+            db.session.rollback()
+            results.append({'success': False, 'error': 422,
+                            'message': 'unprocessable'})
+    return jsonify({
+        'success': True,
+        'results': results,
+    })
+
+
+@app.route('/actors/facets', methods=['GET'])
+@cached_list('actors', version=filter_version(Actorfilter))
+def get_actor_facets():
+    try:
+        actor_filter = Actorfilter(request.args.to_dict(flat=False))
+        total_actors_count, facets = actor_filter.get_facet_counts()
         return jsonify({
             'success': True,
-            'actors': actors,
-            'page': page,
             'total_actors': total_actors_count,
+            'facets': facets,
         })
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': 422,
+            'message': str(e),
+        }), 422
     except Exception:
         abort(422)
 
 
+@app.route('/actors/export', methods=['GET'])
+@requires_auth('get:actors')
+def export_actors(payload):
+    actor_filter = Actorfilter(request.args.to_dict(flat=False))
+    return export_results(actor_filter, 'actors')
+
+
 @app.route('/actors/<int:actor_id>/roles', methods=['GET'])
+@conditional(lambda actor_id: roles_version(Role.actor_id == actor_id))
 def get_roles_of_actor(actor_id):
     try:
         actor = Actor.query.filter(Actor.id == actor_id).one_or_none()
@@ -94,7 +450,8 @@ def get_roles_of_actor(actor_id):
             'message': str(e)
         }), 422
     try:
-        roles = [role.format_without_actor_id() for role in actor.roles]
+        roles = select_roles(Role.actor_id == actor_id,
+                             Role.format_keys_without_actor_id)
         return jsonify({
             'success': True,
             'actor_id': actor_id,
@@ -177,22 +534,30 @@ def delete_actor(payload, actor_id):
 
 
 @app.route('/movies', methods=['GET'])
+@cached_list('movies', version=filter_version(Moviefilter))
 def get_movies():
     try:
         movie_filter = Moviefilter(request.args.to_dict(flat=False))
-        total_movies_count, page, movies = movie_filter.get_results()
-        movies = [movie.format() for movie in movies]
+        return list_response(movie_filter, 'movies')
+    except ValueError as e:
         return jsonify({
-            'success': True,
-            'movies': movies,
-            'page': page,
-            'total_movies': total_movies_count,
-        })
+            'success': False,
+            'error': 422,
+            'message': str(e),
+        }), 422
     except Exception:
         abort(422)
 
 
+@app.route('/movies/export', methods=['GET'])
+@requires_auth('get:movies')
+def export_movies(payload):
+    movie_filter = Moviefilter(request.args.to_dict(flat=False))
+    return export_results(movie_filter, 'movies')
+
+
 @app.route('/movies/<int:movie_id>/roles', methods=['GET'])
+@conditional(lambda movie_id: roles_version(Role.movie_id == movie_id))
 def get_roles_of_movie(movie_id):
     try:
         movie = Movie.query.filter(Movie.id == movie_id).one_or_none()
@@ -205,7 +570,8 @@ def get_roles_of_movie(movie_id):
             'message': str(e)
         }), 422
     try:
-        roles = [role.format_without_movie_id() for role in movie.roles]
+        roles = select_roles(Role.movie_id == movie_id,
+                             Role.format_keys_without_movie_id)
         return jsonify({
             'success': True,
             'movie_id': movie_id,
@@ -288,22 +654,31 @@ def delete_movie(payload, movie_id):
         abort(422)
 
 
+# Deleting a movie or an actor deletes or updates its roles.
 @app.route('/roles')
+@cached_list('roles', 'movies', 'actors',
+             version=filter_version(Rolefilter))
 def get_roles():
     try:
         role_filter = Rolefilter(request.args.to_dict(flat=False))
-        total_roles_count, page, roles = role_filter.get_results()
-        roles = [role.format() for role in roles]
+        return list_response(role_filter, 'roles')
+    except ValueError as e:
         return jsonify({
-            'success': True,
-            'roles': roles,
-            'page': page,
-            'total_roles': total_roles_count,
-        })
+            'success': False,
+            'error': 422,
+            'message': str(e),
+        }), 422
     except Exception:
         abort(422)
 
 
+@app.route('/roles/export', methods=['GET'])
+@requires_auth('get:roles')
+def export_roles(payload):
+    role_filter = Rolefilter(request.args.to_dict(flat=False))
+    return export_results(role_filter, 'roles')
+
+
 @app.route('/roles', methods=['POST'])
 @requires_auth('post:roles')
 def post_role(payload):
@@ -1,4 +1,3 @@
-import json
 import os
 
 from flask import (
@@ -8,12 +7,45 @@ from flask import (
 )
 from functools import wraps
 from jose import jwt
-from urllib.request import urlopen
+
+from jwks import (
+    JWKSError,
+    JWKSRefresher,
+    JWKSStore,
+    DEFAULT_MAX_STALE,
+    DEFAULT_TTL
+)
+from permissions import (
+    PERMISSION_BITS,
+    compile_permissions,
+    permission_bit
+)
+from token_cache import (
+    TokenCache,
+    DEFAULT_MAX_SIZE
+)
 
 
 AUTH0_DOMAIN = os.environ['AUTH0_DOMAIN']
 ALGORITHMS = os.environ['ALGORITHMS']
+ALLOWED_ALGORITHMS = frozenset(
+    algorithm.strip() for algorithm in ALGORITHMS.split(',')
+    if algorithm.strip()
+)
 API_AUDIENCE = os.environ['API_AUDIENCE']
+JWKS_URL = os.environ.get(
+    'JWKS_URL', f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
+JWKS_TTL = int(os.environ.get('JWKS_TTL', DEFAULT_TTL))
+JWKS_MAX_STALE = int(os.environ.get('JWKS_MAX_STALE', DEFAULT_MAX_STALE))
+JWKS_REFRESH_ENABLED = \
+    os.environ.get('JWKS_REFRESH_ENABLED', 'true') == 'true'
+
+TOKEN_CACHE_ENABLED = os.environ.get('TOKEN_CACHE_ENABLED', 'true') == 'true'
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', DEFAULT_MAX_SIZE))
+
+jwks_store = JWKSStore(JWKS_URL, ttl=JWKS_TTL, max_stale=JWKS_MAX_STALE)
+jwks_refresher = None
+token_cache = TokenCache(TOKEN_CACHE_SIZE, enabled=TOKEN_CACHE_ENABLED)
 
 
 class AuthError(Exception):
@@ -22,6 +54,18 @@ class AuthError(Exception):
         self.status_code = status_code
 
 
+def start_jwks_refresher():
+    '''
+    Starts the background JWKS refresher once per process.
+    Does nothing if JWKS_REFRESH_ENABLED is not 'true'.
+    '''
+    global jwks_refresher
+    if JWKS_REFRESH_ENABLED and jwks_refresher is None:
+        jwks_refresher = JWKSRefresher(jwks_store)
+        jwks_refresher.start()
+    return jwks_refresher
+
+
 def get_token_auth_header():
     auth = request.headers.get('Authorization', None)
     if not auth:
@@ -53,14 +97,23 @@ def get_token_auth_header():
     return token
 
 
-def check_permissions(permission, payload):
+def check_permissions(permission, payload, permission_mask=None):
+    '''
+    Args:
+        permission: permission string
+        payload: decoded JWT payload
+        permission_mask: payload['permissions'] compiled by
+                         compile_permissions. Compiled here if omitted.
+    '''
     if 'permissions' not in payload:
         raise AuthError({
             'code': 'invalid_claims',
             'description': 'Permissions not included in JWT.'
         }, 400)
 
-    if permission not in payload['permissions']:
+    if permission_mask is None:
+        permission_mask = compile_permissions(payload['permissions'])
+    if not permission_mask & PERMISSION_BITS.get(permission, 0):
         raise AuthError({
             'code': 'unauthorized',
             'description': 'Permission not found.'
@@ -70,31 +123,40 @@ def check_permissions(permission, payload):
 
 
 def verify_decode_jwt(token):
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
-    unverified_header = jwt.get_unverified_header(token)
-    rsa_key = {}
+    try:
+        unverified_header = jwt.get_unverified_header(token)
+    except jwt.JWTError:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Unable to parse authentication token.'
+        }, 400)
     if 'kid' not in unverified_header:
         raise AuthError({
             'code': 'invalid_header',
             'description': 'Authorization malformed.'
         }, 401)
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
-    if rsa_key:
+    if unverified_header.get('alg') not in ALLOWED_ALGORITHMS:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Token algorithm is not allowed.'
+        }, 401)
+
+    try:
+        public_key = jwks_store.get_public_key(unverified_header['kid'])
+    except JWKSError:
+        raise AuthError({
+            'code': 'jwks_unavailable',
+            'description': 'Unable to fetch the signing keys.'
+        }, 503)
+    if public_key is not None:
         try:
+            # A sequence of key objects is used by python-jose as is,
+            # so the jwk is not parsed again on each decode.
             payload = jwt.decode(
                 token,
-                rsa_key,
-                algorithms=ALGORITHMS,
+                (public_key,),
+                algorithms=ALLOWED_ALGORITHMS,
                 audience=API_AUDIENCE,
                 issuer='https://' + AUTH0_DOMAIN + '/'
             )
@@ -123,17 +185,36 @@ def verify_decode_jwt(token):
             }, 400)
 
 
-def requires_auth(permission=''):
+def get_verified_payload(token):
+    '''
+    Returns the payload and the compiled permission mask of token
+    from token_cache if the token was verified before and is not
+    expired yet. Otherwise verifies the token and caches both.
+    '''
+    entry = token_cache.get(token)
+    if entry is None:
+        payload = verify_decode_jwt(token)
+        permissions = payload.get('permissions') or []
+        permission_mask = compile_permissions(permissions)
+        token_cache.put(token, payload, permission_mask)
+        return payload, permission_mask
+    return entry
+
+
+def requires_auth(permission):
+    # Unknown permissions fail when the route is declared.
+    permission_bit(permission)
+
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
             token = get_token_auth_header()
             try:
-                payload = verify_decode_jwt(token)
+                payload, permission_mask = get_verified_payload(token)
             except AuthError as e:
                 raise e
 
-            check_permissions(permission, payload)
+            check_permissions(permission, payload, permission_mask)
             return f(payload, *args, **kwargs)
         return wrapper
     return requires_auth_decorator
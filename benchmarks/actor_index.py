@@ -0,0 +1,81 @@
+'''
+Benchmark of Actorfilter with and without the NumPy columnar index.
+
+Synthetic actors are inserted in a transaction which is rolled back,
+so the benchmark can run against the development database.
+The index reads them through the same session.
+
+Usage:
+    source setup.sh
+    pip install numpy
+    python benchmarks/actor_index.py [rows]
+'''
+import os
+import sys
+import timeit
+
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app  # noqa: E402
+from columnar_index import ColumnarIndex  # noqa: E402
+from filters import (  # noqa: E402
+    Actorfilter,
+    ACTOR_INDEX_COLUMNS
+)
+from models import (  # noqa: E402
+    db,
+    Actor
+)
+
+INSERT_ACTORS = text("""
+    INSERT INTO actors (name, age, gender, location, height, passport,
+                        ethnicity, hair_color)
+    SELECT 'Actor ' || i, 10 + i % 70,
+           CAST((ARRAY['male', 'female'])[1 + i % 2] AS gender),
+           'LA', 150 + i % 50, i % 3 = 0,
+           CAST((ARRAY['asian', 'black', 'white'])[1 + i % 3]
+                AS ethnicity),
+           CAST((ARRAY['black', 'brown', 'red'])[1 + i % 5 % 3]
+                AS hair_color)
+    FROM generate_series(1, :rows) AS i
+""")
+
+REQUESTS = [
+    {'gender': ['female'], 'min_age': ['20'], 'max_age': ['30']},
+    {'passport': ['t'], 'min_height': ['190']},
+    {'ethnicity': ['asian', 'black'], 'hair_color': ['red'],
+     'page': ['50']},
+]
+
+
+def run_requests():
+    for data in REQUESTS:
+        Actorfilter(dict(data)).get_results()
+
+
+def main(rows):
+    with app.app_context():
+        try:
+            db.session.execute(INSERT_ACTORS, {'rows': rows})
+            db.session.execute(text('ANALYZE actors'))
+            index = ColumnarIndex(
+                Actor.__table__, ACTOR_INDEX_COLUMNS,
+                lambda statement: db.session.execute(statement).fetchall())
+            load_seconds = timeit.timeit(index.refresh, number=1)
+            print(f'snapshot of {rows} rows: {load_seconds * 1000:.0f} ms, '
+                  f"{index.stats()['bytes'] / 1e6:.1f} MB")
+            for label, columnar_index in (('sql', None), ('index', index)):
+                Actorfilter.columnar_index = columnar_index
+                run_requests()
+                seconds = timeit.timeit(run_requests, number=20)
+                milliseconds = seconds * 1000 / (20 * len(REQUESTS))
+                print(f'{label:>6}: {milliseconds:7.2f} ms per request')
+        finally:
+            Actorfilter.columnar_index = None
+            db.session.rollback()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,96 @@
+'''
+Microbenchmark of per-request JWT decode cost.
+
+before: loop over every JWKS entry, rebuild the rsa_key dict and
+        let python-jose parse it on each decode
+after: O(1) lookup of the RSA public key object built once per kid
+
+Usage:
+    python benchmarks/auth_decode.py [iterations]
+'''
+import base64
+import os
+import sys
+import timeit
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwt
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jwks import build_public_key  # noqa: E402
+
+ALGORITHMS = 'RS256'
+ALLOWED_ALGORITHMS = frozenset([ALGORITHMS])
+AUDIENCE = 'casting'
+ISSUER = 'https://bench.local/'
+KEY_COUNT = 3
+
+
+def int_to_base64url(value):
+    length = (value.bit_length() + 7) // 8
+    data = value.to_bytes(length, 'big')
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def make_key(kid):
+    private_key = rsa.generate_private_key(65537, 2048, default_backend())
+    numbers = private_key.public_key().public_numbers()
+    jwk = {
+        'kty': 'RSA',
+        'kid': kid,
+        'use': 'sig',
+        'n': int_to_base64url(numbers.n),
+        'e': int_to_base64url(numbers.e),
+    }
+    pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption())
+    return jwk, pem
+
+
+def main(iterations):
+    keys = [make_key(f'kid-{index}') for index in range(KEY_COUNT)]
+    jwks = {'keys': [jwk for jwk, pem in keys]}
+    kid = keys[-1][0]['kid']
+    token = jwt.encode(
+        {'aud': AUDIENCE, 'iss': ISSUER, 'permissions': ['post:actors']},
+        keys[-1][1], algorithm=ALGORITHMS, headers={'kid': kid})
+
+    registry = {jwk['kid']: build_public_key(jwk) for jwk in jwks['keys']}
+
+    def before():
+        header = jwt.get_unverified_header(token)
+        rsa_key = {}
+        for key in jwks['keys']:
+            if key['kid'] == header['kid']:
+                rsa_key = {
+                    'kty': key['kty'],
+                    'kid': key['kid'],
+                    'use': key['use'],
+                    'n': key['n'],
+                    'e': key['e']
+                }
+        return jwt.decode(token, rsa_key, algorithms=ALGORITHMS,
+                          audience=AUDIENCE, issuer=ISSUER)
+
+    def after():
+        header = jwt.get_unverified_header(token)
+        if header.get('alg') not in ALLOWED_ALGORITHMS:
+            raise ValueError('algorithm not allowed')
+        public_key = registry[header['kid']]
+        return jwt.decode(token, (public_key,),
+                          algorithms=ALLOWED_ALGORITHMS,
+                          audience=AUDIENCE, issuer=ISSUER)
+
+    assert before() == after()
+    for name, fn in (('before', before), ('after', after)):
+        seconds = min(timeit.repeat(fn, number=iterations, repeat=5))
+        print(f'{name:>6}: {seconds / iterations * 1e6:8.1f} us/decode')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,168 @@
+'''
+Before/after EXPLAIN ANALYZE report of the filter combinations used by
+the test suites, of sort orders and of filter operators, for the
+indexes of migrations 5e8d2c6a1f07, b3d71e0c5a92, e6a24f8d1c57 and
+d7b39e5f0a48.
+
+Synthetic rows are inserted and the indexes are dropped for the
+"before" plans inside one transaction which is rolled back.
+DROP INDEX locks the tables until then, so do not run this
+against a database serving traffic.
+
+Usage:
+    source setup.sh
+    python benchmarks/explain_filters.py [actors] \
+        > benchmarks/explain_filters.md
+'''
+import os
+import sys
+
+from sqlalchemy import (
+    func,
+    text
+)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app  # noqa: E402
+from filters import (  # noqa: E402
+    Actorfilter,
+    Explain,
+    Moviefilter,
+    Rolefilter,
+    PAGE_SIZE
+)
+from models import (  # noqa: E402
+    db,
+    Role
+)
+
+INDEXES = [
+    'ix_roles_movie_id',
+    'ix_roles_actor_id',
+    'ix_roles_min_age_id',
+    'ix_roles_max_age_id',
+    'ix_roles_gender_min_age',
+    'ix_actors_name_id',
+    'ix_actors_name_pattern',
+    'ix_actors_age_id',
+    'ix_actors_height_id',
+    'ix_actors_height_desc_id',
+    'ix_actors_gender_age',
+    'ix_actors_gender_height',
+    'ix_movies_title_id',
+    'ix_movies_title_pattern',
+    'ix_movies_release_date_id',
+]
+
+INSERT_ROWS = [
+    text("""
+        INSERT INTO actors (name, age, gender, location, height, passport)
+        SELECT 'Actor ' || i, 10 + i % 70,
+               CAST((ARRAY['male', 'female'])[1 + i % 2] AS gender),
+               'LA', 150 + i % 50, i % 3 = 0
+        FROM generate_series(1, :actors) AS i
+    """),
+    text("""
+        INSERT INTO movies (title, release_date, company)
+        SELECT 'Movie ' || i, DATE '2000-01-01' + i % 9000, 'Company'
+        FROM generate_series(1, :actors / 10) AS i
+    """),
+    text("""
+        INSERT INTO roles (movie_id, actor_id, name, gender, min_age, max_age)
+        SELECT m.id, a.id, 'Role', a.gender, a.age % 60, a.age % 60 + 10
+        FROM actors AS a
+        JOIN movies AS m ON m.id = 1 + a.id % (:actors / 10)
+    """),
+]
+
+COMBINATIONS = [
+    ('/actors?gender=male', Actorfilter, {'gender': ['male']}),
+    ('/actors?passport=t', Actorfilter, {'passport': ['t']}),
+    ('/actors?gender=female&min_age=20&max_age=30', Actorfilter,
+     {'gender': ['female'], 'min_age': ['20'], 'max_age': ['30']}),
+    ('/actors?min_height=195', Actorfilter, {'min_height': ['195']}),
+    ('/movies?min_release_date=2022-01-01', Moviefilter,
+     {'min_release_date': ['2022-01-01']}),
+    ('/roles?min_age=55', Rolefilter, {'min_age': ['55']}),
+    ('/roles?gender=male&min_age=55', Rolefilter,
+     {'gender': ['male'], 'min_age': ['55']}),
+    ('/actors?sort=-age', Actorfilter, {'sort': ['-age']}),
+    ('/actors?sort=name', Actorfilter, {'sort': ['name']}),
+    ('/actors?sort=-height', Actorfilter, {'sort': ['-height']}),
+    ('/movies?sort=-release_date', Moviefilter,
+     {'sort': ['-release_date']}),
+    ('/actors?name__prefix=Actor 1999', Actorfilter,
+     {'name__prefix': ['Actor 1999']}),
+    ('/actors?age__between=20,21&gender__ne=male', Actorfilter,
+     {'age__between': ['20,21'], 'gender__ne': ['male']}),
+]
+
+
+def explain(query):
+    plan = db.session.execute(Explain(query.statement, analyze=True))
+    plan = plan.scalar()[0]
+    return plan['Execution Time'], describe(plan['Plan'])
+
+
+def describe(node):
+    '''Returns the scan nodes of plan, ex) Index Scan on ix_actors_age_id'''
+    scans = []
+    if 'Scan' in node['Node Type']:
+        target = node.get('Index Name') or node.get('Relation Name')
+        scans.append(f"{node['Node Type']} on {target}")
+    for child in node.get('Plans', []):
+        scans.extend(describe(child))
+    return scans
+
+
+def queries(sample_id):
+    for label, filter_class, data in COMBINATIONS:
+        model_filter = filter_class(data)
+        model_filter.apply_filters()
+        model_filter.sort()
+        query = model_filter.query.order_by(*model_filter.order_clauses())
+        yield f'{label} page', query.limit(PAGE_SIZE)
+        count = db.session.query(func.count()).select_from(
+            model_filter.query.subquery())
+        yield f'{label} count', count
+    yield ('/actors/<id>/roles',
+           Role.query.filter(Role.actor_id == sample_id))
+    yield ('/movies/<id>/roles',
+           Role.query.filter(Role.movie_id == sample_id))
+
+
+def run(sample_id):
+    return {label: explain(query) for label, query in queries(sample_id)}
+
+
+def main(actors):
+    with app.app_context():
+        try:
+            for statement in INSERT_ROWS:
+                db.session.execute(statement, {'actors': actors})
+            db.session.execute(text('ANALYZE'))
+            sample_id = db.session.execute(
+                text('SELECT max(id) / 2 FROM actors')).scalar()
+
+            # The first run warms the buffer cache.
+            run(sample_id)
+            after = run(sample_id)
+            for index in INDEXES:
+                db.session.execute(text(f'DROP INDEX {index}'))
+            before = run(sample_id)
+        finally:
+            db.session.rollback()
+
+    print(f'# EXPLAIN ANALYZE report ({actors} synthetic actors)\n')
+    print('|Request|Before (ms)|Before plan|After (ms)|After plan|')
+    print('|-|-|-|-|-|')
+    for label in after:
+        before_ms, before_plan = before[label]
+        after_ms, after_plan = after[label]
+        print(f"|`{label}`|{before_ms:.2f}|{', '.join(before_plan)}"
+              f"|{after_ms:.2f}|{', '.join(after_plan)}|")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,54 @@
+'''
+Benchmark of list requests with and without the baked query cache.
+Without the cache every request builds and compiles its query,
+like before filters were baked.
+
+Usage:
+    source setup.sh
+    python benchmarks/filter_queries.py [requests]
+'''
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app  # noqa: E402
+from filters import (  # noqa: E402
+    Actorfilter,
+    Moviefilter,
+    Rolefilter,
+    statement_cache
+)
+from models import db  # noqa: E402
+
+REQUESTS = [
+    (Actorfilter, {'gender': ['female'], 'min_age': ['20'],
+                   'max_age': ['30']}),
+    (Actorfilter, {'search_term': ['inma'], 'min_height': ['150']}),
+    (Moviefilter, {'min_release_date': ['2022-01-01']}),
+    (Rolefilter, {'gender': ['male'], 'min_age': ['25']}),
+]
+
+
+def run_requests():
+    for filter_class, data in REQUESTS:
+        filter_class(data).get_results()
+
+
+def main(requests):
+    with app.app_context():
+        session = db.session()
+        number = max(requests // len(REQUESTS), 1)
+        for enabled in (False, True):
+            session.enable_baked_queries = enabled
+            run_requests()
+            seconds = timeit.timeit(run_requests, number=number)
+            label = 'baked' if enabled else 'uncached'
+            microseconds = seconds * 1e6 / (number * len(REQUESTS))
+            print(f'{label:>8}: {microseconds:8.0f} us per request')
+        print(statement_cache.stats())
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,78 @@
+'''
+Benchmark of encoding the list response of 10000 formatted actors
+by flask.jsonify(), compact as in production and pretty-printed
+as in DevelopmentConfig, against the JSON providers of
+json_provider.py. Actors are built in memory, so no database
+is needed.
+
+Usage:
+    pip install orjson
+    python benchmarks/json_encode.py [actors]
+'''
+import os
+import sys
+import timeit
+
+from flask import (
+    Flask,
+    jsonify as flask_jsonify
+)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from json_provider import (  # noqa: E402
+    PROVIDERS,
+    get_provider
+)
+
+ACTOR_KEYS = (
+    'id', 'name', 'age', 'gender', 'location', 'passport',
+    'driver_license', 'ethnicity', 'hair_color', 'eye_color',
+    'body_type', 'height', 'description', 'image_link', 'phone', 'email'
+)
+
+
+def formatted_actors(count):
+    return [dict(zip(ACTOR_KEYS, (
+        i, f'Actor {i}', 10 + i % 70, ('male', 'female')[i % 2], 'LA',
+        i % 3 == 0, i % 2 == 0, ('asian', 'black', None)[i % 3],
+        'black', 'brown', 'slim', 150 + i % 50,
+        f'Description of actor {i}, who played in several movies.',
+        f'https://casting.com/actors/{i}.jpg', '010-0000-0000',
+        f'actor{i}@casting.com'))) for i in range(count)]
+
+
+def main(count):
+    body = {
+        'success': True,
+        'actors': formatted_actors(count),
+        'page': 1,
+        'total_actors': count,
+        'next_cursor': None,
+        'count_strategy': 'exact',
+    }
+    encoders = {}
+    for debug in (False, True):
+        app = Flask(__name__)
+        app.debug = debug
+        name = 'jsonify (debug)' if debug else 'jsonify'
+        encoders[name] = (app, flask_jsonify)
+    for name in PROVIDERS:
+        provider = get_provider(name)
+        if provider.name == name:
+            encoders[name] = (Flask(__name__), provider.response)
+        else:
+            print(f'{name} is not installed')
+
+    baseline = None
+    for name, (app, encode) in encoders.items():
+        with app.app_context():
+            size = len(encode(body).get_data())
+            seconds = timeit.timeit(lambda: encode(body), number=20) / 20
+        baseline = baseline or seconds
+        print(f'{name:>15}: {seconds * 1000:7.2f} ms, {size} bytes, '
+              f'{baseline / seconds:.1f}x')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,93 @@
+'''
+Benchmark of list responses whose JSON is written by postgres,
+JSON_IN_POSTGRES, against rows formatted by row_mapper() and
+encoded by jsonify() of the JSON provider, at several page sizes.
+Both build the response of GET /actors or GET /movies by
+list_response(), without routing and authorization, and the bodies
+are checked to be the same bytes.
+
+Synthetic rows are inserted in a transaction which is rolled back,
+so the benchmark can run against the development database.
+
+Usage:
+    source setup.sh
+    python benchmarks/json_in_postgres.py [page_size ...]
+'''
+import os
+import sys
+import timeit
+
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, list_response  # noqa: E402
+from filters import (  # noqa: E402
+    Actorfilter,
+    Moviefilter
+)
+from flask import request  # noqa: E402
+from models import db  # noqa: E402
+
+ROWS = 2000
+
+INSERT_ROWS = [
+    text("""
+        INSERT INTO actors (name, age, gender, location, height, passport,
+                            driver_license, ethnicity, description, email)
+        SELECT 'Actor ' || i, 10 + i % 70,
+               CAST((ARRAY['male', 'female'])[1 + i % 2] AS gender),
+               'LA', 150 + i % 50, i % 3 = 0, i % 2 = 0,
+               CAST((ARRAY['asian', 'black', 'white'])[1 + i % 3]
+                    AS ethnicity),
+               'Description of actor ' || i, 'actor' || i || '@casting.com'
+        FROM generate_series(1, :rows) AS i
+    """),
+    text("""
+        INSERT INTO movies (title, release_date, company)
+        SELECT 'Movie ' || i, DATE '2000-01-01' + i % 9000, 'Company'
+        FROM generate_series(1, :rows) AS i
+    """),
+]
+
+ENDPOINTS = [
+    ('/actors', Actorfilter, 'actors'),
+    ('/movies', Moviefilter, 'movies'),
+]
+
+
+def response_body(path, filter_class, name, page_size, json_in_postgres):
+    app.config['JSON_IN_POSTGRES'] = json_in_postgres
+    url = f'{path}?page_size={page_size}'
+    with app.test_request_context(url):
+        model_filter = filter_class(request.args.to_dict(flat=False))
+        return list_response(model_filter, name).get_data()
+
+
+def main(page_sizes):
+    with app.app_context():
+        try:
+            for statement in INSERT_ROWS:
+                db.session.execute(statement, {'rows': ROWS})
+            for path, filter_class, name in ENDPOINTS:
+                for page_size in page_sizes:
+                    timings = {}
+                    bodies = {}
+                    for json_in_postgres in (False, True):
+                        args = (path, filter_class, name, page_size,
+                                json_in_postgres)
+                        bodies[json_in_postgres] = response_body(*args)
+                        timings[json_in_postgres] = timeit.timeit(
+                            lambda: response_body(*args), number=100) / 100
+                    assert bodies[False] == bodies[True]
+                    print(f'{path:>7} page_size={page_size:<5} '
+                          f'jsonify: {timings[False] * 1000:7.2f} ms  '
+                          f'postgres: {timings[True] * 1000:7.2f} ms  '
+                          f'{timings[False] / timings[True]:.1f}x')
+        finally:
+            app.config['JSON_IN_POSTGRES'] = False
+            db.session.rollback()
+
+
+if __name__ == '__main__':
+    main([int(size) for size in sys.argv[1:]] or [10, 100, 500, 1000])
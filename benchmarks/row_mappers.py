@@ -0,0 +1,123 @@
+'''
+Benchmark of a page_size=500 actors page read as Actor instances
+and formatted by format(), like before, against the rows of columns
+formatted by row_mapper() which the list endpoints read now.
+Both run the same query, so the difference is hydration and format.
+fetch is the query alone through the DBAPI cursor, without types,
+which is subtracted to compare hydration and format.
+
+Synthetic actors are inserted in a transaction which is rolled back,
+so the benchmark can run against the development database.
+
+Usage:
+    source setup.sh
+    python benchmarks/row_mappers.py [page_size]
+'''
+import functools
+import os
+import sys
+import timeit
+
+from sqlalchemy import (
+    bindparam,
+    select,
+    text
+)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app  # noqa: E402
+from filters import bakery  # noqa: E402
+from models import (  # noqa: E402
+    db,
+    Actor,
+    Movie,
+    plain_column,
+    row_mapper
+)
+
+INSERT_ROWS = [
+    text("""
+        INSERT INTO actors (name, age, gender, location, height, passport,
+                            driver_license, ethnicity, description, email)
+        SELECT 'Actor ' || i, 10 + i % 70,
+               CAST((ARRAY['male', 'female'])[1 + i % 2] AS gender),
+               'LA', 150 + i % 50, i % 3 = 0, i % 2 = 0,
+               CAST((ARRAY['asian', 'black', 'white'])[1 + i % 3]
+                    AS ethnicity),
+               'Description of actor ' || i, 'actor' || i || '@casting.com'
+        FROM generate_series(1, :rows) AS i
+    """),
+    text("""
+        INSERT INTO movies (title, release_date, company)
+        SELECT 'Movie ' || i, DATE '2000-01-01' + i % 9000, 'Company'
+        FROM generate_series(1, :rows) AS i
+    """),
+]
+
+
+def fetch(model, page_size):
+    cursor = db.session.connection().connection.cursor()
+    cursor.execute(fetch_sql(model, page_size))
+    return cursor.fetchall()
+
+
+@functools.lru_cache(maxsize=None)
+def fetch_sql(model, page_size):
+    columns = [getattr(model, key) for key in model.format_keys]
+    statement = select(columns).order_by(model.id).limit(page_size)
+    return str(statement.compile(dialect=db.engine.dialect,
+                                 compile_kwargs={'literal_binds': True}))
+
+
+def page_query(model):
+    # Baked like the queries of the filters, so neither run compiles.
+    return bakery(
+        lambda session: session.query(model).order_by(model.id).limit(
+            bindparam('limit')), model)
+
+
+def instances(model, page_size):
+    session = db.session()
+    rows = page_query(model)(session).params(limit=page_size).all()
+    items = [row.format() for row in rows]
+    # A request ends with a new session, so instances are not reused.
+    session.expunge_all()
+    return items
+
+
+def mapped_rows(model, page_size):
+    columns = [plain_column(model, key) for key in model.format_keys]
+    query = page_query(model).with_criteria(
+        lambda query: query.with_entities(*columns))
+    rows = query(db.session()).params(limit=page_size).all()
+    map_row = row_mapper(model, model.format_keys)
+    return [map_row(row) for row in rows]
+
+
+def main(page_size):
+    with app.app_context():
+        try:
+            for statement in INSERT_ROWS:
+                db.session.execute(statement, {'rows': page_size})
+            for model in (Actor, Movie):
+                assert (instances(model, page_size)
+                        == mapped_rows(model, page_size))
+                timings = {}
+                for read in (fetch, instances, mapped_rows):
+                    read(model, page_size)
+                    timings[read] = timeit.timeit(
+                        lambda: read(model, page_size), number=200) / 200
+                    print(f'{model.__name__:>6} {read.__name__:>11}: '
+                          f'{timings[read] * 1000:7.2f} ms per page')
+                total = timings[instances] / timings[mapped_rows]
+                hydration = ((timings[instances] - timings[fetch])
+                             / (timings[mapped_rows] - timings[fetch]))
+                print(f'{model.__name__:>6} speedup: {total:.1f}x per page, '
+                      f'{hydration:.1f}x of hydration and format')
+        finally:
+            db.session.rollback()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
@@ -0,0 +1,85 @@
+'''
+Benchmark of actor search: ilike('%term%') on name against
+full-text search of the GIN indexed search_vector.
+
+Synthetic actors are inserted in a transaction which is rolled back,
+so the benchmark can run against the development database.
+
+Usage:
+    source setup.sh
+    python benchmarks/search.py [rows]
+'''
+import os
+import sys
+
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app  # noqa: E402
+from filters import (  # noqa: E402
+    Actorfilter,
+    Explain,
+    PAGE_SIZE
+)
+from models import (  # noqa: E402
+    db,
+    Actor
+)
+
+INSERT_ACTORS = text("""
+    INSERT INTO actors (name, age, gender, location, description)
+    SELECT
+        'Actor ' || substr(md5(i::text), 1, 8),
+        20 + i % 50,
+        CAST((ARRAY['male', 'female'])[1 + i % 2] AS gender),
+        'LA',
+        'Plays ' || substr(md5((i * 7)::text), 1, 8) || ' in a drama'
+    FROM generate_series(1, :rows) AS i
+""")
+
+
+def explain(query):
+    plan = db.session.execute(Explain(query.statement, analyze=True))
+    plan = plan.scalar()[0]
+    return plan['Execution Time'], plan['Plan']['Node Type']
+
+
+def ilike_query(search_term):
+    criterion = Actor.name.ilike(f'%{search_term}%')
+    return Actor.query.filter(criterion).order_by(Actor.id).limit(PAGE_SIZE)
+
+
+def search_vector_query(search_term):
+    actor_filter = Actorfilter({'search_term': [search_term]})
+    actor_filter.filter_name_by_search_term()
+    query = actor_filter.query.order_by(*actor_filter.order_clauses())
+    return query.limit(PAGE_SIZE)
+
+
+def main(rows):
+    with app.app_context():
+        db.session.execute(INSERT_ACTORS, {'rows': rows})
+        # Merge the GIN pending list like autovacuum would.
+        db.session.execute(text(
+            "SELECT gin_clean_pending_list('ix_actors_search_vector')"))
+        db.session.execute(text('ANALYZE actors'))
+        terms = [
+            db.session.execute(
+                text('SELECT substr(md5(:i), 1, 6)'), {'i': str(rows // 2)}
+            ).scalar(),
+            'actor',
+        ]
+        try:
+            for term in terms:
+                for name, build in (('ilike', ilike_query),
+                                    ('search_vector', search_vector_query)):
+                    milliseconds, node = explain(build(term))
+                    print(f'{term:>8} {name:>14}: {milliseconds:9.2f} ms '
+                          f'({node})')
+        finally:
+            db.session.rollback()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
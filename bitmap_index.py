@@ -0,0 +1,437 @@
+import threading
+import time
+
+from array import array
+from bisect import (
+    bisect_left,
+    insort
+)
+
+from sqlalchemy import (
+    Boolean,
+    select
+)
+
+from columnar_index import (
+    DEFAULT_MAX_AGE,
+    FALSE_VALUES,
+    TRUE_VALUES,
+    UnsupportedFilter
+)
+
+# A container holds the low 16 bits of ids sharing their high bits.
+CONTAINER_BITS = 16
+CONTAINER_SIZE = 1 << CONTAINER_BITS
+CONTAINER_BYTES = CONTAINER_SIZE // 8
+LOW_MASK = CONTAINER_SIZE - 1
+# Containers with more values are bitmaps, the others sorted arrays.
+ARRAY_MAX = 4096
+
+MAX_CHANGED_ROWS = 1000
+
+
+def array_to_int(values):
+    buffer = bytearray(CONTAINER_BYTES)
+    for value in values:
+        buffer[value >> 3] |= 1 << (value & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def int_to_array(bits):
+    buffer = bits.to_bytes(CONTAINER_BYTES, 'little')
+    values = array('H')
+    for index, byte in enumerate(buffer):
+        while byte:
+            low = byte & -byte
+            values.append((index << 3) + low.bit_length() - 1)
+            byte ^= low
+    return values
+
+
+def popcount(bits):
+    return bin(bits).count('1')
+
+
+# int.bit_count is new in python 3.10
+popcount = getattr(int, 'bit_count', popcount)
+
+
+def cardinality(container):
+    if isinstance(container, int):
+        return popcount(container)
+    return len(container)
+
+
+def normalize(container):
+    '''
+    Returns container as a sorted array if it has at most ARRAY_MAX
+    values, as an int bitmap otherwise, or None if it is empty.
+    '''
+    size = cardinality(container)
+    if size == 0:
+        return None
+    if isinstance(container, int):
+        return int_to_array(container) if size <= ARRAY_MAX else container
+    return container if size <= ARRAY_MAX else array_to_int(container)
+
+
+def filter_array(values, bits, keep):
+    '''Returns values whose bit in bits is equal to keep.'''
+    buffer = bits.to_bytes(CONTAINER_BYTES, 'little')
+    return array('H', [
+        value for value in values
+        if bool(buffer[value >> 3] >> (value & 7) & 1) == keep
+    ])
+
+
+def and_containers(left, right):
+    if isinstance(left, int) and isinstance(right, int):
+        return left & right
+    if isinstance(left, int):
+        left, right = right, left
+    if isinstance(right, int):
+        return filter_array(left, right, True)
+    return array('H', sorted(set(left) & set(right)))
+
+
+def or_containers(left, right):
+    if isinstance(left, int) or isinstance(right, int):
+        if not isinstance(left, int):
+            left = array_to_int(left)
+        if not isinstance(right, int):
+            right = array_to_int(right)
+        return left | right
+    return array('H', sorted(set(left) | set(right)))
+
+
+def andnot_containers(left, right):
+    if isinstance(left, int):
+        if not isinstance(right, int):
+            right = array_to_int(right)
+        return left & ~right
+    if isinstance(right, int):
+        return filter_array(left, right, False)
+    return array('H', sorted(set(left) - set(right)))
+
+
+class RoaringBitmap:
+    '''The class is a compressed set of non-negative integer ids in
+    the layout of roaring bitmaps. Ids are split by their high bits
+    into containers of CONTAINER_SIZE ids. A sparse container is a
+    sorted array of the low 16 bits and a dense one is a bitmap,
+    kept in a Python int. Empty containers are not stored.
+
+    Method:
+        add: adds an id
+        discard: removes an id if it is present
+        copy: returns a bitmap of the same ids which shares no container
+        &, |, -: intersection, union and difference as new bitmaps
+        len: number of ids
+        iter: ids in ascending order
+    '''
+    __slots__ = ('containers',)
+
+    def __init__(self, ids=()):
+        self.containers = {}
+        for row_id in ids:
+            self.add(row_id)
+
+    def add(self, row_id):
+        key, low = row_id >> CONTAINER_BITS, row_id & LOW_MASK
+        container = self.containers.get(key)
+        if container is None:
+            self.containers[key] = array('H', [low])
+        elif isinstance(container, int):
+            self.containers[key] = container | (1 << low)
+        else:
+            index = bisect_left(container, low)
+            if index == len(container) or container[index] != low:
+                insort(container, low)
+                if len(container) > ARRAY_MAX:
+                    self.containers[key] = array_to_int(container)
+
+    def discard(self, row_id):
+        key, low = row_id >> CONTAINER_BITS, row_id & LOW_MASK
+        container = self.containers.get(key)
+        if container is None:
+            return
+        if isinstance(container, int):
+            if not container >> low & 1:
+                return
+            container = normalize(container & ~(1 << low))
+        else:
+            index = bisect_left(container, low)
+            if index < len(container) and container[index] == low:
+                del container[index]
+            container = normalize(container)
+        if container is None:
+            del self.containers[key]
+        else:
+            self.containers[key] = container
+
+    def __contains__(self, row_id):
+        key, low = row_id >> CONTAINER_BITS, row_id & LOW_MASK
+        container = self.containers.get(key)
+        if container is None:
+            return False
+        if isinstance(container, int):
+            return bool(container >> low & 1)
+        index = bisect_left(container, low)
+        return index < len(container) and container[index] == low
+
+    def copy(self):
+        bitmap = RoaringBitmap()
+        bitmap.containers = {
+            key: container if isinstance(container, int)
+            else array('H', container)
+            for key, container in self.containers.items()
+        }
+        return bitmap
+
+    @classmethod
+    def from_containers(cls, containers):
+        bitmap = cls()
+        for key, container in containers:
+            container = normalize(container)
+            if container is not None:
+                bitmap.containers[key] = container
+        return bitmap
+
+    def __and__(self, other):
+        return RoaringBitmap.from_containers(
+            (key, and_containers(container, other.containers[key]))
+            for key, container in self.containers.items()
+            if key in other.containers)
+
+    def __or__(self, other):
+        containers = dict(self.containers)
+        for key, container in other.containers.items():
+            if key in containers:
+                container = or_containers(containers[key], container)
+            containers[key] = container
+        return RoaringBitmap.from_containers(containers.items())
+
+    def __sub__(self, other):
+        return RoaringBitmap.from_containers(
+            (key, andnot_containers(container, other.containers[key])
+             if key in other.containers else container)
+            for key, container in self.containers.items())
+
+    def __len__(self):
+        return sum(cardinality(container)
+                   for container in self.containers.values())
+
+    def __iter__(self):
+        for key in sorted(self.containers):
+            container = self.containers[key]
+            if isinstance(container, int):
+                container = int_to_array(container)
+            high = key << CONTAINER_BITS
+            for low in container:
+                yield high | low
+
+    def nbytes(self):
+        return sum(
+            CONTAINER_BYTES if isinstance(container, int)
+            else container.itemsize * len(container)
+            for container in self.containers.values())
+
+
+class BitmapIndex:
+    '''The class keeps one RoaringBitmap of row ids per value of each
+    enum or boolean column of a table, NULL included, so AND, OR and
+    NOT combinations of values and their facet counts are answered by
+    bitwise operations.
+
+    Rows written since the last query are reloaded by id before the
+    next one, and every row when they are older than max_age seconds,
+    like ColumnarIndex.
+
+    Attribute:
+        table: sqlalchemy table with an integer id primary key
+        columns: names of indexed enum and boolean columns
+        execute: function executing a statement and returning rows
+        max_age: seconds the bitmaps are used without a full reload
+        bitmaps: dictionary({column: {value: RoaringBitmap}})
+        universe: RoaringBitmap of every id
+
+    Method:
+        mark_changed: records a write to the table
+        refresh: reloads every row or the changed rows if needed
+        parse: returns the value of a query string value of a column
+        evaluate: returns RoaringBitmap of ids matching an expression
+        facet_counts: returns numbers of ids of a bitmap by value
+        stats: returns a dictionary of counters
+    '''
+    def __init__(self, table, columns, execute, max_age=DEFAULT_MAX_AGE,
+                 clock=time.monotonic):
+        self.table = table
+        self.columns = list(columns)
+        self.execute = execute
+        self.max_age = max_age
+        self.clock = clock
+        self.bitmaps = None
+        self.universe = None
+        self.loaded_at = None
+        self.changed_ids = set()
+        self.stale = True
+        self.full_loads = 0
+        self.partial_loads = 0
+        self.queries = 0
+        self.lock = threading.Lock()
+
+    def load(self, ids=None):
+        names = ['id'] + self.columns
+        statement = select([self.table.c[name] for name in names])
+        if ids is not None:
+            statement = statement.where(self.table.c.id.in_(list(ids)))
+        return self.execute(statement)
+
+    def add_row(self, row):
+        row_id = row[0]
+        self.universe.add(row_id)
+        for column, value in zip(self.columns, row[1:]):
+            bitmaps = self.bitmaps[column]
+            if value not in bitmaps:
+                bitmaps[value] = RoaringBitmap()
+            bitmaps[value].add(row_id)
+
+    def remove_row(self, row_id):
+        self.universe.discard(row_id)
+        for bitmaps in self.bitmaps.values():
+            for bitmap in bitmaps.values():
+                bitmap.discard(row_id)
+
+    def mark_changed(self, table, row_id):
+        if table is not None and table != self.table.name:
+            return
+        with self.lock:
+            if table is None or row_id is None:
+                self.stale = True
+            else:
+                self.changed_ids.add(row_id)
+                if len(self.changed_ids) > MAX_CHANGED_ROWS:
+                    self.stale = True
+
+    def refresh(self):
+        with self.lock:
+            expired = (self.loaded_at is None
+                       or self.clock() - self.loaded_at > self.max_age)
+            if self.stale or expired:
+                self.stale = False
+                self.changed_ids = set()
+                self.bitmaps = {column: {} for column in self.columns}
+                self.universe = RoaringBitmap()
+                for row in self.load():
+                    self.add_row(row)
+                self.loaded_at = self.clock()
+                self.full_loads += 1
+            elif self.changed_ids:
+                changed_ids = self.changed_ids
+                self.changed_ids = set()
+                for row_id in changed_ids:
+                    self.remove_row(row_id)
+                for row in self.load(changed_ids):
+                    self.add_row(row)
+                self.partial_loads += 1
+
+    def parse(self, column, value):
+        '''
+        Returns the value of a query string value of column.
+        Raises UnsupportedFilter if column is not indexed or
+        the value is not parsed here, so the query falls back to SQL.
+        '''
+        if column not in self.columns:
+            raise UnsupportedFilter(f'{column} is not indexed')
+        column_type = self.table.c[column].type
+        if isinstance(column_type, Boolean):
+            normalized = str(value).strip().lower()
+            if normalized in TRUE_VALUES:
+                return True
+            if normalized in FALSE_VALUES:
+                return False
+        elif value in column_type.enums:
+            return value
+        raise UnsupportedFilter(f'Invalid {column} {value}')
+
+    def value_bitmap(self, column, value):
+        if column not in self.bitmaps:
+            raise UnsupportedFilter(f'{column} is not indexed')
+        return self.bitmaps[column].get(value, RoaringBitmap())
+
+    def match(self, expression):
+        operator_name = expression[0]
+        if operator_name == 'eq':
+            return self.value_bitmap(expression[1], expression[2])
+        if operator_name == 'in':
+            bitmap = RoaringBitmap()
+            for value in expression[2]:
+                bitmap = bitmap | self.value_bitmap(expression[1], value)
+            return bitmap
+        if operator_name == 'not':
+            return self.universe - self.match(expression[1])
+        bitmaps = [self.match(operand) for operand in expression[1]]
+        if operator_name == 'and':
+            bitmap = self.universe
+            for operand in bitmaps:
+                bitmap = bitmap & operand
+            return bitmap
+        if operator_name == 'or':
+            bitmap = RoaringBitmap()
+            for operand in bitmaps:
+                bitmap = bitmap | operand
+            return bitmap
+        raise UnsupportedFilter(f'Unknown operator {operator_name}')
+
+    def evaluate(self, expression):
+        '''
+        Args:
+            expression: nested tuples of
+                        ('eq', column, value)
+                        ('in', column, [values])
+                        ('and', [expressions])
+                        ('or', [expressions])
+                        ('not', expression)
+                        NOT is the complement in every row,
+                        rows whose column is NULL included.
+        Returns:
+            RoaringBitmap of ids of rows matching expression.
+            It shares no container with the index, which refresh()
+            may change while the caller still uses it.
+        '''
+        self.refresh()
+        with self.lock:
+            self.queries += 1
+            return self.match(expression).copy()
+
+    def facet_counts(self, bitmap, columns):
+        '''
+        Returns dictionary({column: [{value, count}]}) of the numbers
+        of ids of bitmap by each value of columns, sorted by count.
+        Values without ids are left out.
+        '''
+        counts = {}
+        with self.lock:
+            for column in columns:
+                values = []
+                for value, value_bitmap in self.bitmaps[column].items():
+                    count = len(bitmap & value_bitmap)
+                    if count:
+                        values.append({'value': value, 'count': count})
+                values.sort(key=lambda value: (-value['count'],
+                                               str(value['value'])))
+                counts[column] = values
+        return counts
+
+    def stats(self):
+        bitmaps = self.bitmaps or {}
+        return {
+            'size': 0 if self.universe is None else len(self.universe),
+            'bitmaps': sum(len(values) for values in bitmaps.values()),
+            'bytes': sum(bitmap.nbytes() for values in bitmaps.values()
+                         for bitmap in values.values()),
+            'changed_rows': len(self.changed_ids),
+            'full_loads': self.full_loads,
+            'partial_loads': self.partial_loads,
+            'queries': self.queries,
+        }
@@ -0,0 +1,247 @@
+import threading
+import time
+
+from sqlalchemy import (
+    Boolean,
+    Enum,
+    Integer,
+    select
+)
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+DEFAULT_MAX_AGE = 300
+MAX_CHANGED_ROWS = 1000
+
+# Boolean input accepted by postgres, ex) passport=t
+TRUE_VALUES = {'t', 'true', 'y', 'yes', 'on', '1'}
+FALSE_VALUES = {'f', 'false', 'n', 'no', 'off', '0'}
+
+NULL_CODE = -1
+
+
+class UnsupportedFilter(Exception):
+    pass
+
+
+def column_kind(column):
+    '''
+    Returns 'integer', 'boolean' or 'enum' by the type of column
+    or None if the column can not be indexed.
+    '''
+    if isinstance(column.type, Enum):
+        return 'enum'
+    if isinstance(column.type, Boolean):
+        return 'boolean'
+    if isinstance(column.type, Integer):
+        return 'integer'
+    return None
+
+
+class ColumnarIndex:
+    '''The class keeps a snapshot of small columns of a table in NumPy
+    arrays sorted by id, so IN and range predicates run as vectorized
+    masks in process memory. Integers are float64 with NaN for NULL,
+    enums and booleans are int8 codes with -1 for NULL, so NULL never
+    matches, like in SQL.
+
+    Changed rows are reloaded by id before the next match. The whole
+    snapshot is reloaded when it is older than max_age seconds, when
+    too many rows changed, or when changes may have been missed.
+
+    Attribute:
+        table: sqlalchemy table with an integer id primary key
+        columns: names of indexed columns
+        execute: function executing a statement and returning rows
+        max_age: seconds a snapshot is used without a full reload
+        arrays: dictionary({name: array}) of the snapshot and its ids
+        changed_ids: ids of rows written since the snapshot
+        stale: if True, the next match reloads the whole snapshot
+
+    Method:
+        mark_changed: records a write to the table
+        refresh: reloads the snapshot or the changed rows if needed
+        match: returns sorted ids of rows matching predicates
+        stats: returns a dictionary of counters
+    '''
+    def __init__(self, table, columns, execute, max_age=DEFAULT_MAX_AGE,
+                 clock=time.monotonic):
+        if numpy is None:
+            raise ImportError('ColumnarIndex requires numpy')
+        self.table = table
+        self.columns = list(columns)
+        self.kinds = {name: column_kind(table.c[name])
+                      for name in self.columns}
+        self.kinds['id'] = 'integer'
+        self.codes = {
+            name: {label: code
+                   for code, label in enumerate(table.c[name].type.enums)}
+            for name, kind in self.kinds.items() if kind == 'enum'
+        }
+        self.execute = execute
+        self.max_age = max_age
+        self.clock = clock
+        self.arrays = None
+        self.loaded_at = None
+        self.changed_ids = set()
+        self.stale = True
+        self.full_loads = 0
+        self.partial_loads = 0
+        self.matches = 0
+        self.lock = threading.Lock()
+
+    def encode(self, name, value):
+        kind = self.kinds[name]
+        if value is None:
+            return numpy.nan if kind == 'integer' else NULL_CODE
+        if kind == 'enum':
+            return self.codes[name][value]
+        if kind == 'boolean':
+            return int(value)
+        return value
+
+    def load(self, ids=None):
+        '''
+        Returns arrays of the rows of ids or of every row.
+        '''
+        names = ['id'] + self.columns
+        statement = select([self.table.c[name] for name in names])
+        if ids is not None:
+            statement = statement.where(self.table.c.id.in_(list(ids)))
+        rows = self.execute(statement.order_by(self.table.c.id))
+        arrays = {}
+        for index, name in enumerate(names):
+            values = [self.encode(name, row[index]) for row in rows]
+            if name == 'id':
+                dtype = numpy.int64
+            elif self.kinds[name] == 'integer':
+                dtype = numpy.float64
+            else:
+                dtype = numpy.int8
+            arrays[name] = numpy.array(values, dtype=dtype)
+        return arrays
+
+    def mark_changed(self, table, row_id):
+        if table is not None and table != self.table.name:
+            return
+        with self.lock:
+            if table is None or row_id is None:
+                self.stale = True
+            else:
+                self.changed_ids.add(row_id)
+                if len(self.changed_ids) > MAX_CHANGED_ROWS:
+                    self.stale = True
+
+    def refresh(self):
+        with self.lock:
+            expired = (self.loaded_at is None
+                       or self.clock() - self.loaded_at > self.max_age)
+            if self.stale or expired:
+                # Changes after this point are applied by the next refresh
+                self.stale = False
+                self.changed_ids = set()
+                self.arrays = self.load()
+                self.loaded_at = self.clock()
+                self.full_loads += 1
+            elif self.changed_ids:
+                changed_ids = self.changed_ids
+                self.changed_ids = set()
+                self.arrays = self.merge(self.arrays, changed_ids,
+                                         self.load(changed_ids))
+                self.partial_loads += 1
+            return self.arrays
+
+    def merge(self, arrays, changed_ids, changed_arrays):
+        '''
+        Returns arrays without the rows of changed_ids
+        plus changed_arrays, the rows of changed_ids which still exist.
+        '''
+        keep = ~numpy.isin(arrays['id'], list(changed_ids))
+        merged = {
+            name: numpy.concatenate([array[keep], changed_arrays[name]])
+            for name, array in arrays.items()
+        }
+        order = numpy.argsort(merged['id'], kind='stable')
+        return {name: array[order] for name, array in merged.items()}
+
+    def parse(self, name, value):
+        '''
+        Returns the code of a query string value of column name.
+        Raises UnsupportedFilter if the value is not parsed here,
+        so the query falls back to SQL and its error handling.
+        '''
+        kind = self.kinds[name]
+        if kind == 'enum':
+            if value not in self.codes[name]:
+                raise UnsupportedFilter(f'Invalid {name} {value}')
+            return self.codes[name][value]
+        if kind == 'boolean':
+            normalized = str(value).strip().lower()
+            if normalized in TRUE_VALUES:
+                return 1
+            if normalized in FALSE_VALUES:
+                return 0
+            raise UnsupportedFilter(f'Invalid {name} {value}')
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise UnsupportedFilter(f'Invalid {name} {value}')
+
+    def match(self, predicates):
+        '''
+        Args:
+            predicates: list of (column, operator_name, value).
+                        operator_name is 'in', 'ne', 'gte', 'lte'
+                        or 'between'. value is a list for 'in'
+                        and (lower, upper) for 'between'.
+        Returns:
+            sorted numpy array of ids of rows matching every predicate
+        Raises UnsupportedFilter if a predicate can not be matched here.
+        '''
+        for column, operator_name, value in predicates:
+            if column not in self.kinds:
+                raise UnsupportedFilter(f'{column} is not indexed')
+        parsed = [
+            (column, operator_name,
+             [self.parse(column, item) for item in value]
+             if operator_name in ('in', 'between')
+             else self.parse(column, value))
+            for column, operator_name, value in predicates
+        ]
+        arrays = self.refresh()
+        mask = numpy.ones(len(arrays['id']), dtype=bool)
+        for column, operator_name, value in parsed:
+            array = arrays[column]
+            if operator_name == 'in':
+                mask &= numpy.isin(array, value)
+            elif operator_name == 'gte':
+                mask &= array >= value
+            elif operator_name == 'lte':
+                mask &= array <= value
+            elif operator_name == 'between':
+                mask &= (array >= value[0]) & (array <= value[1])
+            elif operator_name == 'ne':
+                # NULL is not different from a value in SQL either.
+                if self.kinds[column] == 'integer':
+                    mask &= (array != value) & ~numpy.isnan(array)
+                else:
+                    mask &= (array != value) & (array != NULL_CODE)
+            else:
+                raise UnsupportedFilter(f'Unknown operator {operator_name}')
+        self.matches += 1
+        return arrays['id'][mask]
+
+    def stats(self):
+        arrays = self.arrays
+        return {
+            'size': 0 if arrays is None else len(arrays['id']),
+            'bytes': 0 if arrays is None else sum(
+                array.nbytes for array in arrays.values()),
+            'changed_rows': len(self.changed_ids),
+            'full_loads': self.full_loads,
+            'partial_loads': self.partial_loads,
+            'matches': self.matches,
+        }
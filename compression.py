@@ -0,0 +1,96 @@
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DEFAULT_MIN_SIZE = 1024
+DEFAULT_GZIP_LEVEL = 6
+# Quality 11, the default of brotli, is too slow to run per response.
+DEFAULT_BROTLI_QUALITY = 5
+COMPRESSIBLE_MIMETYPES = {'application/json'}
+
+
+class Compressor:
+    '''The class compresses responses by the Accept-Encoding of
+    the request, with brotli if both sides support it and gzip
+    otherwise. Bodies smaller than min_size are sent as they are,
+    since the compressed ones would not be much smaller.
+
+    Attribute:
+        min_size: size in bytes of the smallest compressed body
+        gzip_level: compression level of gzip, 1 to 9
+        brotli_quality: quality of brotli, 0 to 11
+        encodings: supported encodings in order of preference
+        enabled: if False, nothing is compressed
+
+    Method:
+        negotiate: returns the encoding of a request or None
+        compressible: returns whether a response may be compressed
+        compress: returns a body compressed by an encoding
+        encode_response: compresses a response of a request if it can
+    '''
+    def __init__(self, min_size=DEFAULT_MIN_SIZE,
+                 gzip_level=DEFAULT_GZIP_LEVEL,
+                 brotli_quality=DEFAULT_BROTLI_QUALITY, enabled=True):
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.encodings = ['gzip'] if brotli is None else ['br', 'gzip']
+        self.enabled = enabled
+
+    def negotiate(self, accept_encodings):
+        '''
+        Args:
+            accept_encodings: request.accept_encodings
+        Returns:
+            the supported encoding of highest quality for the client,
+            brotli first on a tie, or None
+        '''
+        if not self.enabled:
+            return None
+        return accept_encodings.best_match(self.encodings)
+
+    def compressible(self, response):
+        '''
+        Returns whether response is a whole successful JSON body
+        which is not encoded yet. Streamed exports are left as they are.
+        '''
+        return (self.enabled
+                and response.status_code == 200
+                and response.mimetype in COMPRESSIBLE_MIMETYPES
+                and not response.direct_passthrough
+                and not response.is_streamed
+                and 'Content-Encoding' not in response.headers)
+
+    def compress(self, body, encoding):
+        if encoding == 'br':
+            return brotli.compress(body, quality=self.brotli_quality)
+        # mtime=0 keeps the bytes of a body the same.
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+    def encode_response(self, response, encoding, body=None):
+        '''
+        Replaces the body of response by body, already compressed by
+        encoding, or compresses it if body is None.
+        Leaves response as it is if encoding is None or the body
+        is smaller than min_size.
+        Args:
+            response: response for which compressible() is True
+            encoding: negotiate() of the request
+            body: compressed body or None
+        Returns:
+            response
+        '''
+        response.vary.add('Accept-Encoding')
+        if encoding is None:
+            return response
+        if body is None:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return response
+            body = self.compress(data, encoding)
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,127 @@
+import hashlib
+
+from datetime import timezone
+from functools import wraps
+
+from flask import (
+    abort,
+    current_app,
+    make_response,
+    request
+)
+
+from result_cache import normalize_args
+
+
+def version_etag(fingerprint, version):
+    '''
+    Returns the tag of a response by fingerprint, the request,
+    and version, the row of version_columns() of the rows it reads.
+    '''
+    updated_at = version.updated_at
+    text = repr((
+        fingerprint,
+        version.count,
+        None if updated_at is None else updated_at.isoformat(),
+        None if version.checksum is None else int(version.checksum),
+    ))
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+def to_http_time(value):
+    '''Returns value as naive UTC in whole seconds, like HTTP dates.'''
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.replace(microsecond=0)
+
+
+def not_modified(etag, last_modified):
+    '''
+    Returns whether the conditions of the request match the response
+    of etag and last_modified. If-Modified-Since is ignored when
+    If-None-Match is sent, as RFC 7232 says.
+    '''
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since is None or last_modified is None:
+        return False
+    return (to_http_time(last_modified)
+            <= to_http_time(request.if_modified_since))
+
+
+def conditional_request():
+    '''Returns whether the request has If-None-Match or If-Modified-Since.'''
+    return bool(request.if_none_match) or request.if_modified_since is not None
+
+
+def read_validators(version, *args, **kwargs):
+    '''
+    Runs version, the aggregate query of conditional(), for the request.
+    Returns:
+        (etag, last_modified) of the response, or None if the request
+        has no rows or version raises ValueError, so the endpoint
+        answers it. Other errors abort with 422 like the endpoints.
+    '''
+    try:
+        row = version(*args, **kwargs)
+    except ValueError:
+        return None
+    except Exception:
+        abort(422)
+    if not row.count:
+        return None
+    return (version_etag((request.path, normalize_args(request.args)), row),
+            row.updated_at)
+
+
+def set_validators(response, validators):
+    etag, last_modified = validators
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    return response
+
+
+def not_modified_response(validators):
+    '''
+    Returns 304 Not Modified if the request matches validators,
+    the result of read_validators(), or None.
+    '''
+    if validators is None or not not_modified(*validators):
+        return None
+    return set_validators(current_app.response_class(status=304), validators)
+
+
+def conditional(version):
+    '''
+    Adds a weak ETag and Last-Modified to successful responses of
+    a GET endpoint, and answers requests whose If-None-Match or
+    If-Modified-Since match them by 304 Not Modified after one
+    aggregate query, without running the endpoint.
+    The aggregate runs on every request, so version should read no
+    more rows than the endpoint, ex) the roles of one movie by its
+    index. List endpoints keep the validators in the result cache
+    instead, see cached_list() of app.py.
+    Args:
+        version: function of the arguments of the endpoint returning
+                 the row of version_columns() of the rows it reads.
+                 If it raises ValueError, the endpoint answers.
+    Requests of no rows are always answered by the endpoint, since
+    the rows may be missing because a parent is, ex) the roles of
+    a deleted movie.
+    '''
+    def conditional_decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            # Read before the endpoint, so a concurrent write leaves
+            # an older tag, which does not match the next version.
+            validators = read_validators(version, *args, **kwargs)
+            response = not_modified_response(validators)
+            if response is not None:
+                return response
+            response = make_response(f(*args, **kwargs))
+            if response.status_code != 200 or validators is None:
+                return response
+            return set_validators(response, validators)
+        return wrapper
+    return conditional_decorator
@@ -8,6 +8,10 @@ class Config(object):
     CSRF_ENABLED = True
     # SECRET_KEY = 'this-really-needs-to-be-changed'
     SQLALCHEMY_DATABASE_URI = os.environ['DATABASE_URL']
+    # orjson falls back to json when it is not installed
+    JSON_PROVIDER = os.environ.get('JSON_PROVIDER', 'orjson')
+    # List responses are written as JSON by postgres
+    JSON_IN_POSTGRES = os.environ.get('JSON_IN_POSTGRES', 'false') == 'true'
 
 
 class ProductionConfig(Config):
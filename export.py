@@ -0,0 +1,102 @@
+import csv
+import io
+
+from contextlib import contextmanager
+
+from sqlalchemy.orm import Session
+
+from filters import EXPORT_BATCH_SIZE
+from json_provider import json_provider
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+@contextmanager
+def snapshot_session(engine):
+    '''
+    Yields a session in a read only repeatable read transaction
+    on its own connection, so a long export reads one snapshot
+    and its server-side cursor does not hold the request session.
+    '''
+    connection = engine.connect().execution_options(
+        isolation_level='REPEATABLE READ')
+    transaction = connection.begin()
+    session = Session(bind=connection)
+    try:
+        connection.execute('SET TRANSACTION READ ONLY')
+        yield session
+    finally:
+        session.close()
+        transaction.rollback()
+        connection.close()
+
+
+def ndjson_lines(items):
+    dumps = json_provider().dumps
+    for item in items:
+        yield dumps(item).decode() + '\n'
+
+
+def csv_lines(items, header):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=header)
+    writer.writeheader()
+    for item in items:
+        writer.writerow(item)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def batches(lines, batch_size):
+    '''Joins lines into chunks of batch_size lines.'''
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) == batch_size:
+            yield ''.join(batch)
+            batch = []
+    yield ''.join(batch)
+
+
+def stream_export(model_filter, export_format, engine,
+                  batch_size=EXPORT_BATCH_SIZE):
+    '''
+    Yields chunks of every result of model_filter.
+    The query runs before the first chunk is yielded,
+    so errors of it are raised by the first next().
+    Args:
+        model_filter: Basefilter
+        export_format: key of EXPORT_FORMATS
+        engine: engine to open the snapshot connection
+        batch_size: number of rows fetched and yielded at a time
+    '''
+    with snapshot_session(engine) as session:
+        query = model_filter.get_export_query(session, batch_size)
+        results = iter(query)
+        map_row = model_filter.get_row_mapper()
+        items = (map_row(result) for result in results)
+        if export_format == 'csv':
+            header = model_filter.fields or model_filter.model.format_keys
+            lines = csv_lines(items, header)
+        else:
+            lines = ndjson_lines(items)
+        yield from batches(lines, batch_size)
+
+
+def prime(chunks):
+    '''
+    Starts chunks, so errors before the first chunk are raised here
+    instead of after the response headers are sent.
+    '''
+    first = next(chunks)
+
+    def primed():
+        yield first
+        yield from chunks
+    return primed()
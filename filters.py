@@ -1,151 +1,1051 @@
+import base64
+import datetime
+import functools
+import json
+import os
+import re
+
+from sqlalchemy import (
+    Boolean,
+    Date,
+    Enum,
+    Integer,
+    Numeric,
+    and_,
+    bindparam,
+    cast,
+    false,
+    func,
+    or_,
+    text,
+    tuple_
+)
+from sqlalchemy.ext import baked
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import (
+    ClauseElement,
+    Executable
+)
+
+from bitmap_index import BitmapIndex
+from columnar_index import (
+    ColumnarIndex,
+    DEFAULT_MAX_AGE,
+    FALSE_VALUES,
+    TRUE_VALUES,
+    UnsupportedFilter,
+    numpy
+)
 from models import (
+    db,
+    table_generations,
     Actor,
     Movie,
-    Role
+    Role,
+    SEARCH_CONFIG,
+    plain_column,
+    row_json,
+    row_mapper,
+    version_columns
 )
+from statement_cache import StatementCache
 
 PAGE_SIZE = 10
 
+EXPORT_BATCH_SIZE = 1000
+
+COUNT_STRATEGIES = ['exact', 'window', 'estimate', 'none']
+
+SEARCH_WORD_PATTERN = re.compile(r'[^\W_]+')
+
+QUERY_CACHE_SIZE = int(os.environ.get('QUERY_CACHE_SIZE', '500'))
+
+ACTOR_INDEX_ENABLED = (
+    os.environ.get('ACTOR_INDEX_ENABLED', 'false') == 'true'
+)
+ACTOR_INDEX_MAX_AGE = int(
+    os.environ.get('ACTOR_INDEX_MAX_AGE', DEFAULT_MAX_AGE))
+ACTOR_INDEX_COLUMNS = [
+    'age', 'height', 'gender', 'ethnicity', 'hair_color', 'eye_color',
+    'body_type', 'passport', 'driver_license'
+]
+ACTOR_BITMAPS_ENABLED = (
+    os.environ.get('ACTOR_BITMAPS_ENABLED', 'false') == 'true'
+)
+ACTOR_BITMAPS_MAX_AGE = int(
+    os.environ.get('ACTOR_BITMAPS_MAX_AGE', DEFAULT_MAX_AGE))
+ACTOR_BITMAP_COLUMNS = [
+    'gender', 'ethnicity', 'hair_color', 'eye_color', 'body_type',
+    'passport', 'driver_license'
+]
+
+# Filter operators by the suffix of their parameter name,
+# ex) age__gte. Each returns the criterion of a column and
+# the name of its bound parameter. in binds a list, between binds
+# <name>_lower and <name>_upper and prefix binds a LIKE pattern.
+OPERATORS = {
+    'in': lambda column, name: column.in_(bindparam(name, expanding=True)),
+    'ne': lambda column, name: column != bindparam(name),
+    'gte': lambda column, name: column >= bindparam(name),
+    'lte': lambda column, name: column <= bindparam(name),
+    'between': lambda column, name: column.between(
+        bindparam(f'{name}_lower'), bindparam(f'{name}_upper')),
+    'prefix': lambda column, name: column.like(bindparam(name),
+                                               escape='\\'),
+}
+
+# Query parameters of every list endpoint which are not filters.
+CONTROL_PARAMETERS = {'page', 'page_size', 'cursor', 'count', 'fields',
+                      'sort', 'format'}
+
+# Compiled filter queries and their SQL, shared by every filter.
+statement_cache = StatementCache(max_size=QUERY_CACHE_SIZE)
+bakery = baked.Bakery(baked.BakedQuery, statement_cache)
+
+
+def prefix_tsquery(search_term):
+    '''
+    Returns tsquery text matching every word of search_term as a prefix
+    or None if search_term has no word.
+    ex) 'inma cue' -> 'inma:* & cue:*'
+    '''
+    words = SEARCH_WORD_PATTERN.findall(search_term)
+    if not words:
+        return None
+    return ' & '.join(f'{word}:*' for word in words)
+
+
+def search_tsquery():
+    '''Returns to_tsquery of the bound search_query parameter.'''
+    return func.to_tsquery(SEARCH_CONFIG, bindparam('search_query'))
+
+
+def create_actor_index(max_age=ACTOR_INDEX_MAX_AGE):
+    '''
+    Returns a columnar index of ACTOR_INDEX_COLUMNS kept up to date
+    by table_generations or None if numpy is not installed.
+    '''
+    if numpy is None:
+        return None
+    index = ColumnarIndex(
+        Actor.__table__, ACTOR_INDEX_COLUMNS,
+        lambda statement: db.engine.execute(statement).fetchall(),
+        max_age=max_age)
+    table_generations.add_listener(index.mark_changed)
+    return index
+
+
+def create_actor_bitmaps(max_age=ACTOR_BITMAPS_MAX_AGE):
+    '''
+    Returns a bitmap index of ACTOR_BITMAP_COLUMNS kept up to date
+    by table_generations.
+    '''
+    index = BitmapIndex(
+        Actor.__table__, ACTOR_BITMAP_COLUMNS,
+        lambda statement: db.engine.execute(statement).fetchall(),
+        max_age=max_age)
+    table_generations.add_listener(index.mark_changed)
+    return index
+
+
+def coerce_value(column, value):
+    '''
+    Returns value of the query string converted to the type of column.
+    Raises ValueError if it is not a value of the column.
+    ex) passport, 't' -> True / age, '20' -> 20
+    '''
+    column_type = column.type
+    if isinstance(column_type, Enum):
+        if value not in column_type.enums:
+            raise ValueError(f'Invalid {column.key} {value}')
+        return value
+    if isinstance(column_type, Boolean):
+        normalized = value.strip().lower()
+        if normalized in TRUE_VALUES:
+            return True
+        if normalized in FALSE_VALUES:
+            return False
+        raise ValueError(f'Invalid {column.key} {value}')
+    try:
+        if isinstance(column_type, Integer):
+            return int(value)
+        if isinstance(column_type, Date):
+            return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'Invalid {column.key} {value}')
+    return value
+
+
+def escape_like(value):
+    '''Returns value with the LIKE wildcards escaped by a backslash.'''
+    return re.sub(r'([\\%_])', r'\\\1', value)
+
+
+@functools.lru_cache(maxsize=None)
+def filter_parameters(filter_class):
+    '''
+    Returns dictionary({parameter: (column, operator_name)}) of
+    the filter parameters of filter_class, compiled once from
+    its schema and aliases.
+    A column is also a parameter of its IN filter, ex) gender=male.
+    '''
+    parameters = {}
+    for column, operator_names in filter_class.schema.items():
+        parameters[column] = (column, 'in')
+        for operator_name in operator_names:
+            if operator_name not in OPERATORS:
+                raise ValueError(f'Unknown operator {operator_name}')
+            parameters[f'{column}__{operator_name}'] = (column,
+                                                        operator_name)
+    for alias, parameter in filter_class.aliases.items():
+        parameters[alias] = parameters[parameter]
+    return parameters
+
+
+@functools.lru_cache(maxsize=None)
+def filter_columns(model):
+    '''
+    Returns names of the columns of model which can be filtered
+    and returned. updated_at is only used by conditional requests.
+    '''
+    return tuple(column.key for column in model.__table__.columns
+                 if column.computed is None and column.key != 'updated_at')
+
+
+class Explain(Executable, ClauseElement):
+    '''EXPLAIN (FORMAT JSON) of a select statement.
+    Bound parameters of the statement are kept.
+    With analyze, the statement is executed and timed.
+    '''
+    def __init__(self, statement, analyze=False):
+        self.statement = statement
+        self.analyze = analyze
+
+
+@compiles(Explain, 'postgresql')
+def compile_explain(element, compiler, **kw):
+    statement = compiler.process(element.statement, **kw)
+    options = 'ANALYZE, FORMAT JSON' if element.analyze else 'FORMAT JSON'
+    return f'EXPLAIN ({options}) {statement}'
+
+
+def encode_cursor(keys, values):
+    '''
+    Args:
+        keys: list of sort keys
+        values: list of sort key values of the last row
+    Returns:
+        opaque url-safe cursor string
+    '''
+    data = json.dumps([keys, values], default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, keys):
+    '''
+    Returns values encoded in cursor.
+    Raises ValueError if cursor is malformed or was made
+    for other sort keys.
+    '''
+    padded = cursor + '=' * (-len(cursor) % 4)
+    try:
+        cursor_keys, values = json.loads(base64.urlsafe_b64decode(padded))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if cursor_keys != keys or len(values) != len(keys):
+        raise ValueError('Cursor does not match sort order')
+    return values
+
 
 class Basefilter:
     '''The class implements filter methods to update query and
-    get results by query. Subclass overrides get_results method
+    get results by query. Subclass overrides apply_filters method
     to get filtered results.
 
+    Filters add steps to a baked query with bound parameters instead
+    of values, so every filter shape, ex) {gender IN, age >=, age <=},
+    is compiled once and cached in statement_cache.
+
     Attribute:
         model: sqlalchemy model
         columns: colums of self.model
         data: dictionary({key(string): value(list)}).
               Using the data, update query.
-        query: sqlalchemy query initialized by self.model.query
+        baked: baked query of self.model updated by filters
+        shape: list of the cache keys of the filter steps
+        params: dictionary({name: value}) of bound parameters of filters
+        query: sqlalchemy query of self.baked with self.params.
+               It is built without the cache.
+        sortable: column names which sort may sort by
+        order: list of (key, descending) used to sort results.
+               A key is a column name or a key of self.expressions.
+               The last key must be unique so the order is stable.
+        expressions: dictionary({key: sql expression}) of computed
+                     sort keys. They are selected with the results
+                     so cursors can be made from them.
+        next_cursor: cursor of the page after the last paginated results
+                     or None if there are no more results
+        fields: list of column names to load and format
+                or None for every column
+        as_json: if True, results are JSON text of their fields
+                 built by postgres, see results_json
+        schema: dictionary({column: [operator names]}) of the filters
+                of each column besides IN, which every column has.
+                Each is a parameter column__operator_name,
+                ex) {'age': ['gte']} -> age__gte=20
+        aliases: dictionary({alias: parameter}), ex) min_age: age__gte
+        searchable: if True, search_term is a full-text search
+        predicates: list of (column, operator_name, value) of add_filter
+        columnar_index: ColumnarIndex serving predicates or None
+        bitmap_index: BitmapIndex serving facet counts or None
+        facets: column names counted by get_facet_counts
+        count_strategy: strategy which produced the total count.
+                        One of COUNT_STRATEGIES.
+                        exact: SELECT count(*) of query
+                        window: count(*) OVER () in the page query
+                        estimate: planner row estimate
+                        none: no total count
 
     Method:
-        filter: update query contained in value list of self.data
-        filter_by_min: update query greater than or equal to min_value
-        filter_by_max: update query less than or equal to max_value
+        add_criteria: adds a step to self.baked
+        add_filter: update query by a bound column comparison
+        get_filters: returns filters of self.data, validated and coerced
+        filter: update query by the filters of self.data
         get_page_info: returns page and page_size by self.data
+        get_cursor: returns cursor by self.data or None
+        get_fields: returns column names of fields of self.data or None
+        get_order: returns order by sort of self.data or None
+        sort: update order by sort of self.data
+        get_count_strategy: returns count strategy by self.data
+        select_columns: update query to select rows of columns
+        page_query: returns query of a page by offset or cursor
+        paginate_by_index: paginate by ids of self.columnar_index
         paginate: returns total number of query results and
-                  paginated results by query
+                  paginated results by query.
+                  With a cursor, returns the page after the cursor
+                  by a keyset condition instead of an offset.
+        apply_filters: update query by self.data
         get_results: update query and returns total number of results and
                      paginated results.
+        get_export_query: update query and returns query of every result
+        get_facet_counts: update query and returns total number of results
+                          and numbers of results by value of self.facets
+        facet_counts_by_bitmaps: get_facet_counts by self.bitmap_index
+        get_version: update query and returns the version of its rows
+        format_results: returns dictionaries of results by self.fields
+        results_json: returns JSON text of results of self.as_json
+
+    Results are rows of columns, formatted by format_results.
     '''
+    default_order = [('id', False)]
+    sortable = ['id']
+    schema = {}
+    aliases = {}
+    searchable = False
+    facets = []
+    columnar_index = None
+    bitmap_index = None
+
     def __init__(self, model, data):
         self.model = model
-        self.columns = [column.key for column in model.__table__.columns]
+        self.columns = filter_columns(model)
         self.data = data
-        self.query = model.query
+        self.baked = bakery(lambda session: session.query(model), model)
+        self.shape = []
+        self.params = {}
+        self.predicates = []
+        self.order = list(self.default_order)
+        self.expressions = {}
+        self.next_cursor = None
+        self.fields = None
+        self.count_strategy = None
+        self.as_json = False
 
-    def filter(self):
-        for key, value in self.data.items():
-            if key in self.columns:
-                model_attr = getattr(self.model, key)
-                self.query = self.query.filter(model_attr.in_(value))
+    @property
+    def query(self):
+        return self.baked.to_query(db.session()).params(**self.params)
 
-    def filter_by_min(self, column, key=None):
+    def add_criteria(self, fn, *shape):
         '''
         Args:
-            column : column name
-            key : data key
-
-            if key is min_column, key can be omitted
-            ex) column : age, key : min_age
+            fn : function updating a query.
+                 It must use bound parameters instead of values.
+            shape : hashable values which determine what fn does.
+                    They are a part of the cache key of the query.
         Returns:
             None
         '''
-        key = key or 'min_' + column
-        if key in self.data:
-            min_value = self.data[key][0]
-            model_column = getattr(self.model, column)
-            self.query = self.query.filter(model_column >= min_value)
+        self.baked.add_criteria(fn, *shape)
+        self.shape.append(shape)
 
-    def filter_by_max(self, column, key=None):
+    def add_filter(self, column, operator_name, value):
         '''
         Args:
             column : column name
-            key : data key
+            operator_name : key of OPERATORS
+            value : compared value of the type of column.
+                    list for 'in', (lower, upper) for 'between'
+                    and the beginning of the value for 'prefix'
 
-            if key is max_column, key can be omitted
-            ex) column : age, key : max_age
+            value is bound as parameter column__operator_name
+            ex) column : age, operator_name : gte -> age__gte
         Returns:
             None
         '''
-        key = key or 'max_' + column
-        if key in self.data:
-            max_value = self.data[key][0]
+        name = f'{column}__{operator_name}'
+        criterion = OPERATORS[operator_name](getattr(self.model, column),
+                                             name)
+        self.add_criteria(lambda query: query.filter(criterion),
+                          column, operator_name)
+        if operator_name == 'between':
+            self.params[f'{name}_lower'], self.params[f'{name}_upper'] = value
+        elif operator_name == 'prefix':
+            self.params[name] = escape_like(value) + '%'
+        else:
+            self.params[name] = value
+        self.predicates.append((column, operator_name, value))
+
+    def get_filters(self):
+        '''
+        Returns list of (column, operator_name, value) of the filter
+        parameters of self.data, sorted by parameter name so
+        the shape does not depend on the order of data.
+        Values are converted to the types of their columns.
+        ex) {'min_age': ['20'], 'gender': ['male', 'female']}
+            -> [('age', 'gte', 20), ('gender', 'in', ['male', 'female'])]
+        Raises ValueError for an unknown parameter, a repeated filter,
+        or a value which is not a value of its column.
+        '''
+        parameters = filter_parameters(type(self))
+        filters = {}
+        for key, values in self.data.items():
+            if key in CONTROL_PARAMETERS:
+                continue
+            if key == 'search_term' and self.searchable:
+                continue
+            if key not in parameters:
+                raise ValueError(f'Unknown parameter {key}')
+            column, operator_name = parameters[key]
+            name = f'{column}__{operator_name}'
+            if name in filters:
+                raise ValueError(f'Repeated filter {key}')
             model_column = getattr(self.model, column)
-            self.query = self.query.filter(model_column <= max_value)
+            if operator_name == 'in':
+                value = [coerce_value(model_column, value)
+                         for value in values]
+            elif len(values) != 1:
+                raise ValueError(f'Repeated filter {key}')
+            elif operator_name == 'between':
+                bounds = values[0].split(',')
+                if len(bounds) != 2:
+                    raise ValueError(f'Invalid range {values[0]}')
+                value = tuple(coerce_value(model_column, bound.strip())
+                              for bound in bounds)
+            elif operator_name == 'prefix':
+                value = values[0]
+            else:
+                value = coerce_value(model_column, values[0])
+            filters[name] = (column, operator_name, value)
+        return [filters[name] for name in sorted(filters)]
+
+    def filter(self):
+        for column, operator_name, value in self.get_filters():
+            self.add_filter(column, operator_name, value)
+
+    def filter_by_search_vector(self, search_term):
+        '''
+        Updates query to rows whose search_vector matches every word
+        of search_term as a prefix, and sorts them by ts_rank.
+        Uses the GIN index of search_vector.
+        '''
+        tsquery = prefix_tsquery(search_term)
+        if tsquery is None:
+            return
+        search_vector = self.model.search_vector
+        self.add_criteria(
+            lambda query: query.filter(
+                search_vector.op('@@')(search_tsquery())),
+            'search_vector')
+        self.params['search_query'] = tsquery
+        # numeric keeps the rank exact in cursors, real would not
+        # compare equal after a round trip through JSON.
+        rank = cast(func.ts_rank(search_vector, search_tsquery()), Numeric)
+        self.expressions['rank'] = rank
+        self.order = [('rank', True)] + self.order
 
     def get_page_info(self):
-        if 'page' in self.data:
-            page = int(self.data['page'][0])
+        '''
+        Returns page and page_size of self.data.
+        Raises ValueError if they are not integers, page is less than 1
+        or page_size is negative.
+        '''
+        try:
+            page = int(self.data.get('page', [1])[0])
+            page_size = int(self.data.get('page_size', [PAGE_SIZE])[0])
+        except ValueError:
+            raise ValueError('page and page_size must be integers')
+        if page < 1 or page_size < 0:
+            raise ValueError('Invalid page')
+        return page, page_size
+
+    def get_cursor(self):
+        if 'cursor' in self.data:
+            return self.data['cursor'][0]
+        return None
+
+    def get_fields(self):
+        '''
+        Returns column names of fields of self.data or None.
+        fields is separated by commas and may be repeated.
+        id is always included.
+        ex) fields=name,age -> ['id', 'name', 'age']
+        Raises ValueError if a field is not a column.
+        '''
+        if 'fields' not in self.data:
+            return None
+        fields = ['id']
+        for value in self.data['fields']:
+            for field in value.split(','):
+                field = field.strip()
+                if field not in self.columns:
+                    raise ValueError(f'Invalid field {field}')
+                if field not in fields:
+                    fields.append(field)
+        return fields
+
+    def get_order(self):
+        '''
+        Returns list of (key, descending) of sort of self.data or None.
+        sort is separated by commas and may be repeated. A key starting
+        with - is sorted in descending order. id is appended in the
+        direction of the last key, so the order is stable and
+        an index of (column, id) serves it.
+        ex) sort=age,-height -> [('age', False), ('height', True),
+                                 ('id', True)]
+        Raises ValueError if a key is not in self.sortable or repeated.
+        '''
+        if 'sort' not in self.data:
+            return None
+        order = []
+        keys = []
+        for value in self.data['sort']:
+            for key in value.split(','):
+                key = key.strip()
+                descending = key.startswith('-')
+                key = key.lstrip('-')
+                if key not in self.sortable:
+                    raise ValueError(f'Invalid sort key {key}')
+                if key in keys:
+                    raise ValueError(f'Repeated sort key {key}')
+                keys.append(key)
+                order.append((key, descending))
+        if 'id' not in keys:
+            order.append(('id', order[-1][1]))
+        return order
+
+    def sort(self):
+        '''
+        Updates order by sort of self.data.
+        It replaces the default order and the order by relevance.
+        '''
+        order = self.get_order()
+        if order is not None:
+            self.order = order
+
+    def order_keys(self):
+        return [key for key, descending in self.order]
+
+    def expression_keys(self):
+        return [key for key in self.order_keys() if key in self.expressions]
+
+    def order_expression(self, key):
+        if key in self.expressions:
+            return self.expressions[key]
+        return getattr(self.model, key)
+
+    def is_nullable(self, key):
+        if key in self.expressions:
+            return False
+        return self.model.__table__.columns[key].nullable
+
+    def order_clauses(self):
+        clauses = []
+        for key, descending in self.order:
+            column = self.order_expression(key)
+            clause = column.desc() if descending else column.asc()
+            if self.is_nullable(key):
+                clause = clause.nullslast()
+            clauses.append(clause)
+        return clauses
+
+    def after_criterion(self, key, value, descending):
+        '''
+        Returns criterion of rows sorted after value on key.
+        NULL is sorted last in both directions.
+        '''
+        column = self.order_expression(key)
+        if value is None:
+            return false()
+        criterion = column < value if descending else column > value
+        if self.is_nullable(key):
+            criterion = or_(criterion, column.is_(None))
+        return criterion
+
+    def equal_criterion(self, key, value):
+        column = self.order_expression(key)
+        if value is None:
+            return column.is_(None)
+        return column == value
+
+    def keyset_criterion(self, values):
+        directions = {descending for key, descending in self.order}
+        nullable = any(self.is_nullable(key) for key in self.order_keys())
+        if len(directions) == 1 and not nullable:
+            # A row value comparison is served by one index range scan.
+            columns = tuple_(*[self.order_expression(key)
+                               for key in self.order_keys()])
+            if directions.pop():
+                return columns < tuple_(*values)
+            return columns > tuple_(*values)
+
+        criteria = []
+        for index, (key, descending) in enumerate(self.order):
+            equals = [
+                self.equal_criterion(previous_key, previous_value)
+                for (previous_key, _), previous_value
+                in zip(self.order[:index], values)
+            ]
+            after = self.after_criterion(key, values[index], descending)
+            criteria.append(and_(*equals, after))
+        return or_(*criteria)
+
+    def cursor_of(self, result, expression_values):
+        '''
+        Args:
+            result: row of select_columns()
+            expression_values: dictionary({key: value}) of
+                               self.expressions selected with result
+        '''
+        values = [
+            expression_values[key] if key in expression_values
+            else getattr(result, key)
+            for key in self.order_keys()
+        ]
+        return encode_cursor(self.order_keys(), values)
+
+    def get_count_strategy(self):
+        if 'count' in self.data:
+            strategy = self.data['count'][0]
+            if strategy not in COUNT_STRATEGIES:
+                raise ValueError(f'Invalid count strategy {strategy}')
+            return strategy
+        return 'exact'
+
+    def estimate_count(self):
+        '''
+        Returns the planner row estimate of query.
+        pg_class.reltuples is used when query is not filtered.
+        '''
+        if not self.shape:
+            table_name = self.model.__tablename__
+            reltuples = db.session.execute(
+                text('SELECT reltuples FROM pg_class '
+                     'WHERE oid = CAST(:table_name AS regclass)'),
+                {'table_name': table_name}).scalar()
+            if reltuples is not None and reltuples > 0:
+                return int(reltuples)
+        plan = db.session.execute(Explain(self.query.statement)).scalar()
+        return int(plan[0]['Plan']['Plan Rows'])
+
+    def load_columns(self, fields):
+        '''Returns fields and the sort keys which are columns.'''
+        order_columns = [key for key in self.order_keys()
+                         if key not in self.expressions]
+        return fields + [key for key in order_columns if key not in fields]
+
+    def format_keys(self, fields):
+        '''Returns keys of a formatted result by fields.'''
+        if fields is None:
+            return self.model.format_keys
+        return tuple(fields)
+
+    def select_columns(self, query, fields, as_json=False):
+        '''
+        Returns query of the columns of fields, or of format(),
+        and of the sort keys, in this order, instead of self.model.
+        Plain rows skip the identity map and attribute instrumentation.
+        If as_json is True, the columns of fields are replaced by
+        their JSON text built by postgres, selected as json after
+        the sort keys. A column of the model comes first, so the
+        session finds the bind by its mapper instead of walking
+        the expression.
+        '''
+        keys = self.format_keys(fields)
+        if not as_json:
+            columns = self.load_columns(list(keys))
+            return query.with_entities(
+                *[plain_column(self.model, column) for column in columns])
+        columns = self.load_columns([])
+        return query.with_entities(
+            *[plain_column(self.model, column) for column in columns],
+            row_json(self.model, keys).label('json'))
+
+    def get_row_mapper(self):
+        '''Returns function formatting a result by self.fields.'''
+        return row_mapper(self.model, self.format_keys(self.fields))
+
+    def format_results(self, results):
+        '''
+        Returns dictionaries of results by self.fields,
+        like format() or format_fields() of instances.
+        '''
+        map_row = self.get_row_mapper()
+        return [map_row(result) for result in results]
+
+    def results_json(self, results):
+        '''Returns JSON text of the list of results of self.as_json.'''
+        return '[' + ','.join([result.json for result in results]) + ']'
+
+    def page_query(self, query, window, nulls, fields, as_json):
+        '''
+        Returns query of a page sorted by self.order.
+        Args:
+            query: filtered query
+            window: if True, selects count(*) OVER () as total_count
+            nulls: None for a page by offset or list of whether each
+                   value of the cursor is None for a page after it.
+                   The other values are bound as cursor_<index>.
+            fields: None or column names to load.
+                    Sort keys are loaded too for the next cursor.
+            as_json: if True, loads JSON text of fields as json
+        Rows are tuples of columns, not instances of self.model.
+        '''
+        query = self.select_columns(query, fields, as_json)
+        for key in self.expression_keys():
+            query = query.add_columns(self.expressions[key].label(key))
+        if window:
+            query = query.add_columns(
+                func.count().over().label('total_count'))
+        query = query.order_by(*self.order_clauses())
+        if nulls is not None:
+            values = [
+                None if null else bindparam(f'cursor_{index}')
+                for index, null in enumerate(nulls)
+            ]
+            query = query.filter(self.keyset_criterion(values))
+        query = query.limit(bindparam('limit'))
+        if nulls is None:
+            query = query.offset(bindparam('offset'))
+        return query
+
+    def paginate_by_index(self, page, page_size):
+        '''
+        Returns paginate() by ids matched by self.columnar_index.
+        Only rows of the page are read from postgres.
+        Raises UnsupportedFilter if the query is not served by the index.
+        '''
+        if (self.columnar_index is None
+                or len(self.predicates) != len(self.shape)
+                or self.order != self.default_order):
+            raise UnsupportedFilter('Query is not served by the index')
+        strategy = self.get_count_strategy()
+        cursor = self.get_cursor()
+        fields = self.get_fields()
+        if page_size < 0 or (cursor is None and page < 1):
+            raise ValueError('Invalid page')
+        ids = self.columnar_index.match(self.predicates)
+        if cursor is not None:
+            after_id, = decode_cursor(cursor, self.order_keys())
+            page_ids = ids[ids > int(after_id)][:page_size].tolist()
+            page = None
         else:
-            page = 1
+            offset = (page - 1) * page_size
+            page_ids = ids[offset:offset + page_size].tolist()
+
+        query = bakery(lambda session: session.query(self.model),
+                       self.model, 'ids')
+        query.add_criteria(lambda query: query.filter(
+            self.model.id.in_(bindparam('ids', expanding=True))))
+        as_json = self.as_json
+        query.add_criteria(
+            lambda query: self.select_columns(query, fields, as_json),
+            None if fields is None else tuple(fields), as_json)
+        rows = query(db.session()).params(ids=page_ids).all()
+        rows_by_id = {row.id: row for row in rows}
+        # Rows deleted after the snapshot are skipped.
+        ret = [rows_by_id[row_id] for row_id in page_ids
+               if row_id in rows_by_id]
 
-        if 'page_size' in self.data:
-            page_size = int(self.data['page_size'][0])
+        self.fields = fields
+        if strategy == 'none':
+            total_count = None
         else:
-            page_size = PAGE_SIZE
-        return page, page_size
+            strategy = 'exact'
+            total_count = len(ids)
+        self.count_strategy = strategy
+        if page_ids and len(page_ids) == page_size:
+            self.next_cursor = encode_cursor(self.order_keys(),
+                                             [page_ids[-1]])
+        else:
+            self.next_cursor = None
+        return total_count, page, ret
 
     def paginate(self, page=1, page_size=PAGE_SIZE):
-        total_count = self.query.count()
-        page = page - 1
-        ret = self.query.limit(page_size).offset(page * page_size).all()
-        return total_count, page+1, ret
+        if self.columnar_index is not None:
+            try:
+                return self.paginate_by_index(page, page_size)
+            except UnsupportedFilter:
+                pass
+        strategy = self.get_count_strategy()
+        cursor = self.get_cursor()
+        if cursor is not None and strategy == 'window':
+            # The keyset condition would hide rows before the cursor
+            # from count(*) OVER ().
+            strategy = 'exact'
 
-    def get_results(self):
+        expression_keys = self.expression_keys()
+        window = strategy == 'window'
+        params = dict(self.params, limit=page_size)
+        if cursor is not None:
+            values = decode_cursor(cursor, self.order_keys())
+            nulls = tuple(value is None for value in values)
+            for index, value in enumerate(values):
+                if value is not None:
+                    params[f'cursor_{index}'] = value
+            page = None
+        else:
+            nulls = None
+            params['offset'] = (page - 1) * page_size
+        fields = self.get_fields()
+        self.fields = fields
+        as_json = self.as_json
+        query = self.baked.with_criteria(
+            lambda query: self.page_query(query, window, nulls, fields,
+                                          as_json),
+            tuple(self.order), window, nulls,
+            None if fields is None else tuple(fields), as_json)
+        rows = query(db.session()).params(**params).all()
+
+        ret = rows
+        if strategy == 'window':
+            if rows:
+                total_count = rows[0].total_count
+            else:
+                strategy = 'exact'
+
+        if strategy == 'exact':
+            results = self.baked(db.session()).params(**self.params)
+            total_count = results.count()
+        elif strategy == 'estimate':
+            total_count = self.estimate_count()
+        elif strategy == 'none':
+            total_count = None
+        self.count_strategy = strategy
+
+        if ret and len(ret) == page_size:
+            expression_values = {
+                key: getattr(rows[-1], key) for key in expression_keys
+            }
+            self.next_cursor = self.cursor_of(ret[-1], expression_values)
+        else:
+            self.next_cursor = None
+        return total_count, page, ret
+
+    def apply_filters(self):
         self.filter()
+        if self.searchable and 'search_term' in self.data:
+            self.filter_by_search_vector(self.data['search_term'][0])
+
+    def get_results(self):
+        self.apply_filters()
+        self.sort()
         page, page_size = self.get_page_info()
         return self.paginate(page, page_size)
 
+    def facet_query(self, query):
+        '''
+        Returns query of the number of results grouped by each facet
+        and of all results, ex) GROUPING SETS(gender, passport, ()).
+        grouping is a bitmask of the facets not grouped in a row.
+        '''
+        columns = [getattr(self.model, facet) for facet in self.facets]
+        return query.with_entities(
+            *columns,
+            func.grouping(*columns).label('grouping'),
+            func.count().label('count')
+        ).group_by(func.grouping_sets(*columns, tuple_()))
+
+    def get_facet_counts(self):
+        '''
+        Updates query by self.data and returns the total number of
+        results and dictionary({facet: [{value, count}]}) of
+        the numbers of results by each value of self.facets,
+        sorted by count. Every count comes from one query
+        or from self.bitmap_index.
+        '''
+        self.apply_filters()
+        if self.bitmap_index is not None:
+            try:
+                return self.facet_counts_by_bitmaps()
+            except UnsupportedFilter:
+                pass
+        query = self.baked.with_criteria(self.facet_query,
+                                         tuple(self.facets))
+        rows = query(db.session()).params(**self.params).all()
+
+        size = len(self.facets)
+        all_bits = (1 << size) - 1
+        total_count = 0
+        counts = {facet: [] for facet in self.facets}
+        for row in rows:
+            if row.grouping == all_bits:
+                total_count = row.count
+                continue
+            for index, facet in enumerate(self.facets):
+                if row.grouping == all_bits ^ (1 << (size - 1 - index)):
+                    counts[facet].append({
+                        'value': row[index],
+                        'count': row.count,
+                    })
+        for values in counts.values():
+            values.sort(key=lambda value: (-value['count'],
+                                           str(value['value'])))
+        return total_count, counts
+
+    def get_version(self):
+        '''
+        Updates query by self.data and returns the row of
+        version_columns() of every result, by one aggregate query.
+        Results of any page, order or fields are the same
+        while it is the same.
+        '''
+        self.apply_filters()
+        query = self.baked.with_criteria(
+            lambda query: query.with_entities(*version_columns(self.model)),
+            'version')
+        return query(db.session()).params(**self.params).one()
+
+    def facet_counts_by_bitmaps(self):
+        '''
+        Returns get_facet_counts() by bitwise operations on
+        self.bitmap_index, without a query.
+        Raises UnsupportedFilter if the filters are not served by it.
+        '''
+        if len(self.predicates) != len(self.shape):
+            raise UnsupportedFilter('Query is not served by the bitmaps')
+        operands = []
+        for column, operator_name, value in self.predicates:
+            if operator_name != 'in':
+                raise UnsupportedFilter(f'{operator_name} is not served')
+            operands.append(('in', column, [
+                self.bitmap_index.parse(column, item) for item in value]))
+        bitmap = self.bitmap_index.evaluate(('and', operands))
+        return len(bitmap), self.bitmap_index.facet_counts(bitmap,
+                                                           self.facets)
+
+    def get_export_query(self, session, batch_size=EXPORT_BATCH_SIZE):
+        '''
+        Updates query by self.data and returns query of every result
+        sorted by self.order in session. Pagination is ignored.
+        Results are fetched batch_size rows at a time
+        from a server-side cursor.
+        '''
+        self.apply_filters()
+        self.sort()
+        self.fields = self.get_fields()
+        query = self.baked.to_query(session).params(**self.params)
+        query = self.select_columns(query, self.fields)
+        query = query.order_by(*self.order_clauses())
+        return query.yield_per(batch_size)
+
 
 class Actorfilter(Basefilter):
+    sortable = ['id', 'name', 'age', 'height']
+    schema = {
+        'id': ['ne'],
+        # ix_actors_name_pattern, a text_pattern_ops index for prefix
+        'name': ['ne', 'prefix'],
+        # ix_actors_age_id and ix_actors_gender_age
+        'age': ['ne', 'gte', 'lte', 'between'],
+        'gender': ['ne'],
+        'location': ['ne'],
+        'passport': ['ne'],
+        'driver_license': ['ne'],
+        'ethnicity': ['ne'],
+        'hair_color': ['ne'],
+        'eye_color': ['ne'],
+        'body_type': ['ne'],
+        # ix_actors_height_id and ix_actors_gender_height
+        'height': ['ne', 'gte', 'lte', 'between'],
+        'description': [],
+        'image_link': [],
+        'phone': [],
+        'email': [],
+    }
+    aliases = {
+        'min_age': 'age__gte',
+        'max_age': 'age__lte',
+        'min_height': 'height__gte',
+        'max_height': 'height__lte',
+    }
+    searchable = True
+    columnar_index = (
+        create_actor_index() if ACTOR_INDEX_ENABLED else None
+    )
+    bitmap_index = (
+        create_actor_bitmaps() if ACTOR_BITMAPS_ENABLED else None
+    )
+    facets = [
+        'gender', 'ethnicity', 'hair_color', 'eye_color', 'body_type',
+        'passport', 'driver_license'
+    ]
+
     def __init__(self, data):
         Basefilter.__init__(self, Actor, data)
 
-    def filter_name_by_search_term(self):
-        if 'search_term' in self.data:
-            search_term = self.data['search_term'][0]
-            criterion = self.model.name.ilike(f'%{search_term}%')
-            self.query = self.query.filter(criterion)
-
-    def get_results(self):
-        self.filter()
-        self.filter_name_by_search_term()
-        self.filter_by_min('age')
-        self.filter_by_max('age')
-        self.filter_by_min('height')
-        self.filter_by_max('height')
-        page, page_size = self.get_page_info()
-        return self.paginate(page, page_size)
-
 
 class Moviefilter(Basefilter):
+    sortable = ['id', 'title', 'release_date']
+    schema = {
+        'id': ['ne'],
+        # ix_movies_title_pattern, a text_pattern_ops index for prefix
+        'title': ['ne', 'prefix'],
+        # ix_movies_release_date_id
+        'release_date': ['ne', 'gte', 'lte', 'between'],
+        'company': ['ne'],
+        'description': [],
+    }
+    aliases = {
+        'min_release_date': 'release_date__gte',
+        'max_release_date': 'release_date__lte',
+    }
+    searchable = True
+
     def __init__(self, data):
         Basefilter.__init__(self, Movie, data)
 
-    def filter_title_by_search_term(self):
-        if 'search_term' in self.data:
-            search_term = self.data['search_term'][0]
-            criterion = self.model.title.ilike(f'%{search_term}%')
-            self.query = self.query.filter(criterion)
-
-    def get_results(self):
-        self.filter()
-        self.filter_by_min('release_date')
-        self.filter_by_max('release_date')
-        self.filter_title_by_search_term()
-        page, page_size = self.get_page_info()
-        return self.paginate(page, page_size)
-
 
 class Rolefilter(Basefilter):
+    sortable = ['id', 'min_age', 'max_age']
+    schema = {
+        'id': ['ne'],
+        # ix_roles_movie_id
+        'movie_id': ['ne'],
+        # ix_roles_actor_id
+        'actor_id': ['ne'],
+        'name': ['ne'],
+        # ix_roles_gender_min_age
+        'gender': ['ne'],
+        # ix_roles_min_age_id and ix_roles_gender_min_age
+        'min_age': ['ne', 'gte', 'lte', 'between'],
+        # ix_roles_max_age_id
+        'max_age': ['ne', 'gte', 'lte', 'between'],
+        'description': [],
+    }
+    aliases = {
+        'min_age': 'min_age__gte',
+        'max_age': 'max_age__lte',
+    }
+
     def __init__(self, data):
         Basefilter.__init__(self, Role, data)
-
-    def get_results(self):
-        self.filter()
-        self.filter_by_min('min_age', 'min_age')
-        self.filter_by_max('max_age', 'max_age')
-        page, page_size = self.get_page_info()
-        return self.paginate(page, page_size)
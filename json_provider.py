@@ -0,0 +1,97 @@
+import datetime
+import json
+
+from flask import current_app
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def default(value):
+    '''Returns dates and times as ISO 8601 strings, like orjson.'''
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+class JSONProvider:
+    '''The class encodes JSON responses with the json module.
+    Output is compact in every environment, keys are sorted and text
+    is UTF-8 instead of ASCII escapes, so every provider writes
+    the same bytes.
+
+    Method:
+        dumps: returns JSON bytes of a value
+        loads: returns the value of JSON text or bytes
+        response: returns a response of the JSON of a value
+    '''
+    name = 'json'
+
+    def dumps(self, value):
+        return json.dumps(value, default=default, sort_keys=True,
+                          separators=(',', ':'),
+                          ensure_ascii=False).encode()
+
+    def loads(self, data):
+        return json.loads(data)
+
+    def response(self, value):
+        return current_app.response_class(self.dumps(value) + b'\n',
+                                          mimetype='application/json')
+
+
+class OrjsonProvider(JSONProvider):
+    '''The class encodes JSON with orjson, which encodes dates natively.
+    '''
+    name = 'orjson'
+
+    def dumps(self, value):
+        return orjson.dumps(
+            value, default=default,
+            option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+
+PROVIDERS = {
+    JSONProvider.name: JSONProvider,
+    OrjsonProvider.name: OrjsonProvider,
+}
+
+
+def get_provider(name='orjson'):
+    '''
+    Returns the provider of name.
+    orjson falls back to json when it is not installed.
+    Raises KeyError for an unknown name.
+    '''
+    provider_class = PROVIDERS[name]
+    if provider_class is OrjsonProvider and orjson is None:
+        provider_class = JSONProvider
+    return provider_class()
+
+
+def setup_json(app):
+    app.extensions['json_provider'] = get_provider(
+        app.config.get('JSON_PROVIDER', 'orjson'))
+
+
+def json_provider():
+    return current_app.extensions['json_provider']
+
+
+def jsonify(*args, **kwargs):
+    '''
+    Returns a response like flask.jsonify() encoded by the provider
+    of the app, compact even when the app is in debug mode.
+    '''
+    if args and kwargs:
+        raise TypeError('jsonify() takes either args or kwargs, not both')
+    if len(args) == 1:
+        value = args[0]
+    else:
+        value = args or kwargs
+    return json_provider().response(value)
@@ -0,0 +1,246 @@
+import base64
+import json
+import re
+import threading
+import time
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.asymmetric.rsa import RSAPublicNumbers
+from urllib.request import urlopen
+
+DEFAULT_TTL = 600
+MIN_REFETCH_INTERVAL = 30
+FETCH_TIMEOUT = 5
+DEFAULT_MAX_STALE = 3600
+REFRESH_MARGIN = 60
+
+MAX_AGE_PATTERN = re.compile(r'max-age\s*=\s*(\d+)')
+
+
+def parse_max_age(cache_control):
+    '''
+    Args:
+        cache_control: value of Cache-Control header or None
+    Returns:
+        max-age in seconds or None if the header has no max-age.
+        no-cache and no-store are treated as max-age 0.
+    '''
+    if not cache_control:
+        return None
+    directives = cache_control.lower()
+    if 'no-store' in directives or 'no-cache' in directives:
+        return 0
+    match = MAX_AGE_PATTERN.search(directives)
+    if match is None:
+        return None
+    return int(match.group(1))
+
+
+def base64url_to_int(value):
+    padded = value + '=' * (-len(value) % 4)
+    return int.from_bytes(base64.urlsafe_b64decode(padded), 'big')
+
+
+def build_public_key(key):
+    '''
+    Args:
+        key: jwk dictionary
+    Returns:
+        RSA public key object or None if key is not a valid RSA jwk.
+    '''
+    if key.get('kty') != 'RSA':
+        return None
+    try:
+        numbers = RSAPublicNumbers(base64url_to_int(key['e']),
+                                   base64url_to_int(key['n']))
+        return numbers.public_key(default_backend())
+    except (KeyError, ValueError, TypeError):
+        return None
+
+
+class JWKSError(Exception):
+    pass
+
+
+class JWKSStore:
+    '''The class keeps the JSON Web Key Set in process memory and
+    refetches it only when it expires or an unknown kid shows up.
+    If a refetch fails, the last-good keys are served until they are
+    older than max_stale seconds past their expiry.
+
+    Attribute:
+        url: JWKS url. file:// urls are supported by urlopen,
+             so a local JWKS file can be used in tests.
+        ttl: seconds to keep keys when the response has no max-age
+        min_refetch_interval: minimum seconds between two refetches
+                              triggered by an unknown kid or a failure
+        timeout: seconds to wait for the JWKS response
+        max_stale: seconds the last-good keys are served after expiry
+                   while refetches fail
+        clock: function returning monotonic seconds
+        keys: dictionary({kid: jwk dict})
+        public_keys: dictionary({kid: RSA public key object}).
+                     Built once per fetch so tokens are verified
+                     without parsing the jwk again.
+        last_success: epoch seconds of the last successful fetch
+
+    Method:
+        fetch: downloads the key set and replaces the cached keys
+        refresh: fetch, keeping the last-good keys on failure
+        get_key: returns the jwk dict for kid or None
+        get_public_key: returns the RSA public key object for kid or None
+        status: returns a dictionary for the readiness probe
+    '''
+    def __init__(self, url, ttl=DEFAULT_TTL,
+                 min_refetch_interval=MIN_REFETCH_INTERVAL,
+                 timeout=FETCH_TIMEOUT, max_stale=DEFAULT_MAX_STALE,
+                 clock=time.monotonic):
+        self.url = url
+        self.ttl = ttl
+        self.min_refetch_interval = min_refetch_interval
+        self.timeout = timeout
+        self.max_stale = max_stale
+        self.clock = clock
+        self.keys = {}
+        self.public_keys = {}
+        self.expires_at = None
+        self.last_fetch = None
+        self.last_success = None
+        self.retry_at = None
+        self.last_error = None
+        self.fetch_count = 0
+        self.failure_count = 0
+        self.lock = threading.Lock()
+
+    def fetch(self):
+        with urlopen(self.url, timeout=self.timeout) as response:
+            jwks = json.loads(response.read())
+            max_age = parse_max_age(response.headers.get('Cache-Control'))
+        if max_age is None:
+            max_age = self.ttl
+        now = self.clock()
+        keys = {key['kid']: key for key in jwks['keys'] if 'kid' in key}
+        public_keys = {}
+        for kid, key in keys.items():
+            public_key = build_public_key(key)
+            if public_key is not None:
+                public_keys[kid] = public_key
+        self.public_keys = public_keys
+        self.keys = keys
+        self.expires_at = now + max_age
+        self.last_fetch = now
+        self.last_success = time.time()
+        self.retry_at = None
+        self.last_error = None
+        self.fetch_count += 1
+        return self.keys
+
+    def refresh(self):
+        '''
+        Fetches the key set. If the fetch fails, the last-good keys are
+        kept while they are usable and the next refetch is delayed by
+        min_refetch_interval.
+        Raises:
+            JWKSError: if the fetch fails and no usable keys are left
+        '''
+        try:
+            return self.fetch()
+        except Exception as e:
+            self.retry_at = self.clock() + self.min_refetch_interval
+            self.last_error = str(e)
+            self.failure_count += 1
+            if not self.is_usable():
+                raise JWKSError(f'Unable to fetch JWKS: {e}')
+            return self.keys
+
+    def is_expired(self):
+        return self.expires_at is None or self.clock() >= self.expires_at
+
+    def is_usable(self):
+        if self.expires_at is None:
+            return False
+        return self.clock() < self.expires_at + self.max_stale
+
+    def should_refresh(self):
+        if not self.is_expired():
+            return False
+        return self.retry_at is None or self.clock() >= self.retry_at
+
+    def can_refetch(self):
+        now = self.clock()
+        if self.retry_at is not None and now < self.retry_at:
+            return False
+        if self.last_fetch is None:
+            return True
+        return now - self.last_fetch >= self.min_refetch_interval
+
+    def get_key(self, kid):
+        if self.should_refresh():
+            with self.lock:
+                if self.should_refresh():
+                    self.refresh()
+        if not self.is_usable():
+            raise JWKSError(f'JWKS is unavailable: {self.last_error}')
+
+        key = self.keys.get(kid)
+        if key is None and self.can_refetch():
+            with self.lock:
+                if kid not in self.keys and self.can_refetch():
+                    self.refresh()
+            key = self.keys.get(kid)
+        return key
+
+    def get_public_key(self, kid):
+        if self.get_key(kid) is None:
+            return None
+        return self.public_keys.get(kid)
+
+    def status(self):
+        return {
+            'usable': self.is_usable(),
+            'stale': self.is_expired() and self.is_usable(),
+            'last_success': self.last_success,
+            'last_error': self.last_error,
+            'fetch_count': self.fetch_count,
+            'failure_count': self.failure_count,
+        }
+
+
+class JWKSRefresher(threading.Thread):
+    '''The daemon thread renews the keys of store refresh_margin
+    seconds before they expire, so no request pays for the refetch.
+    It never refreshes more often than min_refetch_interval of store,
+    so keys with a short or zero max-age are not polled in a loop.
+    After a failed refresh it retries every retry_interval seconds.
+
+    Method:
+        next_delay: returns seconds to wait before the next refresh
+        stop: stops the thread
+    '''
+    def __init__(self, store, refresh_margin=REFRESH_MARGIN,
+                 retry_interval=MIN_REFETCH_INTERVAL):
+        threading.Thread.__init__(self, name='jwks-refresher', daemon=True)
+        self.store = store
+        self.refresh_margin = refresh_margin
+        self.retry_interval = retry_interval
+        self.stopped = threading.Event()
+
+    def next_delay(self):
+        store = self.store
+        if store.expires_at is None or store.retry_at is not None:
+            return self.retry_interval
+        delay = store.expires_at - self.refresh_margin - store.clock()
+        return max(delay, store.min_refetch_interval)
+
+    def run(self):
+        while True:
+            with self.store.lock:
+                try:
+                    self.store.refresh()
+                except JWKSError:
+                    pass
+            if self.stopped.wait(self.next_delay()):
+                break
+
+    def stop(self):
+        self.stopped.set()
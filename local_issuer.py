@@ -0,0 +1,145 @@
+'''
+Local token issuer for running the authenticated endpoints without Auth0.
+
+It keeps an RSA key pair in LOCAL_AUTH_DIR and writes the public key as a
+JWKS file which auth.py reads through JWKS_URL=file://...
+
+Usage:
+    python local_issuer.py init
+    python local_issuer.py token producer [--expires-in 3600]
+    eval "$(python local_issuer.py env)"
+
+The issuer and audience claims are taken from AUTH0_DOMAIN and
+API_AUDIENCE like auth.py does.
+'''
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwt
+
+from permissions import ROLE_PERMISSIONS
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+
+LOCAL_AUTH_DIR = os.environ.get(
+    'LOCAL_AUTH_DIR', os.path.join(basedir, '.local_auth'))
+PRIVATE_KEY_FILE = 'private_key.pem'
+JWKS_FILE = 'jwks.json'
+KID = 'local-issuer'
+ALGORITHM = 'RS256'
+DEFAULT_EXPIRES_IN = 24 * 60 * 60
+
+
+def int_to_base64url(value):
+    length = (value.bit_length() + 7) // 8
+    data = value.to_bytes(length, 'big')
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def private_key_path(key_dir=LOCAL_AUTH_DIR):
+    return os.path.join(key_dir, PRIVATE_KEY_FILE)
+
+
+def jwks_path(key_dir=LOCAL_AUTH_DIR):
+    return os.path.join(key_dir, JWKS_FILE)
+
+
+def init_keys(key_dir=LOCAL_AUTH_DIR, overwrite=False):
+    '''
+    Generates an RSA key pair and writes private_key.pem and jwks.json
+    into key_dir. Existing keys are kept unless overwrite is True.
+    '''
+    if os.path.exists(private_key_path(key_dir)) and not overwrite:
+        return
+    os.makedirs(key_dir, exist_ok=True)
+    private_key = rsa.generate_private_key(65537, 2048, default_backend())
+    pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption())
+    numbers = private_key.public_key().public_numbers()
+    jwks = {
+        'keys': [{
+            'kty': 'RSA',
+            'kid': KID,
+            'use': 'sig',
+            'alg': ALGORITHM,
+            'n': int_to_base64url(numbers.n),
+            'e': int_to_base64url(numbers.e),
+        }]
+    }
+    with open(private_key_path(key_dir), 'wb') as f:
+        f.write(pem)
+    os.chmod(private_key_path(key_dir), 0o600)
+    with open(jwks_path(key_dir), 'w') as f:
+        json.dump(jwks, f)
+
+
+def issue_token(role, expires_in=DEFAULT_EXPIRES_IN, key_dir=LOCAL_AUTH_DIR):
+    '''
+    Args:
+        role: one of ROLE_PERMISSIONS keys
+        expires_in: token lifetime in seconds
+    Returns:
+        RS256 signed token having the permissions of role
+    '''
+    if role not in ROLE_PERMISSIONS:
+        raise ValueError(f'Invalid role {role}')
+    init_keys(key_dir)
+    with open(private_key_path(key_dir)) as f:
+        private_key = f.read()
+    now = int(time.time())
+    claims = {
+        'iss': f"https://{os.environ['AUTH0_DOMAIN']}/",
+        'sub': f'local|{role}',
+        'aud': os.environ['API_AUDIENCE'],
+        'iat': now,
+        'exp': now + expires_in,
+        'permissions': ROLE_PERMISSIONS[role],
+    }
+    return jwt.encode(claims, private_key, algorithm=ALGORITHM,
+                      headers={'kid': KID})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Local token issuer')
+    parser.add_argument('--key-dir', default=LOCAL_AUTH_DIR)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    init_parser = commands.add_parser('init', help='generate a key pair')
+    init_parser.add_argument('--overwrite', action='store_true')
+
+    token_parser = commands.add_parser('token', help='print a token')
+    token_parser.add_argument('role', choices=sorted(ROLE_PERMISSIONS))
+    token_parser.add_argument('--expires-in', type=int,
+                              default=DEFAULT_EXPIRES_IN)
+
+    env_parser = commands.add_parser(
+        'env', help='print shell exports for JWKS_URL and role tokens')
+    env_parser.add_argument('--expires-in', type=int,
+                            default=DEFAULT_EXPIRES_IN)
+
+    args = parser.parse_args(argv)
+    if args.command == 'init':
+        init_keys(args.key_dir, args.overwrite)
+        print(jwks_path(args.key_dir))
+    elif args.command == 'token':
+        print(issue_token(args.role, args.expires_in, args.key_dir))
+    elif args.command == 'env':
+        init_keys(args.key_dir)
+        path = os.path.abspath(jwks_path(args.key_dir))
+        print(f"export JWKS_URL='file://{path}'")
+        for role in ROLE_PERMISSIONS:
+            token = issue_token(role, args.expires_in, args.key_dir)
+            print(f"export {role.upper()}='{token}'")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
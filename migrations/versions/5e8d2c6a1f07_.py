@@ -0,0 +1,43 @@
+"""add indexes for foreign keys and filterable columns
+
+Revision ID: 5e8d2c6a1f07
+Revises: 9c1f4e2b7a31
+Create Date: 2026-10-18 11:02:47.118305
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5e8d2c6a1f07'
+down_revision = '9c1f4e2b7a31'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_roles_movie_id', 'roles', ['movie_id']),
+    ('ix_roles_actor_id', 'roles', ['actor_id']),
+    ('ix_roles_min_age', 'roles', ['min_age']),
+    ('ix_roles_max_age', 'roles', ['max_age']),
+    ('ix_roles_gender_min_age', 'roles', ['gender', 'min_age']),
+    ('ix_actors_age', 'actors', ['age']),
+    ('ix_actors_height', 'actors', ['height']),
+    ('ix_actors_gender_age', 'actors', ['gender', 'age']),
+    ('ix_actors_gender_height', 'actors', ['gender', 'height']),
+    ('ix_movies_release_date', 'movies', ['release_date']),
+]
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY can not run inside a transaction.
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False,
+                            postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in reversed(INDEXES):
+            op.drop_index(name, table_name=table,
+                          postgresql_concurrently=True)
@@ -0,0 +1,59 @@
+"""add full-text search vectors to actors and movies
+
+Revision ID: 9c1f4e2b7a31
+Revises: 4a7dd499ce2d
+Create Date: 2026-10-18 10:12:03.514220
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '9c1f4e2b7a31'
+down_revision = '4a7dd499ce2d'
+branch_labels = None
+depends_on = None
+
+
+def search_vector_expression(title_column, description_column):
+    return (
+        f"setweight(to_tsvector('simple', "
+        f"coalesce({title_column}, '')), 'A') || "
+        f"setweight(to_tsvector('simple', "
+        f"coalesce({description_column}, '')), 'B')"
+    )
+
+
+SEARCH_VECTORS = [
+    ('actors', 'name', 'ix_actors_search_vector'),
+    ('movies', 'title', 'ix_movies_search_vector'),
+]
+
+
+def upgrade():
+    # Adding a stored generated column rewrites the table, so it is
+    # kept short and the indexes are built after it is committed.
+    for table, title_column, index in SEARCH_VECTORS:
+        op.add_column(table, sa.Column(
+            'search_vector',
+            postgresql.TSVECTOR(),
+            sa.Computed(search_vector_expression(title_column,
+                                                 'description')),
+            nullable=True))
+    # CREATE INDEX CONCURRENTLY can not run inside a transaction.
+    with op.get_context().autocommit_block():
+        for table, title_column, index in SEARCH_VECTORS:
+            op.create_index(index, table, ['search_vector'], unique=False,
+                            postgresql_using='gin',
+                            postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for table, title_column, index in reversed(SEARCH_VECTORS):
+            op.drop_index(index, table_name=table,
+                          postgresql_concurrently=True)
+    for table, title_column, index in reversed(SEARCH_VECTORS):
+        op.drop_column(table, 'search_vector')
@@ -0,0 +1,50 @@
+"""index sortable columns together with id
+
+Revision ID: b3d71e0c5a92
+Revises: 5e8d2c6a1f07
+Create Date: 2026-10-18 14:20:31.402817
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3d71e0c5a92'
+down_revision = '5e8d2c6a1f07'
+branch_labels = None
+depends_on = None
+
+# (name, table, columns, replaced index name or None)
+# An index of (column, id) serves ORDER BY column, id LIMIT n
+# and every filter the index of column served.
+INDEXES = [
+    ('ix_actors_name_id', 'actors', ['name', 'id'], None),
+    ('ix_actors_age_id', 'actors', ['age', 'id'], 'ix_actors_age'),
+    ('ix_actors_height_id', 'actors', ['height', 'id'], 'ix_actors_height'),
+    ('ix_movies_title_id', 'movies', ['title', 'id'], None),
+    ('ix_movies_release_date_id', 'movies', ['release_date', 'id'],
+     'ix_movies_release_date'),
+    ('ix_roles_min_age_id', 'roles', ['min_age', 'id'], 'ix_roles_min_age'),
+    ('ix_roles_max_age_id', 'roles', ['max_age', 'id'], 'ix_roles_max_age'),
+]
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY can not run inside a transaction.
+    with op.get_context().autocommit_block():
+        for name, table, columns, replaced in INDEXES:
+            op.create_index(name, table, columns, unique=False,
+                            postgresql_concurrently=True)
+            if replaced is not None:
+                op.drop_index(replaced, table_name=table,
+                              postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns, replaced in reversed(INDEXES):
+            if replaced is not None:
+                op.create_index(replaced, table, columns[:1], unique=False,
+                                postgresql_concurrently=True)
+            op.drop_index(name, table_name=table,
+                          postgresql_concurrently=True)
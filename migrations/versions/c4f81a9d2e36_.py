@@ -0,0 +1,82 @@
+"""updated_at of actors, movies and roles kept by triggers
+
+The triggers also notify writes outside the models to every process.
+
+Revision ID: c4f81a9d2e36
+Revises: e6a24f8d1c57
+Create Date: 2026-10-18 19:24:41.318205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4f81a9d2e36'
+down_revision = 'e6a24f8d1c57'
+branch_labels = None
+depends_on = None
+
+TABLES = ['actors', 'movies', 'roles']
+# CHANNEL of result_cache.py
+CHANNEL = 'table_writes'
+
+
+def upgrade():
+    # now() is stable, so postgres 11+ adds the column without
+    # rewriting the table, and existing rows get the time of migration.
+    for table in TABLES:
+        op.add_column(table, sa.Column(
+            'updated_at', sa.DateTime(timezone=True),
+            server_default=sa.text('now()'), nullable=False))
+    # Writes outside the models, ex) psql or bulk updates, set it too.
+    op.execute("""
+        CREATE FUNCTION set_updated_at() RETURNS trigger AS $$
+        BEGIN
+            NEW.updated_at = now();
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    for table in TABLES:
+        op.execute(f"""
+            CREATE TRIGGER {table}_updated_at
+            BEFORE UPDATE ON {table}
+            FOR EACH ROW EXECUTE PROCEDURE set_updated_at()
+        """)
+    # They also notify GenerationListener like BaseModel.notify_write,
+    # so cached lists and their validators are dropped. Postgres sends
+    # a payload once per transaction, so writes of the models are not
+    # notified twice.
+    op.execute(f"""
+        CREATE FUNCTION notify_table_write() RETURNS trigger AS $$
+        DECLARE
+            row_id integer;
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                row_id = OLD.id;
+            ELSE
+                row_id = NEW.id;
+            END IF;
+            PERFORM pg_notify('{CHANNEL}', TG_TABLE_NAME || ':' || row_id);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    for table in TABLES:
+        op.execute(f"""
+            CREATE TRIGGER {table}_notify_write
+            AFTER INSERT OR UPDATE OR DELETE ON {table}
+            FOR EACH ROW EXECUTE PROCEDURE notify_table_write()
+        """)
+
+
+def downgrade():
+    for table in reversed(TABLES):
+        op.execute(f'DROP TRIGGER {table}_notify_write ON {table}')
+    op.execute('DROP FUNCTION notify_table_write()')
+    for table in reversed(TABLES):
+        op.execute(f'DROP TRIGGER {table}_updated_at ON {table}')
+    op.execute('DROP FUNCTION set_updated_at()')
+    for table in reversed(TABLES):
+        op.drop_column(table, 'updated_at')
@@ -0,0 +1,33 @@
+"""index actors by height in descending order, NULLs last
+
+Revision ID: d7b39e5f0a48
+Revises: c4f81a9d2e36
+Create Date: 2026-10-18 21:06:12.504913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7b39e5f0a48'
+down_revision = 'c4f81a9d2e36'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # sort=-height orders by height DESC NULLS LAST, id DESC. A backward
+    # scan of ix_actors_height_id gives NULLs first, so it needs its own.
+    # CREATE INDEX CONCURRENTLY can not run inside a transaction.
+    with op.get_context().autocommit_block():
+        op.create_index('ix_actors_height_desc_id', 'actors',
+                        [sa.text('height DESC NULLS LAST'),
+                         sa.text('id DESC')],
+                        unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_actors_height_desc_id', table_name='actors',
+                      postgresql_concurrently=True)
@@ -0,0 +1,38 @@
+"""index names and titles for prefix filters
+
+Revision ID: e6a24f8d1c57
+Revises: b3d71e0c5a92
+Create Date: 2026-10-18 16:05:12.730114
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6a24f8d1c57'
+down_revision = 'b3d71e0c5a92'
+branch_labels = None
+depends_on = None
+
+# LIKE 'prefix%' uses a btree index only with text_pattern_ops
+# unless the database collation is C.
+INDEXES = [
+    ('ix_actors_name_pattern', 'actors', 'name'),
+    ('ix_movies_title_pattern', 'movies', 'title'),
+]
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY can not run inside a transaction.
+    with op.get_context().autocommit_block():
+        for name, table, column in INDEXES:
+            op.create_index(name, table, [column], unique=False,
+                            postgresql_ops={column: 'text_pattern_ops'},
+                            postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, column in reversed(INDEXES):
+            op.drop_index(name, table_name=table,
+                          postgresql_concurrently=True)
@@ -1,3 +1,4 @@
+import functools
 import json
 import os
 import re
@@ -7,24 +8,48 @@ import validators
 
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import (
+    BigInteger,
     Column,
     String,
     Integer,
     Date,
+    DateTime,
     Boolean,
     ForeignKey,
     Enum,
-    create_engine
+    Computed,
+    Index,
+    Text,
+    cast,
+    create_engine,
+    func,
+    literal_column,
+    text,
+    type_coerce
+)
+from sqlalchemy.dialects.postgresql import (
+    JSON,
+    TSVECTOR
 )
-from sqlalchemy.dialects.postgresql import JSON
 from sqlalchemy.orm import (
+    deferred,
     relationship,
     validates
 )
 from sqlalchemy_utils import ChoiceType
 
+from result_cache import (
+    CHANNEL,
+    GenerationListener,
+    TableGenerations
+)
+
 db = SQLAlchemy()
 
+# Generations of tables, bumped by writes of this and other processes
+table_generations = TableGenerations()
+generation_listener = None
+
 ETHNICITY_TYPE = [
     'asian',
     'black',
@@ -83,6 +108,24 @@ GENDER_TYPE = [
 
 GENDER_TYPE_ENUM = Enum(*GENDER_TYPE, name='gender')
 
+# Names and titles are not english words, so they are neither stemmed
+# nor cut by stopwords, ex) 'english' drops 'will' of 'Will Smith'.
+# Every word is matched as a prefix, which stemming would only break.
+SEARCH_CONFIG = 'simple'
+
+
+def search_vector_expression(title_column, description_column):
+    '''
+    Returns SQL of a tsvector weighting title_column over
+    description_column. Used by generated search_vector columns.
+    '''
+    return (
+        f"setweight(to_tsvector('{SEARCH_CONFIG}', "
+        f"coalesce({title_column}, '')), 'A') || "
+        f"setweight(to_tsvector('{SEARCH_CONFIG}', "
+        f"coalesce({description_column}, '')), 'B')"
+    )
+
 
 def setup_db(app):
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
@@ -90,19 +133,158 @@ def setup_db(app):
     db.init_app(app)
 
 
+def start_generation_listener(app):
+    '''
+    Starts the background listener of table writes once per process.
+    '''
+    global generation_listener
+    if generation_listener is None:
+        engine = db.get_engine(app)
+
+        def connect():
+            connection = engine.raw_connection()
+            connection.detach()
+            return connection.connection
+
+        generation_listener = GenerationListener(table_generations, connect)
+        generation_listener.start()
+    return generation_listener
+
+
+def format_date(value):
+    # isoformat is strftime('%Y-%m-%d') but several times faster,
+    # except that it pads years before 1000.
+    if value.year >= 1000:
+        return value.isoformat()
+    return value.strftime('%Y-%m-%d')
+
+
+def plain_column(model, key):
+    '''
+    Returns column key of model to select in rows for row_mapper().
+    Postgres enums are read as the strings they already are,
+    without the result processing of Enum.
+    '''
+    column = getattr(model, key)
+    if isinstance(column.type, Enum):
+        return type_coerce(column, String).label(key)
+    return column
+
+
+@functools.lru_cache(maxsize=None)
+def row_mapper(model, keys):
+    '''
+    Returns function mapping a row whose first values are the columns
+    keys of model to format_fields(keys) of it, without an instance.
+    Extra values of the row, ex) sort keys, are ignored.
+    ex) row_mapper(Movie, ('id', 'release_date'))
+        -> (1, date(2021, 1, 1)) -> {'id': 1, 'release_date': '2021-01-01'}
+    '''
+    formatters = [
+        (index, model.value_formatters[key])
+        for index, key in enumerate(keys) if key in model.value_formatters
+    ]
+    if not formatters:
+        return lambda row: dict(zip(keys, row))
+
+    def map_row(row):
+        values = list(row[:len(keys)])
+        for index, formatter in formatters:
+            values[index] = formatter(values[index])
+        return dict(zip(keys, values))
+    return map_row
+
+
+def row_json(model, keys):
+    '''
+    Returns SQL expression of the JSON text of row_mapper(model, keys)
+    of a row as jsonify() writes it, keys sorted and without spaces,
+    so postgres builds it instead of Python.
+    ex) row_json(Movie, ('title', 'id')) -> '{"id":1,"title":"Up"}'
+    '''
+    parts = []
+    for index, key in enumerate(sorted(keys)):
+        prefix = ('{' if index == 0 else ',') + json.dumps(key) + ':'
+        parts.append(literal_column("'" + prefix.replace("'", "''") + "'"))
+        parts.append(func.coalesce(
+            cast(func.to_json(getattr(model, key)), Text),
+            literal_column("'null'")))
+    parts.append(literal_column("'}'"))
+    return func.concat(*parts)
+
+
+def version_columns(model):
+    '''
+    Returns the columns of an aggregate which changes whenever rows
+    of model are inserted, updated or deleted:
+    count, the last updated_at and the sum of updated_at in
+    microseconds. The sum catches a write committed after a later
+    one, whose updated_at, the start of its transaction, is earlier.
+    '''
+    microseconds = cast(func.extract('epoch', model.updated_at) * 1000000,
+                        BigInteger)
+    return [
+        func.count().label('count'),
+        func.max(model.updated_at).label('updated_at'),
+        func.sum(microseconds).label('checksum'),
+    ]
+
+
 class BaseModel(db.Model):
+    '''
+    Writes bump the generation of the table, here at once and
+    in other processes by a notification sent when the write commits.
+
+    format_keys are the keys of format() in order and value_formatters
+    convert the values of columns which are not JSON values as they are.
+    row_mapper() formats rows of columns by them.
+
+    updated_at is the time of the last write of a row. It is set here
+    and by a trigger for writes outside the models. It is not a part of
+    format(); version_columns() aggregate it for conditional requests.
+    '''
     __abstract__ = True
+    format_keys = ()
+    value_formatters = {}
+    updated_at = Column(DateTime(timezone=True), nullable=False,
+                        server_default=func.now(), onupdate=func.now())
+
+    def notify_write(self, row_id):
+        db.session.execute(text('SELECT pg_notify(:channel, :payload)'), {
+            'channel': CHANNEL,
+            'payload': f'{self.__tablename__}:{row_id}',
+        })
+
+    def commit_write(self):
+        # Flushed first, so a new row has its id.
+        db.session.flush()
+        row_id = self.id
+        self.notify_write(row_id)
+        db.session.commit()
+        table_generations.bump(self.__tablename__, row_id)
 
     def insert(self):
         db.session.add(self)
-        db.session.commit()
+        self.commit_write()
 
     def delete(self):
         db.session.delete(self)
-        db.session.commit()
+        self.commit_write()
 
     def update(self):
-        db.session.commit()
+        self.commit_write()
+
+    def format_value(self, key):
+        value = getattr(self, key)
+        formatter = self.value_formatters.get(key)
+        return value if formatter is None else formatter(value)
+
+    def format_fields(self, fields):
+        '''
+        Returns format() restricted to fields.
+        Other columns are not accessed, so they are not loaded.
+        '''
+        return {key: self.format_value(key) for key in fields}
 
     def update_by_dict(self, **kwags):
         '''
@@ -110,7 +292,9 @@ class BaseModel(db.Model):
         Use update() method to comiit
         '''
         table = getattr(self.__class__, '__table__')
-        columns = [c.key for c in table.columns]
+        # updated_at is set by the write itself.
+        columns = [c.key for c in table.columns
+                   if c.computed is None and c.key != 'updated_at']
         for key, value in kwags.items():
             if key in columns and value is not None:
                 setattr(self, key, value)
@@ -118,20 +302,32 @@ class BaseModel(db.Model):
 
 class Movie(BaseModel):
     __tablename__ = 'movies'
+    __table_args__ = (
+        Index('ix_movies_search_vector', 'search_vector',
+              postgresql_using='gin'),
+        Index('ix_movies_title_id', 'title', 'id'),
+        Index('ix_movies_title_pattern', 'title',
+              postgresql_ops={'title': 'text_pattern_ops'}),
+        Index('ix_movies_release_date_id', 'release_date', 'id'),
+    )
 
     id = Column(Integer, primary_key=True)
     title = Column(String, nullable=False)
     release_date = Column(Date, nullable=False)
     company = Column(String, nullable=False)
     description = Column(String)
+    search_vector = deferred(Column(
+        TSVECTOR,
+        Computed(search_vector_expression('title', 'description'))))
     roles = relationship("Role", back_populates="movie", cascade="all, delete")
+    format_keys = ('id', 'title', 'release_date', 'company', 'description')
+    value_formatters = {'release_date': format_date}
 
     def format(self):
-        release_date_format = '%Y-%m-%d'
         return {
             'id': self.id,
             'title': self.title,
-            'release_date': self.release_date.strftime(release_date_format),
+            'release_date': self.format_value('release_date'),
             'company': self.company,
             'description': self.description
         }
@@ -170,6 +366,20 @@ class Movie(BaseModel):
 
 class Actor(BaseModel):
     __tablename__ = 'actors'
+    __table_args__ = (
+        Index('ix_actors_search_vector', 'search_vector',
+              postgresql_using='gin'),
+        Index('ix_actors_name_id', 'name', 'id'),
+        Index('ix_actors_name_pattern', 'name',
+              postgresql_ops={'name': 'text_pattern_ops'}),
+        Index('ix_actors_age_id', 'age', 'id'),
+        Index('ix_actors_height_id', 'height', 'id'),
+        # ORDER BY height DESC NULLS LAST of sort=-height
+        Index('ix_actors_height_desc_id', text('height DESC NULLS LAST'),
+              text('id DESC')),
+        Index('ix_actors_gender_age', 'gender', 'age'),
+        Index('ix_actors_gender_height', 'gender', 'height'),
+    )
 
     id = Column(Integer, primary_key=True)
     name = Column(String, nullable=False)
@@ -187,7 +397,15 @@ class Actor(BaseModel):
     image_link = Column(String)
     phone = Column(String)
     email = Column(String)
+    search_vector = deferred(Column(
+        TSVECTOR,
+        Computed(search_vector_expression('name', 'description'))))
     roles = relationship("Role", back_populates="actor")
+    format_keys = (
+        'id', 'name', 'age', 'gender', 'location', 'passport',
+        'driver_license', 'ethnicity', 'hair_color', 'eye_color',
+        'body_type', 'height', 'description', 'image_link', 'phone', 'email'
+    )
 
     def format(self):
         return {
@@ -308,6 +526,13 @@ class Actor(BaseModel):
 
 class Role(BaseModel):
     __tablename__ = 'roles'
+    __table_args__ = (
+        Index('ix_roles_movie_id', 'movie_id'),
+        Index('ix_roles_actor_id', 'actor_id'),
+        Index('ix_roles_min_age_id', 'min_age', 'id'),
+        Index('ix_roles_max_age_id', 'max_age', 'id'),
+        Index('ix_roles_gender_min_age', 'gender', 'min_age'),
+    )
 
     id = Column(Integer, primary_key=True)
     movie_id = Column(
@@ -322,6 +547,14 @@ class Role(BaseModel):
     description = Column(String)
     movie = relationship("Movie", back_populates="roles")
     actor = relationship("Actor", back_populates="roles")
+    format_keys = (
+        'id', 'movie_id', 'actor_id', 'name', 'gender', 'min_age',
+        'max_age', 'description'
+    )
+    format_keys_without_movie_id = tuple(
+        key for key in format_keys if key != 'movie_id')
+    format_keys_without_actor_id = tuple(
+        key for key in format_keys if key != 'actor_id')
 
     def format(self):
         return {
@@ -0,0 +1,67 @@
+ASSISTANT_PERMISSIONS = [
+    'get:actors',
+    'get:movies',
+    'get:roles',
+]
+
+DIRECTOR_PERMISSIONS = ASSISTANT_PERMISSIONS + [
+    'patch:actors',
+    'patch:movies',
+    'patch:roles',
+    'post:actors',
+    'post:roles',
+    'delete:actors',
+    'delete:roles',
+]
+
+PRODUCER_PERMISSIONS = DIRECTOR_PERMISSIONS + [
+    'post:movies',
+    'delete:movies',
+]
+
+ROLE_PERMISSIONS = {
+    'assistant': ASSISTANT_PERMISSIONS,
+    'director': DIRECTOR_PERMISSIONS,
+    'producer': PRODUCER_PERMISSIONS,
+}
+
+# Bit positions are fixed by the order of the list.
+# Append new permissions at the end.
+PERMISSIONS = PRODUCER_PERMISSIONS
+
+PERMISSION_BITS = {
+    permission: 1 << position
+    for position, permission in enumerate(PERMISSIONS)
+}
+
+
+def permission_bit(permission):
+    '''
+    Returns the bit of permission.
+    Raises ValueError if permission is not registered.
+    '''
+    try:
+        return PERMISSION_BITS[permission]
+    except KeyError:
+        raise ValueError(f'Unknown permission {permission}')
+
+
+def compile_permissions(permissions):
+    '''
+    Args:
+        permissions: list of permission strings from a JWT payload
+    Returns:
+        integer mask of the registered permissions.
+        Unregistered permissions are ignored.
+    '''
+    mask = 0
+    for permission in permissions:
+        mask |= PERMISSION_BITS.get(permission, 0)
+    return mask
+
+
+def permission_names(mask):
+    return [
+        permission for permission in PERMISSIONS
+        if mask & PERMISSION_BITS[permission]
+    ]
@@ -0,0 +1,295 @@
+import select
+import threading
+
+from collections import (
+    OrderedDict,
+    defaultdict
+)
+
+DEFAULT_MAX_SIZE = 1024
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+CHANNEL = 'table_writes'
+POLL_INTERVAL = 5
+RETRY_INTERVAL = 5
+
+
+def normalize_args(args):
+    '''
+    Args:
+        args: request.args
+    Returns:
+        hashable tuple of (key, values) sorted by key,
+        so the order of query parameters does not matter
+    '''
+    return tuple(sorted((key, tuple(values)) for key, values in args.lists()))
+
+
+def parse_payload(payload):
+    '''
+    Returns (table, row_id) of a notification payload.
+    ex) 'actors:3' -> ('actors', 3), 'actors' -> ('actors', None)
+    '''
+    table, _, row_id = payload.partition(':')
+    return table, int(row_id) if row_id.isdigit() else None
+
+
+class TableGenerations:
+    '''The class counts writes to each table. A cached result is valid
+    while the generations of the tables it was read from are unchanged.
+
+    Attribute:
+        listeners: functions called with (table, row_id) of each write.
+                   row_id is None if it is unknown and
+                   table is None if every table may have changed.
+
+    Method:
+        get: returns the generations of tables
+        bump: starts a new generation of table
+        bump_all: starts a new generation of every table
+        add_listener: adds a function to listeners
+    '''
+    def __init__(self):
+        self.counters = defaultdict(int)
+        self.epoch = 0
+        self.listeners = []
+        self.lock = threading.Lock()
+
+    def get(self, tables):
+        return (self.epoch,) + tuple(self.counters[table] for table in tables)
+
+    def bump(self, table, row_id=None):
+        with self.lock:
+            self.counters[table] += 1
+        for listener in self.listeners:
+            listener(table, row_id)
+
+    def bump_all(self):
+        with self.lock:
+            self.epoch += 1
+        for listener in self.listeners:
+            listener(None, None)
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+
+class ResultCache:
+    '''The class is a bounded LRU of serialized responses.
+    Every entry keeps the table generations it was read at and is
+    dropped when it is looked up with other generations.
+    An entry also keeps the compressed bodies of its body, so each
+    encoding is compressed once per entry instead of once per hit,
+    and the validators of conditional requests of its body.
+
+    Attribute:
+        max_size: maximum number of entries kept
+        max_bytes: maximum total size of cached bodies
+        enabled: if False, get always misses and put does nothing
+        hits: number of cache hits
+        misses: number of cache misses including stale entries
+        stale: number of entries dropped for old generations
+        evictions: number of entries evicted by max_size or max_bytes
+        bytes: total size of cached bodies, compressed ones included
+
+    Method:
+        get: returns the cached body of key or None
+        put: stores body of key read at generation
+        get_validators: returns the validators stored with the body of key
+        put_validators: stores the validators of the body of key
+        get_encoded: returns the body of key compressed by an encoding
+        put_encoded: stores the body of key compressed by an encoding
+        clear: drops every entry
+        stats: returns a dictionary of counters
+    '''
+    def __init__(self, max_size=DEFAULT_MAX_SIZE,
+                 max_bytes=DEFAULT_MAX_BYTES, enabled=True):
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.enabled = enabled and max_size > 0 and max_bytes > 0
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, generation):
+        if not self.enabled:
+            return None
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            entry_generation, body, encoded, validators = entry
+            if entry_generation != generation:
+                self.remove(key)
+                self.stale += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key, generation, body, validators=None):
+        if not self.enabled or len(body) > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.remove(key)
+            self.entries[key] = (generation, body, {}, validators)
+            self.bytes += len(body)
+            self.evict()
+
+    def get_validators(self, key, generation):
+        '''
+        Returns the validators put with the body of key, or None.
+        It is looked up after get(), so it is not counted as a lookup.
+        '''
+        if not self.enabled:
+            return None
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != generation:
+                return None
+            return entry[3]
+
+    def put_validators(self, key, generation, validators):
+        '''
+        Stores validators of the body of key if the entry of key
+        is still of generation.
+        '''
+        if not self.enabled:
+            return
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != generation:
+                return
+            self.entries[key] = entry[:3] + (validators,)
+
+    def get_encoded(self, key, generation, encoding):
+        '''
+        Returns the body of key compressed by encoding, or None.
+        It is looked up after get(), so it is not counted as a lookup.
+        '''
+        if not self.enabled:
+            return None
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != generation:
+                return None
+            return entry[2].get(encoding)
+
+    def put_encoded(self, key, generation, encoding, body):
+        '''
+        Stores body, the body of key compressed by encoding,
+        if the entry of key is still of generation.
+        '''
+        if not self.enabled:
+            return
+        with self.lock:
+            entry = self.entries.get(key)
+            if (entry is None or entry[0] != generation
+                    or encoding in entry[2]):
+                return
+            entry[2][encoding] = body
+            self.bytes += len(body)
+            self.evict()
+
+    def evict(self):
+        while (len(self.entries) > self.max_size
+               or self.bytes > self.max_bytes):
+            self.remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def remove(self, key):
+        generation, body, encoded, validators = self.entries.pop(key)
+        self.bytes -= len(body) + sum(map(len, encoded.values()))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.stale = 0
+            self.evictions = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'enabled': self.enabled,
+            'size': len(self.entries),
+            'max_size': self.max_size,
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else None,
+            'stale': self.stale,
+            'evictions': self.evictions,
+        }
+
+
+class GenerationListener(threading.Thread):
+    '''The daemon thread LISTENs to channel and bumps the generation
+    of the table named by each notification, 'table' or 'table:id',
+    so writes committed by other processes invalidate the cache of
+    this one.
+    After every (re)connection it bumps all generations, because
+    notifications sent while nobody listened are lost.
+
+    Attribute:
+        generations: TableGenerations to bump
+        connect: function returning a new psycopg2 connection
+        listening: event set while LISTEN is active
+
+    Method:
+        stop: stops the thread
+    '''
+    def __init__(self, generations, connect, channel=CHANNEL,
+                 poll_interval=POLL_INTERVAL,
+                 retry_interval=RETRY_INTERVAL):
+        threading.Thread.__init__(self, name='generation-listener',
+                                  daemon=True)
+        self.generations = generations
+        self.connect = connect
+        self.channel = channel
+        self.poll_interval = poll_interval
+        self.retry_interval = retry_interval
+        self.listening = threading.Event()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                connection = self.connect()
+                try:
+                    self.listen(connection)
+                finally:
+                    self.listening.clear()
+                    connection.close()
+            except Exception:
+                pass
+            if self.stopped.wait(self.retry_interval):
+                break
+
+    def listen(self, connection):
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute(f'LISTEN {self.channel}')
+        self.generations.bump_all()
+        self.listening.set()
+        while not self.stopped.is_set():
+            readable, _, _ = select.select(
+                [connection], [], [], self.poll_interval)
+            if not readable:
+                continue
+            connection.poll()
+            while connection.notifies:
+                notify = connection.notifies.pop(0)
+                self.generations.bump(*parse_payload(notify.payload))
+
+    def stop(self):
+        self.stopped.set()
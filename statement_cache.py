@@ -0,0 +1,117 @@
+import threading
+import time
+
+from collections import OrderedDict
+from types import CodeType
+
+DEFAULT_MAX_SIZE = 500
+
+
+def entry_kind(key):
+    '''
+    Returns 'queries' for keys of baked query contexts, which start
+    with the code of the first step, and 'statements' for keys of
+    compiled SQL, which start with the dialect.
+    '''
+    if isinstance(key, tuple) and key and isinstance(key[0], CodeType):
+        return 'queries'
+    return 'statements'
+
+
+class StatementCache:
+    '''The class is a bounded LRU used as the cache of a baked query
+    bakery. SQLAlchemy stores two kinds of entries in it: the compiled
+    context of a baked query and the compiled SQL of its statement.
+    Both are built on a miss and stored right after, so the time
+    between a miss and the store is counted as compile time.
+
+    Attribute:
+        max_size: maximum number of entries kept
+        clock: function returning seconds
+        counters: dictionary({kind: {hits, misses, compiles,
+                  compile_seconds}}) for 'queries' and 'statements'
+
+    Method:
+        get: returns the entry of key or default, counting a hit or miss
+        clear: drops every entry and resets counters
+        stats: returns a dictionary of counters
+    '''
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, clock=time.perf_counter):
+        self.max_size = max_size
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.missed_at = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.reset_counters()
+
+    def reset_counters(self):
+        self.counters = {
+            kind: {
+                'hits': 0,
+                'misses': 0,
+                'compiles': 0,
+                'compile_seconds': 0.0,
+            }
+            for kind in ('queries', 'statements')
+        }
+
+    def get(self, key, default=None):
+        counters = self.counters[entry_kind(key)]
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                counters['hits'] += 1
+                return self.entries[key]
+            counters['misses'] += 1
+            if len(self.missed_at) >= self.max_size:
+                # Entries which were never stored, ex) spoiled queries
+                self.missed_at.clear()
+            self.missed_at[key] = self.clock()
+            return default
+
+    def __getitem__(self, key):
+        with self.lock:
+            return self.entries[key]
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __setitem__(self, key, value):
+        counters = self.counters[entry_kind(key)]
+        with self.lock:
+            missed_at = self.missed_at.pop(key, None)
+            if missed_at is not None:
+                counters['compiles'] += 1
+                counters['compile_seconds'] += self.clock() - missed_at
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.missed_at.clear()
+            self.reset_counters()
+
+    def stats(self):
+        stats = {'size': len(self.entries), 'max_size': self.max_size}
+        for kind, counters in self.counters.items():
+            lookups = counters['hits'] + counters['misses']
+            compiles = counters['compiles']
+            stats[kind] = {
+                'hits': counters['hits'],
+                'misses': counters['misses'],
+                'hit_rate': counters['hits'] / lookups if lookups else None,
+                'compiles': compiles,
+                'compile_ms': counters['compile_seconds'] * 1000,
+                'mean_compile_ms': (
+                    counters['compile_seconds'] * 1000 / compiles
+                    if compiles else None
+                ),
+            }
+        return stats
@@ -60,6 +60,14 @@ class AppTestCase(unittest.TestCase):
         for actor in actors:
             actor.delete()
 
+    def test_ready_reports_jwks_status(self):
+        res = self.client().get('/ready')
+        data = json.loads(res.data)
+
+        self.assertIn(res.status_code, [200, 503])
+        self.assertEqual(data['success'], data['jwks']['usable'])
+        self.assertIn('last_success', data['jwks'])
+
     def test_get_actors(self):
         res = self.client().get('/actors')
         data = json.loads(res.data)
@@ -103,7 +111,8 @@ class AppTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertTrue(data['success'])
         for actor in data['actors']:
-            self.assertTrue(search_term in actor['name'])
+            text = f"{actor['name']} {actor['description']}".lower()
+            self.assertTrue(search_term in text)
 
     def test_get_male_actors(self):
         res = self.client().get(f'/actors?gender=male')
@@ -240,7 +249,8 @@ class AppTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertTrue(data['success'])
         for movie in data['movies']:
-            self.assertTrue(search_term in movie['title'])
+            text = f"{movie['title']} {movie['description']}".lower()
+            self.assertTrue(search_term in text)
 
         new_movie.delete()
 
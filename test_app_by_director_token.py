@@ -103,7 +103,8 @@ class AppTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertTrue(data['success'])
         for actor in data['actors']:
-            self.assertTrue(search_term in actor['name'])
+            text = f"{actor['name']} {actor['description']}".lower()
+            self.assertTrue(search_term in text)
 
     def test_get_male_actors(self):
         res = self.client().get(f'/actors?gender=male')
@@ -314,7 +315,8 @@ class AppTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertTrue(data['success'])
         for movie in data['movies']:
-            self.assertTrue(search_term in movie['title'])
+            text = f"{movie['title']} {movie['description']}".lower()
+            self.assertTrue(search_term in text)
 
     def test_get_movies_with_page_and_page_size(self):
         res = self.client().get(f'/movies?page=2&page_size=4')
@@ -1,11 +1,38 @@
+import csv
+import gzip
+import io
 import os
 import sys
+import time
 import unittest
 import json
 
-from app import app
+from app import (
+    app,
+    result_cache
+)
+from columnar_index import numpy
+from conditional import read_validators
+from sqlalchemy import (
+    and_,
+    event,
+    not_,
+    or_,
+    select,
+    text
+)
+from werkzeug.exceptions import HTTPException
+
+from filters import (
+    Actorfilter,
+    create_actor_bitmaps,
+    create_actor_index
+)
 from models import (
     db,
+    plain_column,
+    row_mapper,
+    table_generations,
     Actor,
     Movie,
     Role
@@ -16,6 +43,8 @@ PRODUCER_TOKEN can be expired
 '''
 PRODUCER_TOKEN = str(os.environ['PRODUCER'])
 HEADER = {'Authorization': f'Bearer {PRODUCER_TOKEN}'}
+# A tag of no response, so the request reads the validators
+NO_MATCH = {'If-None-Match': '"none"'}
 
 
 class AppTestCase(unittest.TestCase):
@@ -103,7 +132,22 @@ class AppTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertTrue(data['success'])
         for actor in data['actors']:
-            self.assertTrue(search_term in actor['name'])
+            text = f"{actor['name']} {actor['description']}".lower()
+            self.assertTrue(search_term in text)
+
+    def test_search_term_keeps_stopwords_of_names(self):
+        actor = Actor(**AppTestCase.test_actor)
+        actor.name = 'Will Smith'
+        actor.insert()
+        actor_id = actor.id
+
+        res = self.client().get('/actors?search_term=will')
+        data = json.loads(res.data)
+
+        actor.delete()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(actor_id, [actor['id'] for actor in data['actors']])
 
     def test_get_male_actors(self):
         res = self.client().get(f'/actors?gender=male')
@@ -313,7 +357,21 @@ class AppTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertTrue(data['success'])
         for movie in data['movies']:
-            self.assertTrue(search_term in movie['title'])
+            text = f"{movie['title']} {movie['description']}".lower()
+            self.assertTrue(search_term in text)
+
+    def test_get_movies_by_description_search_term(self):
+        new_movie = Movie(**AppTestCase.test_movie)
+        new_movie.description = 'A bullfighting drama in Seville'
+        new_movie.insert()
+
+        res = self.client().get('/movies?search_term=bullfight sevil')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        titles = [movie['title'] for movie in data['movies']]
+        self.assertIn('test_movie', titles)
 
     def test_get_movies_with_page_and_page_size(self):
         res = self.client().get(f'/movies?page=2&page_size=4')
@@ -323,6 +381,609 @@ class AppTestCase(unittest.TestCase):
         self.assertTrue(data['success'])
         self.assertEqual(len(data['movies']), 4)
 
+    def test_get_movies_by_cursor(self):
+        res = self.client().get('/movies?page_size=3')
+        data = json.loads(res.data)
+        first_page_ids = [movie['id'] for movie in data['movies']]
+        self.assertIsNotNone(data['next_cursor'])
+
+        res = self.client().get(
+            f"/movies?page_size=3&cursor={data['next_cursor']}")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertEqual(len(data['movies']), 3)
+        self.assertTrue(data['movies'][0]['id'] > first_page_ids[-1])
+
+        res = self.client().get('/movies?page=2&page_size=3')
+        data_by_page = json.loads(res.data)
+        self.assertEqual(data['movies'], data_by_page['movies'])
+
+    def test_get_movies_by_count_strategy(self):
+        res = self.client().get('/movies?min_release_date=2022-01-01')
+        exact = json.loads(res.data)
+        self.assertEqual(exact['count_strategy'], 'exact')
+
+        res = self.client().get(
+            '/movies?min_release_date=2022-01-01&count=window')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['count_strategy'], 'window')
+        self.assertEqual(data['total_movies'], exact['total_movies'])
+        self.assertEqual(data['movies'], exact['movies'])
+
+        res = self.client().get('/movies?count=estimate')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['count_strategy'], 'estimate')
+        self.assertTrue(isinstance(data['total_movies'], int))
+
+        res = self.client().get('/movies?count=none')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['count_strategy'], 'none')
+        self.assertIsNone(data['total_movies'])
+
+    def test_get_movies_error_by_invalid_count_strategy(self):
+        res = self.client().get('/movies?count=all')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertFalse(data['success'])
+
+    def test_get_movies_error_by_invalid_cursor(self):
+        res = self.client().get('/movies?cursor=invalid')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertFalse(data['success'])
+
+    def test_search_actors_in_batch(self):
+        searches = [
+            {'gender': 'male', 'min_age': 20, 'max_age': 40},
+            {'gender': 'dragon'},
+            {'ethnicity': ['asian', 'white'], 'passport': True,
+             'page_size': 2},
+        ]
+        res = self.client().post('/actors/search/batch', headers=HEADER,
+                                 json={'searches': searches})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertEqual(len(data['results']), 3)
+        self.assertFalse(data['results'][1]['success'])
+        for index in [0, 2]:
+            self.assertTrue(data['results'][index]['success'])
+        queries = [
+            '/actors?gender=male&min_age=20&max_age=40',
+            '/actors?ethnicity=asian&ethnicity=white&passport=true'
+            '&page_size=2',
+        ]
+        for result, query in zip([data['results'][0], data['results'][2]],
+                                 queries):
+            expected = json.loads(self.client().get(query).data)
+            self.assertEqual(result, expected)
+
+    def test_search_actors_in_batch_error(self):
+        res = self.client().post('/actors/search/batch', headers=HEADER,
+                                 json={'searches': []})
+        self.assertEqual(res.status_code, 400)
+
+        res = self.client().post('/actors/search/batch', headers=HEADER,
+                                 json={'searches': [{}] * 201})
+        self.assertEqual(res.status_code, 422)
+
+        res = self.client().post('/actors/search/batch',
+                                 json={'searches': [{}]})
+        self.assertEqual(res.status_code, 401)
+
+    def test_failed_searches_in_batch_have_a_message(self):
+        searches = [{'gender': 'dragon'}, {'page': 10 ** 20},
+                    {'gender': 'male', 'page_size': 1}]
+        res = self.client().post('/actors/search/batch', headers=HEADER,
+                                 json={'searches': searches})
+        results = json.loads(res.data)['results']
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(results[0]['message'], 'Invalid gender dragon')
+        self.assertEqual(results[1], {'success': False, 'error': 422,
+                                      'message': 'unprocessable'})
+        self.assertTrue(results[2]['success'])
+
+    def test_get_actors_by_filter_operators(self):
+        res = self.client().get('/actors?age__between=20,40'
+                                '&ethnicity__ne=asian&page_size=100')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        expected = Actor.query.filter(Actor.age.between(20, 40),
+                                      Actor.ethnicity != 'asian')
+        self.assertEqual([actor['id'] for actor in data['actors']],
+                         [actor.id for actor in expected.order_by(Actor.id)])
+
+        actor = Actor.query.first()
+        prefix = actor.name[:3]
+        res = self.client().get(f'/actors?name__prefix={prefix}'
+                                '&page_size=100')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(actor.id, [actor['id'] for actor in data['actors']])
+        for actor in data['actors']:
+            self.assertTrue(actor['name'].startswith(prefix))
+
+        res = self.client().get('/actors?name__prefix=%25')
+        data = json.loads(res.data)
+        self.assertEqual(data['total_actors'], Actor.query.filter(
+            Actor.name.startswith('%', autoescape=True)).count())
+
+    def test_get_actors_error_by_invalid_filter(self):
+        for query in ['nickname=duck', 'age__gte=old', 'gender=dragon',
+                      'height__between=150', 'age__like=2%25',
+                      'min_age=20&age__gte=30', 'page=0']:
+            res = self.client().get(f'/actors?{query}')
+            data = json.loads(res.data)
+
+            self.assertEqual(res.status_code, 422)
+            self.assertFalse(data['success'])
+            self.assertNotEqual(data['message'], 'unprocessable')
+
+    def test_get_actors_by_sort_and_cursor(self):
+        url = '/actors?sort=age,-id&fields=age&page_size=3'
+        actors = []
+        res = self.client().get(url)
+        data = json.loads(res.data)
+        while True:
+            self.assertEqual(res.status_code, 200)
+            actors.extend(data['actors'])
+            if data['next_cursor'] is None:
+                break
+            res = self.client().get(f"{url}&cursor={data['next_cursor']}")
+            data = json.loads(res.data)
+
+        expected = sorted(Actor.query.all(),
+                          key=lambda actor: (actor.age, -actor.id))
+        self.assertEqual([actor['id'] for actor in actors],
+                         [actor.id for actor in expected])
+
+    def test_get_movies_by_sort(self):
+        res = self.client().get('/movies?sort=-release_date&page_size=2')
+        data = json.loads(res.data)
+        dates = [movie['release_date'] for movie in data['movies']]
+
+        self.assertEqual(res.status_code, 200)
+        latest = Movie.query.order_by(Movie.release_date.desc(),
+                                      Movie.id.desc()).first()
+        self.assertEqual(data['movies'][0]['id'], latest.id)
+
+        res = self.client().get(
+            f"/movies?sort=-release_date&cursor={data['next_cursor']}")
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        for movie in data['movies']:
+            self.assertTrue(movie['release_date'] <= dates[-1])
+
+    def test_get_roles_error_by_invalid_sort(self):
+        for sort in ['description', 'min_age,-min_age', '']:
+            res = self.client().get(f'/roles?sort={sort}')
+            data = json.loads(res.data)
+
+            self.assertEqual(res.status_code, 422)
+            self.assertFalse(data['success'])
+
+    def test_get_actors_with_fields(self):
+        res = self.client().get('/actors?fields=name,age&fields=gender')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        for actor in data['actors']:
+            self.assertEqual(set(actor), {'id', 'name', 'age', 'gender'})
+
+    def test_get_movies_with_fields_and_cursor(self):
+        res = self.client().get('/movies?fields=release_date&page_size=2')
+        data = json.loads(res.data)
+        self.assertEqual(set(data['movies'][0]), {'id', 'release_date'})
+
+        res = self.client().get(
+            f"/movies?fields=release_date&cursor={data['next_cursor']}")
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(set(data['movies'][0]), {'id', 'release_date'})
+
+    def test_get_roles_error_by_invalid_field(self):
+        res = self.client().get('/roles?fields=name,search_vector')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertFalse(data['success'])
+
+    def test_get_actor_facets(self):
+        res = self.client().get('/actors/facets?gender=female')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertEqual(data['facets']['gender'], [
+            {'value': 'female', 'count': data['total_actors']}
+        ])
+        passport_counts = data['facets']['passport']
+        self.assertEqual(sum(value['count'] for value in passport_counts),
+                         data['total_actors'])
+        for value in passport_counts:
+            if value['value'] is None:
+                continue
+            passport = 't' if value['value'] else 'f'
+            res = self.client().get(
+                f'/actors?gender=female&passport={passport}')
+            self.assertEqual(json.loads(res.data)['total_actors'],
+                             value['count'])
+
+    def test_get_actor_facets_error_by_invalid_filter(self):
+        res = self.client().get('/actors/facets?min_age=old')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertFalse(data['success'])
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_actor_index_matches_sql(self):
+        cases = [
+            {'gender': ['female'], 'min_age': ['20'], 'max_age': ['40']},
+            {'passport': ['t'], 'driver_license': ['false']},
+            {'ethnicity': ['asian', 'white'], 'min_height': ['160']},
+            {'gender': ['male'], 'page': ['2'], 'page_size': ['2']},
+            {'gender': ['female'], 'fields': ['name'], 'count': ['none']},
+            {'height__between': ['150,190'], 'ethnicity__ne': ['asian']},
+            {'passport__ne': ['t'], 'age__ne': ['40']},
+        ]
+        previous_index = Actorfilter.columnar_index
+        index = create_actor_index()
+        actor = Actor(**AppTestCase.test_actor)
+        try:
+            for data in cases:
+                self.assertEqual(self.filter_actors(data, index),
+                                 self.filter_actors(data, None))
+            actor.insert()
+            data = {'gender': ['male'], 'max_age': ['22'], 'min_age': ['22']}
+            self.assertIn(actor.id, self.filter_actors(data, index)[2])
+            self.assertEqual(index.stats()['partial_loads'], 1)
+        finally:
+            Actorfilter.columnar_index = previous_index
+            table_generations.listeners.remove(index.mark_changed)
+
+    def filter_actors(self, data, index):
+        Actorfilter.columnar_index = index
+        actor_filter = Actorfilter(data)
+        total, page, actors = actor_filter.get_results()
+        return (total, page, [actor.id for actor in actors],
+                actor_filter.next_cursor)
+
+    def test_actor_bitmaps_match_sql(self):
+        index = create_actor_bitmaps()
+        expressions = [
+            ('and', [('eq', 'gender', 'female'),
+                     ('not', ('eq', 'passport', True))]),
+            ('or', [('in', 'ethnicity', ['asian', 'white']),
+                    ('and', [('eq', 'driver_license', True),
+                             ('not', ('eq', 'hair_color', 'brown'))])]),
+            ('not', ('or', [('eq', 'gender', 'male'),
+                            ('eq', 'body_type', None)])),
+        ]
+        actor = Actor(**AppTestCase.test_actor)
+        try:
+            for expression in expressions:
+                self.assertEqual(list(index.evaluate(expression)),
+                                 self.actor_ids(expression))
+            actor.insert()
+            expression = expressions[2]
+            self.assertEqual(list(index.evaluate(expression)),
+                             self.actor_ids(expression))
+            self.assertEqual(index.stats()['partial_loads'], 1)
+            actor.delete()
+            self.assertNotIn(actor.id,
+                             index.evaluate(('eq', 'gender', 'male')))
+
+            data = {'gender': ['female', 'male'], 'passport': ['t']}
+            Actorfilter.bitmap_index = index
+            bitmap_counts = Actorfilter(data).get_facet_counts()
+            Actorfilter.bitmap_index = None
+            self.assertEqual(bitmap_counts,
+                             Actorfilter(data).get_facet_counts())
+            self.assertEqual(index.stats()['queries'], 6)
+        finally:
+            Actorfilter.bitmap_index = None
+            table_generations.listeners.remove(index.mark_changed)
+
+    def actor_ids(self, expression):
+        '''Returns sorted ids of actors matching expression by SQL.'''
+        def criterion(expression):
+            operator_name = expression[0]
+            if operator_name in ('eq', 'in'):
+                column = getattr(Actor, expression[1])
+                values = expression[2]
+                if operator_name == 'eq':
+                    values = [values]
+                # IN of a subquery is never NULL, so NOT is a complement
+                condition = or_(*[
+                    column.is_(None) if value is None else column == value
+                    for value in values])
+                return Actor.id.in_(select([Actor.id]).where(condition))
+            if operator_name == 'not':
+                return not_(criterion(expression[1]))
+            operands = [criterion(operand) for operand in expression[1]]
+            return (and_ if operator_name == 'and' else or_)(*operands)
+        query = Actor.query.filter(criterion(expression))
+        return [actor.id for actor in query.order_by(Actor.id)]
+
+    def test_export_actors_as_ndjson(self):
+        res = self.client().get('/actors/export?gender=male&fields=name',
+                                headers=HEADER)
+        lines = res.data.decode().splitlines()
+        actors = [json.loads(line) for line in lines]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        total = Actor.query.filter(Actor.gender == 'male').count()
+        self.assertEqual(len(actors), total)
+        for actor in actors:
+            self.assertEqual(set(actor), {'id', 'name'})
+
+    def test_row_mappers_match_format(self):
+        formats = [
+            (Actor, Actor.format_keys, Actor.format),
+            (Movie, Movie.format_keys, Movie.format),
+            (Role, Role.format_keys, Role.format),
+            (Role, Role.format_keys_without_movie_id,
+             Role.format_without_movie_id),
+            (Role, Role.format_keys_without_actor_id,
+             Role.format_without_actor_id),
+        ]
+        for model, keys, format_instance in formats:
+            columns = [plain_column(model, key) for key in keys]
+            rows = db.session.query(*columns).order_by(model.id).all()
+            map_row = row_mapper(model, keys)
+            instances = model.query.order_by(model.id).all()
+            self.assertTrue(rows)
+            for row, instance in zip(rows, instances):
+                formatted = map_row(row)
+                self.assertEqual(formatted, format_instance(instance))
+                self.assertEqual(list(formatted),
+                                 list(format_instance(instance)))
+
+    def test_json_in_postgres_matches_jsonify(self):
+        actor = Actor(**dict(AppTestCase.test_actor,
+                             description='a "quoted"\n\\ \x7f'))
+        actor.insert()
+        urls = [
+            '/actors', '/actors?page_size=3&count=window',
+            '/actors?fields=name,height&sort=-age',
+            '/actors?gender=male&search_term=test_name',
+            '/actors?page_size=0', '/movies?sort=-release_date',
+            '/movies?fields=title', '/roles?count=estimate',
+        ]
+        cursor = json.loads(self.client().get('/actors?page_size=2').data)[
+            'next_cursor']
+        urls.append(f'/actors?page_size=2&cursor={cursor}')
+        responses = {}
+        try:
+            for json_in_postgres in [False, True]:
+                app.config['JSON_IN_POSTGRES'] = json_in_postgres
+                result_cache.clear()
+                responses[json_in_postgres] = [
+                    self.client().get(url) for url in urls]
+        finally:
+            app.config['JSON_IN_POSTGRES'] = False
+            result_cache.clear()
+
+        for url, res, res_json in zip(urls, responses[False],
+                                      responses[True]):
+            self.assertEqual(res_json.status_code, 200, url)
+            self.assertEqual(res_json.mimetype, 'application/json')
+            self.assertEqual(res_json.data, res.data, url)
+
+    def test_export_movies_as_csv(self):
+        res = self.client().get('/movies/export?format=csv',
+                                headers=HEADER)
+        rows = list(csv.DictReader(io.StringIO(res.data.decode())))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'text/csv')
+        self.assertEqual(len(rows), Movie.query.count())
+        self.assertEqual(list(rows[0]), list(Movie.query.first().format()))
+
+    def test_export_roles_error_by_invalid_format(self):
+        res = self.client().get('/roles/export?format=xml', headers=HEADER)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertFalse(data['success'])
+
+    def test_list_cache_is_invalidated_by_write(self):
+        url = '/actors?count=exact&page_size=1'
+        before = json.loads(self.client().get(url).data)
+        hits = json.loads(self.client().get('/stats').data)[
+            'result_cache']['hits']
+
+        res = self.client().get('/actors?page_size=1&count=exact')
+        self.assertEqual(json.loads(res.data), before)
+        stats = json.loads(self.client().get('/stats').data)
+        self.assertEqual(stats['result_cache']['hits'], hits + 1)
+
+        self.client().post('/actors',
+                           json=AppTestCase.test_actor,
+                           headers=HEADER)
+        res = self.client().get(url)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['total_actors'], before['total_actors'] + 1)
+
+    def test_get_actors_not_modified(self):
+        url = '/actors?page_size=3&gender=male'
+        res = self.client().get(url, headers=NO_MATCH)
+        etag = res.headers['ETag']
+        last_modified = res.headers['Last-Modified']
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(etag.startswith('W/"'))
+
+        res = self.client().get(url, headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+        self.assertEqual(res.headers['ETag'], etag)
+        res = self.client().get(url, headers={
+            'If-Modified-Since': last_modified})
+        self.assertEqual(res.status_code, 304)
+        res = self.client().get('/actors?page_size=4&gender=male',
+                                headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+
+        actor = Actor(**AppTestCase.test_actor)
+        actor.insert()
+        res = self.client().get(url, headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+        self.assertTrue(json.loads(res.data)['success'])
+
+    def test_cached_list_reads_version_of_conditional_requests(self):
+        url = '/actors?page_size=3&count=none'
+        statements = []
+
+        def add_statement(*args):
+            statements.append(args[2])
+
+        table_generations.bump('actors')
+        event.listen(db.engine, 'before_cursor_execute', add_statement)
+        try:
+            res = self.client().get(url)
+            miss_statements = list(statements)
+            etag = self.client().get(url, headers=NO_MATCH).headers['ETag']
+            del statements[:]
+            cached = self.client().get(url)
+            not_modified = self.client().get(
+                url, headers={'If-None-Match': etag})
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', add_statement)
+
+        self.assertNotIn('ETag', res.headers)
+        self.assertFalse(any('updated_at' in statement
+                             for statement in miss_statements))
+        self.assertEqual(statements, [])
+        self.assertEqual(cached.headers['ETag'], etag)
+        self.assertEqual(cached.data, res.data)
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_uncached_list_reads_version_of_conditional_requests(self):
+        url = '/actors?page_size=3&gender=male'
+        etag = self.client().get(url, headers=NO_MATCH).headers['ETag']
+        result_cache.enabled = False
+        try:
+            res = self.client().get(url)
+            not_modified = self.client().get(
+                url, headers={'If-None-Match': etag})
+        finally:
+            result_cache.enabled = True
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn('ETag', res.headers)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.headers['ETag'], etag)
+
+    def test_version_errors_are_422_like_the_endpoints(self):
+        def version():
+            return db.session.execute(text('SELECT 1 / 0')).one()
+
+        with app.test_request_context('/actors'):
+            with self.assertRaises(HTTPException) as error:
+                read_validators(version)
+        db.session.rollback()
+
+        self.assertEqual(error.exception.code, 422)
+
+    def test_roles_of_movie_not_modified_until_trigger(self):
+        movie_id = Role.query.first().movie_id
+        url = f'/movies/{movie_id}/roles'
+        etag = self.client().get(url).headers['ETag']
+        res = self.client().get(url, headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+
+        # A write outside the models, kept by the trigger
+        db.session.execute(text(
+            'UPDATE roles SET description = description '
+            'WHERE movie_id = :movie_id'), {'movie_id': movie_id})
+        db.session.commit()
+        res = self.client().get(url, headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+
+    def test_writes_outside_the_models_invalidate_cached_lists(self):
+        url = '/actors?page_size=3'
+        res = self.client().get(url, headers=NO_MATCH)
+        etag = res.headers['ETag']
+        actor_id = json.loads(res.data)['actors'][0]['id']
+        generation = table_generations.get(['actors'])
+
+        db.session.execute(text(
+            'UPDATE actors SET age = age WHERE id = :id'), {'id': actor_id})
+        db.session.commit()
+        # The trigger notifies the generation listener of this process.
+        deadline = time.monotonic() + 5
+        while (table_generations.get(['actors']) == generation
+               and time.monotonic() < deadline):
+            time.sleep(0.01)
+
+        res = self.client().get(url, headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+
+    def test_roles_of_missing_movie_is_not_304(self):
+        res = self.client().get('/movies/100000/roles',
+                                headers={'If-None-Match': '*'})
+        self.assertEqual(res.status_code, 422)
+
+    def test_list_is_compressed_once_per_cache_entry(self):
+        url = '/actors?page_size=5&count=window'
+        plain = self.client().get(url)
+        res = self.client().get(url, headers={'Accept-Encoding': 'gzip'})
+        stats = json.loads(self.client().get('/stats').data)['result_cache']
+        cached = self.client().get(url, headers={'Accept-Encoding': 'gzip'})
+        cached_stats = json.loads(self.client().get('/stats').data)[
+            'result_cache']
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', res.vary)
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertEqual(gzip.decompress(res.data), plain.data)
+        self.assertEqual(cached.data, res.data)
+        self.assertEqual(cached_stats['hits'], stats['hits'] + 1)
+        self.assertEqual(cached_stats['bytes'], stats['bytes'])
+
+    def test_small_and_streamed_responses_are_not_compressed(self):
+        gzip_header = {'Accept-Encoding': 'gzip'}
+        res = self.client().get('/actors?page_size=0', headers=gzip_header)
+        self.assertNotIn('Content-Encoding', res.headers)
+        self.assertTrue(json.loads(res.data)['success'])
+
+        res = self.client().get('/actors/export',
+                                headers=dict(HEADER, **gzip_header))
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn('Content-Encoding', res.headers)
+
+    def test_filter_shape_is_compiled_once(self):
+        self.client().get('/actors?gender=male&min_age=20&max_age=30')
+        before = json.loads(self.client().get('/stats').data)
+
+        res = self.client().get('/actors?max_age=40&min_age=30&gender=female')
+        after = json.loads(self.client().get('/stats').data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(after['query_cache']['queries']['compiles'],
+                         before['query_cache']['queries']['compiles'])
+        self.assertGreater(after['query_cache']['queries']['hits'],
+                           before['query_cache']['queries']['hits'])
+
     def test_get_roles(self):
         res = self.client().get('/roles?page=2')
         data = json.loads(res.data)
@@ -467,6 +1128,23 @@ class AppTestCase(unittest.TestCase):
         self.assertFalse(data['success'])
         self.assertEqual(data['message'], 'Invalid movie id')
 
+    def test_get_roles_by_min_and_max_age_aliases(self):
+        for query, criterion in [
+            ('min_age=20', Role.min_age >= 20),
+            ('max_age=40', Role.max_age <= 40),
+            ('min_age=20&max_age=40',
+             and_(Role.min_age >= 20, Role.max_age <= 40)),
+        ]:
+            res = self.client().get(f'/roles?{query}&page_size=1000')
+            data = json.loads(res.data)
+            ids = [role.id for role in
+                   Role.query.filter(criterion).order_by(Role.id)]
+
+            self.assertEqual(res.status_code, 200)
+            self.assertTrue(ids)
+            self.assertEqual([role['id'] for role in data['roles']], ids)
+            self.assertEqual(data['total_roles'], len(ids))
+
     def test_get_roles_by_min_age(self):
         new_movie = Movie(**AppTestCase.test_movie)
         new_movie.insert()
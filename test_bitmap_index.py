@@ -0,0 +1,130 @@
+import random
+import unittest
+
+from sqlalchemy import (
+    Boolean,
+    Column,
+    Integer,
+    MetaData,
+    Table
+)
+
+from bitmap_index import (
+    ARRAY_MAX,
+    CONTAINER_SIZE,
+    BitmapIndex,
+    RoaringBitmap
+)
+
+
+class RoaringBitmapTestCase(unittest.TestCase):
+    def setUp(self):
+        generator = random.Random(17)
+        # Sparse, dense and full containers in both bitmaps
+        self.left_ids = (
+            set(generator.sample(range(CONTAINER_SIZE), 100))
+            | set(generator.sample(range(CONTAINER_SIZE, 2 * CONTAINER_SIZE),
+                                   ARRAY_MAX * 3))
+            | set(range(5 * CONTAINER_SIZE, 6 * CONTAINER_SIZE))
+        )
+        self.right_ids = (
+            set(generator.sample(range(CONTAINER_SIZE), ARRAY_MAX * 2))
+            | set(generator.sample(range(CONTAINER_SIZE, 2 * CONTAINER_SIZE),
+                                   50))
+            | set(range(3 * CONTAINER_SIZE, 3 * CONTAINER_SIZE + 10))
+        )
+        self.left = RoaringBitmap(self.left_ids)
+        self.right = RoaringBitmap(self.right_ids)
+
+    def test_operations_match_sets(self):
+        self.assertEqual(list(self.left), sorted(self.left_ids))
+        self.assertEqual(len(self.left), len(self.left_ids))
+        self.assertEqual(list(self.left & self.right),
+                         sorted(self.left_ids & self.right_ids))
+        self.assertEqual(list(self.left | self.right),
+                         sorted(self.left_ids | self.right_ids))
+        self.assertEqual(list(self.left - self.right),
+                         sorted(self.left_ids - self.right_ids))
+        self.assertEqual(list(self.right - self.left),
+                         sorted(self.right_ids - self.left_ids))
+
+    def test_containers_are_arrays_or_bitmaps_by_size(self):
+        kinds = {key: isinstance(container, int)
+                 for key, container in self.left.containers.items()}
+        self.assertEqual(kinds, {0: False, 1: True, 5: True})
+
+        for row_id in range(5 * CONTAINER_SIZE + ARRAY_MAX,
+                            6 * CONTAINER_SIZE):
+            self.left.discard(row_id)
+        self.assertFalse(isinstance(self.left.containers[5], int))
+        for row_id in range(5 * CONTAINER_SIZE, 6 * CONTAINER_SIZE):
+            self.left.discard(row_id)
+        self.assertNotIn(5, self.left.containers)
+
+    def test_copy_shares_no_container(self):
+        copy = self.left.copy()
+        self.left.add(CONTAINER_SIZE - 1)
+        self.left.discard(next(iter(self.left_ids)))
+        self.assertEqual(set(copy), self.left_ids)
+
+    def test_add_and_discard(self):
+        bitmap = RoaringBitmap()
+        bitmap.add(3)
+        bitmap.add(3)
+        bitmap.add(CONTAINER_SIZE + 1)
+        self.assertIn(3, bitmap)
+        self.assertNotIn(4, bitmap)
+        self.assertEqual(len(bitmap), 2)
+        bitmap.discard(3)
+        bitmap.discard(4)
+        self.assertEqual(list(bitmap), [CONTAINER_SIZE + 1])
+
+
+class BitmapIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.table = Table(
+            'actors', MetaData(),
+            Column('id', Integer, primary_key=True),
+            Column('passport', Boolean))
+        self.rows = [(1, True), (2, False)]
+        self.now = 0
+        self.index = BitmapIndex(
+            self.table, ['passport'], lambda statement: list(self.rows),
+            max_age=300, clock=lambda: self.now)
+
+    def test_bitmaps_are_reloaded_after_max_age(self):
+        passport = ('eq', 'passport', True)
+        self.assertEqual(list(self.index.evaluate(passport)), [1])
+
+        # A write missed by table_generations
+        self.rows = [(1, True), (2, True)]
+        self.now = 300
+        self.assertEqual(list(self.index.evaluate(passport)), [1])
+        self.now = 301
+        self.assertEqual(list(self.index.evaluate(passport)), [1, 2])
+        self.assertEqual(self.index.stats()['full_loads'], 2)
+
+    def test_results_do_not_change_with_refresh(self):
+        expressions = [
+            ('eq', 'passport', True),
+            ('in', 'passport', [True]),
+            ('not', ('eq', 'passport', False)),
+            ('and', []),
+        ]
+        results = [self.index.evaluate(expression)
+                   for expression in expressions]
+        ids = [list(result) for result in results]
+
+        self.rows = [(1, True), (2, True), (3, False)]
+        self.index.mark_changed('actors', 2)
+        self.index.mark_changed('actors', 3)
+        self.index.refresh()
+
+        self.assertEqual(self.index.stats()['partial_loads'], 1)
+        self.assertEqual([list(result) for result in results], ids)
+        self.assertEqual(list(self.index.evaluate(expressions[0])), [1, 2])
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import gzip
+import unittest
+
+from flask import (
+    Flask,
+    request
+)
+
+import compression
+from compression import Compressor
+
+BODY = b'{"actors":[' + b'{"id":1,"name":"Actor"},' * 100 + b'{}]}'
+
+
+def accept(header):
+    app = Flask(__name__)
+    with app.test_request_context(headers={'Accept-Encoding': header}):
+        return request.accept_encodings
+
+
+class CompressorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.compressor = Compressor(min_size=100)
+        self.app = Flask(__name__)
+
+    def test_negotiate_by_quality(self):
+        self.assertEqual(self.compressor.negotiate(accept('gzip')), 'gzip')
+        self.assertIsNone(self.compressor.negotiate(accept('gzip;q=0')))
+        self.assertIsNone(self.compressor.negotiate(accept('identity')))
+        self.assertIsNone(self.compressor.negotiate(accept('')))
+        if compression.brotli is not None:
+            self.assertEqual(
+                self.compressor.negotiate(accept('gzip, deflate, br')), 'br')
+            self.assertEqual(
+                self.compressor.negotiate(accept('br;q=0.5, gzip')), 'gzip')
+            self.assertEqual(self.compressor.negotiate(accept('*')), 'br')
+
+    def test_disabled_compressor_does_not_negotiate(self):
+        compressor = Compressor(enabled=False)
+        self.assertIsNone(compressor.negotiate(accept('gzip')))
+
+    def test_encode_response_by_min_size(self):
+        response = self.app.response_class(BODY,
+                                           mimetype='application/json')
+        self.assertTrue(self.compressor.compressible(response))
+        self.compressor.encode_response(response, 'gzip')
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.vary)
+        self.assertEqual(gzip.decompress(response.get_data()), BODY)
+        self.assertEqual(int(response.headers['Content-Length']),
+                         len(response.get_data()))
+        self.assertFalse(self.compressor.compressible(response))
+
+        response = self.app.response_class(b'{"success":true}',
+                                           mimetype='application/json')
+        self.compressor.encode_response(response, 'gzip')
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertIn('Accept-Encoding', response.vary)
+
+    def test_streamed_and_other_responses_are_not_compressible(self):
+        streamed = self.app.response_class(iter([BODY]),
+                                           mimetype='application/json')
+        csv = self.app.response_class(BODY, mimetype='text/csv')
+        error = self.app.response_class(BODY, status=422,
+                                        mimetype='application/json')
+        for response in (streamed, csv, error):
+            self.assertFalse(self.compressor.compressible(response))
+
+    @unittest.skipIf(compression.brotli is None, 'brotli is not installed')
+    def test_brotli(self):
+        compressed = self.compressor.compress(BODY, 'br')
+        self.assertEqual(compression.brotli.decompress(compressed), BODY)
+        self.assertLess(len(compressed), len(BODY))
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
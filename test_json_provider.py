@@ -0,0 +1,67 @@
+import datetime
+import json
+import unittest
+
+from flask import Flask
+
+import json_provider
+from json_provider import (
+    JSONProvider,
+    OrjsonProvider,
+    get_provider,
+    jsonify,
+    setup_json
+)
+
+VALUE = {
+    'name': 'café "quoted"\n\\ \x01\x7f ',
+    'release_date': datetime.date(2021, 1, 2),
+    'updated': datetime.datetime(2021, 1, 2, 3, 4, 5, 6),
+    'counts': [{'value': None, 'count': 3}, {'value': True, 'count': 1}],
+    'age': 22,
+}
+
+
+class JSONProviderTestCase(unittest.TestCase):
+    def test_output_is_compact_sorted_and_utf8(self):
+        body = JSONProvider().dumps(VALUE)
+        self.assertEqual(json.loads(body)['release_date'], '2021-01-02')
+        self.assertEqual(json.loads(body)['name'], VALUE['name'])
+        self.assertTrue(body.startswith(b'{"age":22,"counts":[{"count":3,'))
+        self.assertIn('café'.encode(), body)
+        self.assertNotIn(b': ', body)
+
+    @unittest.skipIf(json_provider.orjson is None, 'orjson is not installed')
+    def test_orjson_writes_the_same_bytes(self):
+        self.assertEqual(OrjsonProvider().dumps(VALUE),
+                         JSONProvider().dumps(VALUE))
+        self.assertEqual(OrjsonProvider().loads(b'{"a":[1]}'), {'a': [1]})
+
+    def test_orjson_falls_back_to_json(self):
+        orjson = json_provider.orjson
+        json_provider.orjson = None
+        try:
+            self.assertIs(type(get_provider('orjson')), JSONProvider)
+        finally:
+            json_provider.orjson = orjson
+        self.assertIs(type(get_provider('json')), JSONProvider)
+        with self.assertRaises(KeyError):
+            get_provider('xml')
+
+    def test_jsonify_is_compact_in_debug_mode(self):
+        app = Flask(__name__)
+        app.debug = True
+        setup_json(app)
+        with app.app_context():
+            response = jsonify(success=True, actors=[])
+            self.assertEqual(response.get_data(),
+                             b'{"actors":[],"success":true}\n')
+            self.assertEqual(response.mimetype, 'application/json')
+            self.assertEqual(jsonify(1, 2).get_data(), b'[1,2]\n')
+            with self.assertRaises(TypeError):
+                jsonify(1, success=True)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,230 @@
+import base64
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+from http.server import (
+    BaseHTTPRequestHandler,
+    HTTPServer
+)
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from jwks import (
+    JWKSError,
+    JWKSRefresher,
+    JWKSStore,
+    build_public_key,
+    parse_max_age
+)
+
+JWKS = {
+    'keys': [
+        {'kid': 'first', 'kty': 'RSA', 'use': 'sig', 'n': 'n1', 'e': 'AQAB'},
+        {'kid': 'second', 'kty': 'RSA', 'use': 'sig', 'n': 'n2', 'e': 'AQAB'}
+    ]
+}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class JWKSHandler(BaseHTTPRequestHandler):
+    jwks = JWKS
+    cache_control = 'public, max-age=120'
+    requests = 0
+
+    def do_GET(self):
+        JWKSHandler.requests += 1
+        body = json.dumps(JWKSHandler.jwks).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Cache-Control', JWKSHandler.cache_control)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class JWKSFileTestCase(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.json')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(JWKS, f)
+        self.clock = FakeClock()
+        self.store = JWKSStore(f'file://{self.path}', ttl=60,
+                               min_refetch_interval=10, max_stale=100,
+                               clock=self.clock)
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def test_parse_max_age(self):
+        self.assertEqual(parse_max_age('public, max-age=86400'), 86400)
+        self.assertEqual(parse_max_age('no-store'), 0)
+        self.assertIsNone(parse_max_age('public'))
+        self.assertIsNone(parse_max_age(None))
+
+    def test_keys_are_cached_until_ttl(self):
+        self.assertEqual(self.store.get_key('first')['n'], 'n1')
+        self.assertEqual(self.store.get_key('second')['n'], 'n2')
+        self.assertEqual(self.store.fetch_count, 1)
+
+        self.clock.now += 61
+        self.store.get_key('first')
+        self.assertEqual(self.store.fetch_count, 2)
+
+    def test_unknown_kid_refetch_is_rate_limited(self):
+        self.store.get_key('first')
+        self.assertIsNone(self.store.get_key('unknown'))
+        self.assertIsNone(self.store.get_key('unknown'))
+        self.assertEqual(self.store.fetch_count, 1)
+
+        self.clock.now += 11
+        self.assertIsNone(self.store.get_key('unknown'))
+        self.assertEqual(self.store.fetch_count, 2)
+
+    def test_unknown_kid_refetches_rotated_keys(self):
+        self.store.get_key('first')
+        rotated = {'keys': JWKS['keys'] + [
+            {'kid': 'third', 'kty': 'RSA', 'use': 'sig',
+             'n': 'n3', 'e': 'AQAB'}
+        ]}
+        with open(self.path, 'w') as f:
+            json.dump(rotated, f)
+
+        self.clock.now += 11
+        self.assertEqual(self.store.get_key('third')['n'], 'n3')
+        self.assertEqual(self.store.fetch_count, 2)
+
+    def test_stale_keys_are_served_while_refresh_fails(self):
+        self.store.get_key('first')
+        os.remove(self.path)
+
+        self.clock.now += 61
+        self.assertEqual(self.store.get_key('first')['n'], 'n1')
+        status = self.store.status()
+        self.assertTrue(status['stale'])
+        self.assertEqual(status['failure_count'], 1)
+
+        self.store.get_key('first')
+        self.assertEqual(self.store.failure_count, 1)
+
+        self.clock.now += 100
+        with self.assertRaises(JWKSError):
+            self.store.get_key('first')
+        self.assertFalse(self.store.status()['usable'])
+
+    def test_refresh_after_failure_recovers(self):
+        self.store.get_key('first')
+        os.remove(self.path)
+        self.clock.now += 61
+        self.store.get_key('first')
+
+        with open(self.path, 'w') as f:
+            json.dump(JWKS, f)
+        self.clock.now += 11
+        self.store.get_key('first')
+        status = self.store.status()
+        self.assertFalse(status['stale'])
+        self.assertIsNone(status['last_error'])
+        self.assertEqual(status['fetch_count'], 2)
+
+    def test_refresher_renews_before_expiry(self):
+        refresher = JWKSRefresher(self.store, refresh_margin=5,
+                                  retry_interval=3)
+        self.assertEqual(refresher.next_delay(), 3)
+
+        self.store.refresh()
+        self.assertEqual(refresher.next_delay(), 55)
+
+        os.remove(self.path)
+        self.clock.now += 56
+        self.store.refresh()
+        self.assertEqual(refresher.next_delay(), 3)
+
+    def test_refresher_waits_min_refetch_interval_for_short_max_age(self):
+        refresher = JWKSRefresher(self.store, refresh_margin=5)
+        for ttl in [0, 12]:
+            self.store.ttl = ttl
+            self.clock.now += 10
+            self.store.refresh()
+            self.assertEqual(refresher.next_delay(), 10)
+
+    def test_refresher_thread_fetches_keys(self):
+        refresher = JWKSRefresher(self.store)
+        refresher.start()
+        refresher.stop()
+        refresher.join(timeout=5)
+        self.assertFalse(refresher.is_alive())
+        self.assertEqual(self.store.fetch_count, 1)
+        self.assertIsNotNone(self.store.status()['last_success'])
+
+
+class PublicKeyTestCase(unittest.TestCase):
+    def test_build_public_key(self):
+        private_key = rsa.generate_private_key(65537, 2048, default_backend())
+        numbers = private_key.public_key().public_numbers()
+        n = numbers.n.to_bytes((numbers.n.bit_length() + 7) // 8, 'big')
+        jwk = {
+            'kid': 'real',
+            'kty': 'RSA',
+            'use': 'sig',
+            'n': base64.urlsafe_b64encode(n).rstrip(b'=').decode(),
+            'e': 'AQAB'
+        }
+        public_key = build_public_key(jwk)
+        self.assertEqual(public_key.public_numbers(), numbers)
+
+    def test_invalid_jwk_has_no_public_key(self):
+        self.assertIsNone(build_public_key({'kty': 'EC', 'kid': 'ec'}))
+        self.assertIsNone(build_public_key({'kty': 'RSA', 'kid': 'x'}))
+
+
+class JWKSServerTestCase(unittest.TestCase):
+    def setUp(self):
+        JWKSHandler.requests = 0
+        JWKSHandler.cache_control = 'public, max-age=120'
+        self.server = HTTPServer(('127.0.0.1', 0), JWKSHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        host, port = self.server.server_address
+        self.clock = FakeClock()
+        self.store = JWKSStore(f'http://{host}:{port}/.well-known/jwks.json',
+                               ttl=10, clock=self.clock)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_max_age_overrides_ttl(self):
+        self.store.get_key('first')
+        self.clock.now += 60
+        self.store.get_key('first')
+        self.assertEqual(JWKSHandler.requests, 1)
+
+        self.clock.now += 61
+        self.store.get_key('first')
+        self.assertEqual(JWKSHandler.requests, 2)
+
+    def test_no_cache_refetches_every_time(self):
+        JWKSHandler.cache_control = 'no-cache'
+        self.store.get_key('first')
+        self.store.get_key('second')
+        self.assertEqual(JWKSHandler.requests, 2)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
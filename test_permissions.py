@@ -0,0 +1,37 @@
+import unittest
+
+from permissions import (
+    PERMISSIONS,
+    ROLE_PERMISSIONS,
+    compile_permissions,
+    permission_bit,
+    permission_names
+)
+
+
+class PermissionsTestCase(unittest.TestCase):
+    def test_every_permission_has_its_own_bit(self):
+        bits = [permission_bit(permission) for permission in PERMISSIONS]
+        self.assertEqual(len(set(bits)), len(PERMISSIONS))
+        for bit in bits:
+            self.assertEqual(bin(bit).count('1'), 1)
+
+    def test_compile_permissions(self):
+        mask = compile_permissions(ROLE_PERMISSIONS['director'])
+        self.assertTrue(mask & permission_bit('post:actors'))
+        self.assertFalse(mask & permission_bit('post:movies'))
+        self.assertEqual(permission_names(mask),
+                         ROLE_PERMISSIONS['director'])
+
+    def test_unknown_permissions_are_ignored(self):
+        mask = compile_permissions(['get:actors', 'read:stats'])
+        self.assertEqual(mask, permission_bit('get:actors'))
+
+    def test_unknown_permission_bit(self):
+        with self.assertRaises(ValueError):
+            permission_bit('read:stats')
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+
+from werkzeug.datastructures import MultiDict
+
+from result_cache import (
+    ResultCache,
+    TableGenerations,
+    normalize_args
+)
+
+
+class ResultCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.generations = TableGenerations()
+        self.cache = ResultCache(max_size=2, max_bytes=10)
+
+    def test_hit_until_table_is_written(self):
+        generation = self.generations.get(['actors'])
+        self.cache.put('key', generation, b'body')
+        self.assertEqual(self.cache.get('key', generation), b'body')
+
+        self.generations.bump('movies')
+        self.assertEqual(
+            self.cache.get('key', self.generations.get(['actors'])), b'body')
+
+        self.generations.bump('actors')
+        self.assertIsNone(
+            self.cache.get('key', self.generations.get(['actors'])))
+
+        stats = self.cache.stats()
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['stale'], 1)
+        self.assertEqual(stats['size'], 0)
+        self.assertEqual(stats['bytes'], 0)
+
+    def test_bump_all_invalidates_every_table(self):
+        generation = self.generations.get(['roles'])
+        self.generations.bump_all()
+        self.assertNotEqual(self.generations.get(['roles']), generation)
+
+    def test_evicted_by_size_and_bytes(self):
+        self.cache.put('a', (0,), b'1234')
+        self.cache.put('b', (0,), b'1234')
+        self.cache.put('c', (0,), b'1234')
+        self.assertIsNone(self.cache.get('a', (0,)))
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+        self.cache.put('d', (0,), b'123456')
+        self.assertIsNone(self.cache.get('b', (0,)))
+        self.assertEqual(self.cache.stats()['bytes'], 10)
+        self.assertEqual(self.cache.stats()['evictions'], 2)
+
+    def test_encoded_bodies_are_kept_with_their_entry(self):
+        self.cache.put('a', (0,), b'1234')
+        self.cache.put_encoded('a', (0,), 'gzip', b'12')
+        self.cache.put_encoded('a', (1,), 'br', b'1')
+        self.cache.put_encoded('b', (0,), 'br', b'1')
+        self.assertEqual(self.cache.get_encoded('a', (0,), 'gzip'), b'12')
+        self.assertIsNone(self.cache.get_encoded('a', (0,), 'br'))
+        self.assertIsNone(self.cache.get_encoded('a', (1,), 'gzip'))
+        self.assertEqual(self.cache.stats()['bytes'], 6)
+        self.assertEqual(self.cache.stats()['hits'], 0)
+
+        self.assertIsNone(self.cache.get('a', (1,)))
+        self.assertIsNone(self.cache.get_encoded('a', (0,), 'gzip'))
+        self.assertEqual(self.cache.stats()['bytes'], 0)
+
+    def test_validators_are_kept_with_their_entry(self):
+        self.cache.put('a', (0,), b'1234')
+        self.assertIsNone(self.cache.get_validators('a', (0,)))
+        self.cache.put_validators('a', (1,), ('old', None))
+        self.cache.put_validators('b', (0,), ('b', None))
+        self.cache.put_validators('a', (0,), ('tag', None))
+        self.assertEqual(self.cache.get_validators('a', (0,)), ('tag', None))
+        self.assertIsNone(self.cache.get_validators('a', (1,)))
+        self.assertIsNone(self.cache.get_validators('b', (0,)))
+        self.assertEqual(self.cache.get('a', (0,)), b'1234')
+
+    def test_body_larger_than_max_bytes_is_not_cached(self):
+        self.cache.put('a', (0,), b'12345678901')
+        self.assertEqual(self.cache.stats()['size'], 0)
+
+    def test_args_are_normalized(self):
+        first = MultiDict([('gender', 'male'), ('min_age', '20')])
+        second = MultiDict([('min_age', '20'), ('gender', 'male')])
+        self.assertEqual(normalize_args(first), normalize_args(second))
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+
+from statement_cache import StatementCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 10.0
+
+    def __call__(self):
+        return self.now
+
+
+def step(query):
+    return query
+
+
+QUERY_KEY = (step.__code__, 'age', 'gte')
+STATEMENT_KEY = ('dialect', 'statement')
+
+
+class StatementCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = StatementCache(max_size=2, clock=self.clock)
+
+    def test_compile_time_is_counted_from_miss_to_store(self):
+        self.assertIsNone(self.cache.get(QUERY_KEY))
+        self.clock.now += 0.004
+        self.cache[QUERY_KEY] = 'context'
+        self.assertEqual(self.cache.get(QUERY_KEY), 'context')
+
+        stats = self.cache.stats()['queries']
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hit_rate'], 0.5)
+        self.assertEqual(stats['compiles'], 1)
+        self.assertAlmostEqual(stats['compile_ms'], 4)
+
+    def test_queries_and_statements_are_counted_apart(self):
+        self.cache.get(STATEMENT_KEY)
+        self.cache[STATEMENT_KEY] = 'compiled'
+
+        stats = self.cache.stats()
+        self.assertEqual(stats['statements']['misses'], 1)
+        self.assertEqual(stats['statements']['compiles'], 1)
+        self.assertEqual(stats['queries']['misses'], 0)
+        self.assertIsNone(stats['queries']['hit_rate'])
+
+    def test_least_recently_used_is_evicted(self):
+        self.cache['a'] = 1
+        self.cache['b'] = 2
+        self.cache.get('a')
+        self.cache['c'] = 3
+
+        self.assertIn('a', self.cache)
+        self.assertNotIn('b', self.cache)
+        self.assertIn('c', self.cache)
+        self.assertEqual(len(self.cache), 2)
+
+    def test_clear_resets_counters(self):
+        self.cache.get(QUERY_KEY)
+        self.cache[QUERY_KEY] = 'context'
+        self.cache.clear()
+
+        stats = self.cache.stats()
+        self.assertEqual(stats['size'], 0)
+        self.assertEqual(stats['queries']['compiles'], 0)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
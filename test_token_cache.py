@@ -0,0 +1,59 @@
+import unittest
+
+from token_cache import TokenCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TokenCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = TokenCache(max_size=2, clock=self.clock)
+
+    def test_hit_and_miss_counters(self):
+        payload = {'sub': 'a', 'exp': 2000, 'permissions': []}
+        self.assertIsNone(self.cache.get('token-a'))
+        self.cache.put('token-a', payload, 0b101)
+        self.assertEqual(self.cache.get('token-a'), (payload, 0b101))
+
+        stats = self.cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['size'], 1)
+
+    def test_entry_expires_at_exp(self):
+        self.cache.put('token-a', {'exp': 1010})
+        self.clock.now = 1010
+        self.assertIsNone(self.cache.get('token-a'))
+        self.assertEqual(self.cache.stats()['size'], 0)
+
+    def test_payload_without_exp_is_not_cached(self):
+        self.cache.put('token-a', {'sub': 'a'})
+        self.assertIsNone(self.cache.get('token-a'))
+
+    def test_least_recently_used_is_evicted(self):
+        self.cache.put('token-a', {'exp': 2000})
+        self.cache.put('token-b', {'exp': 2000})
+        self.cache.get('token-a')
+        self.cache.put('token-c', {'exp': 2000})
+
+        self.assertIsNotNone(self.cache.get('token-a'))
+        self.assertIsNone(self.cache.get('token-b'))
+        self.assertIsNotNone(self.cache.get('token-c'))
+
+    def test_disabled_cache(self):
+        cache = TokenCache(max_size=2, enabled=False, clock=self.clock)
+        cache.put('token-a', {'exp': 2000})
+        self.assertIsNone(cache.get('token-a'))
+        self.assertEqual(cache.stats()['misses'], 0)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
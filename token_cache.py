@@ -0,0 +1,91 @@
+import hashlib
+import threading
+import time
+
+from collections import OrderedDict
+
+DEFAULT_MAX_SIZE = 1024
+
+
+def hash_token(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class TokenCache:
+    '''The class is a bounded LRU of verified JWT payloads and their
+    compiled permission masks. Entries are keyed by a hash of the raw
+    token, so the token itself is never kept, and expire at the
+    token's exp claim.
+
+    Attribute:
+        max_size: maximum number of payloads kept
+        enabled: if False, get always misses and put does nothing
+        clock: function returning epoch seconds
+        hits: number of cache hits
+        misses: number of cache misses
+
+    Method:
+        get: returns the cached (payload, permission_mask) for token
+             or None
+        put: stores payload and permission_mask for token
+             until payload['exp']
+        clear: drops every entry
+        stats: returns a dictionary of counters
+    '''
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, enabled=True,
+                 clock=time.time):
+        self.max_size = max_size
+        self.enabled = enabled and max_size > 0
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, token):
+        if not self.enabled:
+            return None
+        key = hash_token(token)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, payload, permission_mask = entry
+            if self.clock() >= expires_at:
+                del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return payload, permission_mask
+
+    def put(self, token, payload, permission_mask=0):
+        if not self.enabled:
+            return
+        expires_at = payload.get('exp')
+        if not isinstance(expires_at, (int, float)):
+            return
+        if self.clock() >= expires_at:
+            return
+        key = hash_token(token)
+        with self.lock:
+            self.entries[key] = (expires_at, payload, permission_mask)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'size': len(self.entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+        }